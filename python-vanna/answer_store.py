@@ -0,0 +1,464 @@
+import json
+import os
+import re
+import select
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from question_cache import normalize_question
+from result_cache import ALL_TABLES
+from execution_budget import split_within_budget
+from result_formats import build_result
+from sql_utils import extract_tables, is_read_only
+
+_CHANNEL_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_RESULT_EXTRAS = ('truncated', 'truncation_reason', 'limits')
+_TRIM_BATCH_SIZE = 1000
+
+
+class MaterializedAnswer:
+    """Pregunta fijada o promovida con su SQL y el último resultado precalculado"""
+
+    def __init__(self, question, database, sql, pinned, refresh_interval, generated=True):
+        self.question = question
+        self.database = database
+        self.sql = sql
+        self.tables = extract_tables(sql) or {ALL_TABLES}
+        self.pinned = pinned
+        self.refresh_interval = refresh_interval
+        # SQL generado por el LLM (no escrito a mano): depende de los datos de entrenamiento
+        self.generated = generated
+        # Fijada con SQL generado antes de un cambio de entrenamiento: no se sirve hasta regenerarlo
+        self.outdated = False
+        self.created_at = time.time()
+        # (resultado en formato 'rows', {formato: resultado}) se sustituye de una vez en cada refresco
+        self.snapshot = None
+        self.refreshed_at = None
+        self.refresh_seconds = None
+        self.refreshes = 0
+        self.hits = 0
+        self.last_hit = None
+        self.stale = True
+        self.refreshing = False
+        self.error = None
+        self.failed_at = None
+
+    @property
+    def result(self):
+        return self.snapshot[0] if self.snapshot else None
+
+    def formatted_result(self, fmt, budget=None):
+        """Resultado en el formato pedido y recortado al presupuesto del endpoint, construido una vez por refresco"""
+        limits = (budget['max_rows'], budget['max_response_bytes']) if budget else (0, 0)
+        source, formatted = self.snapshot
+        result = formatted.get((fmt, limits))
+        if result is None:
+            rows, truncation = source['data'], None
+            if any(limits):
+                batches, truncation = split_within_budget(rows, budget, _TRIM_BATCH_SIZE)
+                if truncation:
+                    rows = [row for batch in batches for row in batch]
+            result = build_result(source['columns'], [rows], fmt)
+            for key in _RESULT_EXTRAS:
+                if key in source:
+                    result[key] = source[key]
+            if truncation:
+                result['truncated'] = True
+                result['truncation_reason'] = truncation
+                result['limits'] = {'max_rows': limits[0], 'max_response_bytes': limits[1]}
+            formatted[(fmt, limits)] = result
+        return result
+
+    def to_dict(self):
+        return {
+            'question': self.question,
+            'database': self.database,
+            'sql': self.sql,
+            'pinned': self.pinned,
+            'generated': self.generated,
+            'outdated': self.outdated,
+            'refresh_interval': self.refresh_interval,
+            'refreshed_at': self.refreshed_at,
+            'refresh_ms': round(self.refresh_seconds * 1000, 3) if self.refresh_seconds is not None else None,
+            'refreshes': self.refreshes,
+            'row_count': self.result['row_count'] if self.result else None,
+            'hits': self.hits,
+            'last_hit': self.last_hit,
+            'stale': self.stale,
+            'error': self.error
+        }
+
+
+class AnswerStore:
+    """Respuestas materializadas: las preguntas frecuentes se sirven desde un resultado precalculado
+
+    Una pregunta entra al almacén fijándola (pin) o, si se repite `promote_threshold` veces en
+    `promote_window` segundos, por promoción automática. El resultado se refresca en segundo plano
+    cada `refresh_interval` segundos y también en cuanto se invalida: por una escritura que pasa por
+    el servidor o por un NOTIFY de PostgreSQL en el canal configurado. Mientras se refresca se sigue
+    sirviendo el resultado anterior marcado como `stale`; pasado `max_staleness` ya no se sirve.
+
+    `execute(sql, database, question)` ejecuta el SQL sin pasar por la caché de resultados y retorna
+    el resultado en formato 'rows'; cada endpoint lo recorta después a su presupuesto en lookup.
+    """
+
+    def __init__(self, execute, refresh_interval=300.0, max_staleness=3600.0, promote_threshold=10,
+                 promote_window=600.0, idle_timeout=3600.0, max_entries=100, refresh_workers=2,
+                 pins_path=None, enabled=True):
+        self.execute = execute
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.promote_threshold = promote_threshold
+        self.promote_window = promote_window
+        self.idle_timeout = idle_timeout
+        self.max_entries = max_entries
+        self.pins_path = pins_path
+        self.enabled = enabled
+        self._entries = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='answer-refresh')
+        self._threads = []
+        self.metrics = {'hits': 0, 'misses': 0, 'promotions': 0, 'demotions': 0, 'refreshes': 0,
+                        'refresh_failures': 0, 'invalidations': 0, 'notifications': 0}
+        if enabled and pins_path:
+            self._load_pins()
+
+    @staticmethod
+    def _key(question, database):
+        return database, normalize_question(question)
+
+    def lookup(self, question, database, fmt='records', budget=None):
+        """(sql, resultado, extra) de una pregunta materializada o None si hay que responderla normalmente"""
+        if not self.enabled or not question:
+            return None
+        entry = self._entries.get(self._key(question, database))
+        if entry is None or entry.result is None or entry.outdated:
+            self._count('misses')
+            return None
+        now = time.time()
+        age = now - entry.refreshed_at
+        if self.max_staleness and age > self.max_staleness:
+            self._count('misses')
+            return None
+        entry.hits += 1
+        entry.last_hit = now
+        self._count('hits')
+        return entry.sql, entry.formatted_result(fmt, budget), {'materialized': {
+            'pinned': entry.pinned,
+            'refreshed_at': entry.refreshed_at,
+            'age_seconds': round(age, 3),
+            'stale': entry.stale or age > entry.refresh_interval
+        }}
+
+    def observe(self, question, database, sql):
+        """Cuenta una pregunta respondida por la ruta normal y la promueve si es frecuente
+
+        Si la pregunta está fijada pero su SQL quedó desactualizado, adopta el SQL recién generado.
+        """
+        if not self.enabled or not question or not sql or not is_read_only(sql):
+            return
+        key = self._key(question, database)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.outdated:
+                self._regenerated(entry, sql)
+            return
+        if not self.promote_threshold:
+            return
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                return
+            times = self._recent.get(key)
+            if times is None:
+                times = self._recent[key] = deque()
+            times.append(now)
+            while times and now - times[0] > self.promote_window:
+                times.popleft()
+            if len(times) < self.promote_threshold:
+                if len(self._recent) > 10 * self.max_entries:
+                    self._prune_recent(now)
+                return
+            del self._recent[key]
+            entry = self._entries[key] = MaterializedAnswer(question, database, sql, False, self.refresh_interval)
+            self.metrics['promotions'] += 1
+            self._enforce_limit()
+        self._schedule(entry)
+
+    def pin(self, question, database, sql, refresh_interval=None, generated=False):
+        """Fija una pregunta y calcula su resultado ahora mismo
+
+        `generated` indica que el SQL salió del LLM: se invalida cuando cambian los datos de entrenamiento.
+        """
+        if not is_read_only(sql):
+            raise ValueError('Only read-only SQL can be materialized')
+        key = self._key(question, database)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.sql != sql:
+                entry = self._entries[key] = MaterializedAnswer(
+                    question, database, sql, True, refresh_interval or self.refresh_interval, generated
+                )
+            else:
+                entry.pinned = True
+                entry.generated = generated
+                entry.outdated = False
+                entry.refresh_interval = refresh_interval or entry.refresh_interval
+            self._recent.pop(key, None)
+            self._enforce_limit()
+        self._save_pins()
+        self.refresh(entry)
+        return entry
+
+    def unpin(self, question, database):
+        with self._lock:
+            entry = self._entries.pop(self._key(question, database), None)
+        if entry is not None and entry.pinned:
+            self._save_pins()
+        return entry is not None
+
+    def refresh(self, entry):
+        """Vuelve a ejecutar el SQL; si falla se conserva el resultado anterior marcado como obsoleto"""
+        with self._lock:
+            if entry.refreshing:
+                return False
+            entry.refreshing = True
+        started = time.perf_counter()
+        try:
+            result = self.execute(entry.sql, entry.database, entry.question)
+        except Exception as e:
+            entry.error = str(e)
+            entry.failed_at = time.time()
+            entry.stale = True
+            self._count('refresh_failures')
+            return False
+        finally:
+            entry.refreshing = False
+        entry.refresh_seconds = time.perf_counter() - started
+        entry.snapshot = (result, {})
+        entry.refreshed_at = time.time()
+        entry.refreshes += 1
+        entry.stale = False
+        entry.error = None
+        self._count('refreshes')
+        return True
+
+    def refresh_all(self, database=None):
+        entries = [entry for entry in list(self._entries.values()) if database is None or entry.database == database]
+        return sum(1 for entry in entries if self.refresh(entry))
+
+    def get(self, question, database):
+        return self._entries.get(self._key(question, database))
+
+    def invalidate_tables(self, tables, database=None):
+        """Marca obsoletas (y refresca) las respuestas que leen alguna de las tablas"""
+        tables = set(tables or ())
+        affected = []
+        for entry in list(self._entries.values()):
+            if database is not None and entry.database != database:
+                continue
+            if not tables or ALL_TABLES in tables or ALL_TABLES in entry.tables or entry.tables & tables:
+                entry.stale = True
+                affected.append(entry)
+        if affected:
+            self._count('invalidations', len(affected))
+            for entry in affected:
+                self._schedule(entry)
+        return len(affected)
+
+    def invalidate_generated(self, database=None):
+        """Los datos de entrenamiento cambiaron: deja de servir el SQL que generó el LLM con los anteriores
+
+        Las promovidas se retiran y volverán a promoverse con el SQL nuevo; las fijadas se conservan
+        marcadas como desactualizadas hasta que la ruta normal genere su SQL otra vez (observe).
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            affected = 0
+            for key, entry in list(self._entries.items()):
+                if not entry.generated or (database is not None and entry.database != database):
+                    continue
+                affected += 1
+                if entry.pinned:
+                    entry.outdated = True
+                else:
+                    del self._entries[key]
+                    self.metrics['demotions'] += 1
+            self.metrics['invalidations'] += affected
+        return affected
+
+    def _regenerated(self, entry, sql):
+        with self._lock:
+            if not entry.outdated:
+                return
+            entry.sql = sql
+            entry.tables = extract_tables(sql) or {ALL_TABLES}
+            entry.outdated = False
+            entry.stale = True
+        self._save_pins()
+        self._schedule(entry)
+
+    def invalidate_for(self, sql, database):
+        """Invalidación por una escritura ejecutada a través del servidor"""
+        if not self.enabled or not self._entries or is_read_only(sql):
+            return 0
+        return self.invalidate_tables(extract_tables(sql), database)
+
+    def _schedule(self, entry):
+        if not entry.refreshing and not self._stop.is_set():
+            self._executor.submit(self.refresh, entry)
+
+    def _enforce_limit(self):
+        # Las fijadas no se expulsan; entre las promovidas sale la menos usada
+        promoted = [(entry.hits, entry.created_at, key) for key, entry in self._entries.items() if not entry.pinned]
+        promoted.sort()
+        while len(self._entries) > self.max_entries and promoted:
+            del self._entries[promoted.pop(0)[2]]
+            self.metrics['demotions'] += 1
+
+    def _prune_recent(self, now):
+        for key in [key for key, times in self._recent.items() if not times or now - times[-1] > self.promote_window]:
+            del self._recent[key]
+
+    def _tick(self):
+        now = time.time()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                idle_since = entry.last_hit or entry.created_at
+                if not entry.pinned and self.idle_timeout and now - idle_since > self.idle_timeout:
+                    del self._entries[key]
+                    self.metrics['demotions'] += 1
+            due = [entry for entry in self._entries.values() if self._due(entry, now)]
+        for entry in due:
+            self._schedule(entry)
+
+    @staticmethod
+    def _due(entry, now):
+        if entry.refreshing or entry.outdated:
+            return False
+        if entry.failed_at and entry.error and now - entry.failed_at < min(entry.refresh_interval, 30.0):
+            # Tras un fallo se espera antes de reintentar para no martillear la base de datos
+            return False
+        return entry.refreshed_at is None or entry.stale or now - entry.refreshed_at >= entry.refresh_interval
+
+    def start(self, tick=1.0):
+        """Hilo que refresca las respuestas vencidas y retira las promovidas que ya no se usan"""
+        if not self.enabled or self._threads:
+            return self
+
+        def run():
+            while not self._stop.wait(tick):
+                self._tick()
+        thread = threading.Thread(target=run, name='answer-scheduler', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def listen(self, connect, channel, database, reconnect_delay=5.0):
+        """Escucha NOTIFY en `channel`: la carga son tablas separadas por comas (vacía = todas)
+
+        Ejemplo de disparador:
+            CREATE FUNCTION vanna_notify() RETURNS trigger AS $$
+            BEGIN PERFORM pg_notify('vanna_invalidate', TG_TABLE_NAME); RETURN NULL; END $$ LANGUAGE plpgsql;
+            CREATE TRIGGER productos_notify AFTER INSERT OR UPDATE OR DELETE ON productos
+                FOR EACH STATEMENT EXECUTE FUNCTION vanna_notify();
+        """
+        if not self.enabled or not channel:
+            return self
+        if not _CHANNEL_RE.match(channel):
+            raise ValueError(f'Invalid NOTIFY channel name: {channel}')
+
+        def run():
+            while not self._stop.is_set():
+                conn = None
+                try:
+                    conn = connect()
+                    conn.autocommit = True
+                    with conn.cursor() as cursor:
+                        cursor.execute(f'LISTEN {channel}')
+                    # Lo ocurrido mientras no se escuchaba se desconoce: todo pasa a refrescarse
+                    self.invalidate_tables(None, database)
+                    while not self._stop.is_set():
+                        if select.select([conn], [], [], reconnect_delay) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            self._count('notifications')
+                            tables = {name.strip() for name in notify.payload.split(',') if name.strip()}
+                            self.invalidate_tables(tables, database)
+                except Exception:
+                    self._stop.wait(reconnect_delay)
+                finally:
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+        thread = threading.Thread(target=run, name='answer-listener', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def entries(self, database=None):
+        return [entry.to_dict() for entry in list(self._entries.values())
+                if database is None or entry.database == database]
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.metrics[key] += amount
+
+    def stats(self):
+        with self._lock:
+            pinned = sum(1 for entry in self._entries.values() if entry.pinned)
+            return dict(
+                self.metrics,
+                enabled=self.enabled,
+                entries=len(self._entries),
+                pinned=pinned,
+                promoted=len(self._entries) - pinned,
+                candidates=len(self._recent),
+                max_entries=self.max_entries,
+                refresh_interval=self.refresh_interval,
+                max_staleness=self.max_staleness,
+                promote_threshold=self.promote_threshold,
+                promote_window=self.promote_window
+            )
+
+    def _save_pins(self):
+        if not self.pins_path:
+            return
+        with self._lock:
+            pins = [{'question': entry.question, 'database': entry.database, 'sql': entry.sql,
+                     'refresh_interval': entry.refresh_interval, 'generated': entry.generated,
+                     'outdated': entry.outdated}
+                    for entry in self._entries.values() if entry.pinned]
+        tmp_path = f'{self.pins_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(pins, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.pins_path)
+
+    def _load_pins(self):
+        """Las preguntas fijadas sobreviven a un reinicio; su resultado se recalcula en el primer ciclo"""
+        if not os.path.exists(self.pins_path):
+            return
+        try:
+            with open(self.pins_path, encoding='utf-8') as f:
+                pins = json.load(f)
+        except (OSError, ValueError):
+            return
+        for pin in pins:
+            entry = MaterializedAnswer(pin['question'], pin['database'], pin['sql'], True,
+                                       pin.get('refresh_interval') or self.refresh_interval,
+                                       pin.get('generated', False))
+            entry.outdated = pin.get('outdated', False)
+            self._entries[self._key(entry.question, entry.database)] = entry
@@ -0,0 +1,541 @@
+"""Modo de servicio ASGI para el servidor Vanna
+
+Sirve las mismas rutas /api/v0/* que vanna_server.py. generate_sql, run_sql, chat, ask y
+health son asíncronas (asyncpg + llamadas al LLM en un executor dedicado), de modo que un
+solo proceso puede mantener cientos de peticiones /chat en curso. El resto de rutas, y las
+peticiones con stream/format=arrow, se delegan a la aplicación Flask existente.
+
+Lanzador de producción (varios workers):
+
+    python asgi_server.py                       # uvicorn con ASGI_WORKERS procesos
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8080 asgi_server:app
+
+Variables de entorno: ASGI_HOST, ASGI_PORT, ASGI_WORKERS, además de LLM_CONCURRENCY,
+DB_* y DB_POOL_* compartidas con vanna_server.py. Con QUERY_GUARD_ENABLED y varios workers hace
+falta QUERY_CURSOR_SECRET (con gunicorn, indicar también WEB_CONCURRENCY o ASGI_WORKERS).
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import asyncpg
+from flask import g
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import metrics
+import vanna_server
+from execution_budget import fetch_within_budget_async, split_within_budget
+from json_fast import convert_rows
+from llm_backends import LLMUnavailable
+from metrics import record_sql, span
+from result_formats import RESULT_FORMATS, build_result
+from sql_utils import is_multi_statement
+
+# Las llamadas al LLM (cliente síncrono de Vanna) se ejecutan en un executor dedicado, del mismo
+# tamaño que los workers de LLMClient: más hilos solo esperarían a que quede uno libre
+LLM_CONCURRENCY = vanna_server.LLM_CONCURRENCY
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix='llm')
+# Cada cuánto se comprueba si el cliente sigue conectado mientras corre una consulta
+DISCONNECT_POLL_INTERVAL = 0.5
+
+db_pool = None
+health_cache = None
+health_lock = asyncio.Lock()
+flask_fallback = WSGIMiddleware(vanna_server.app)
+
+
+def json_response(payload, status_code=200):
+    """Respuesta JSON con el mismo codificador que la aplicación Flask"""
+    with span('json_encode'):
+        body = vanna_server.app.json.dumps(payload)
+    return Response(body, status_code=status_code, media_type='application/json')
+
+
+def instrumented(handler):
+    """Duración, contadores, Server-Timing y log de lentas de una ruta nativa, como en Flask
+
+    Las peticiones delegadas a Flask se registran allí (record_request_metrics).
+    """
+    endpoint = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(request: Request):
+        state = {'endpoint': endpoint, 'phase_timings': {}, 'request_sql': []}
+        token = metrics.asgi_request.set(state)
+        started = time.perf_counter()
+        try:
+            response = await handler(request)
+        finally:
+            metrics.asgi_request.reset(token)
+        if isinstance(response, _Delegated):
+            return response
+        elapsed = time.perf_counter() - started
+        status = str(response.status_code)
+        metrics.request_duration.observe(elapsed, endpoint, request.method, status)
+        metrics.requests_total.inc(endpoint, request.method, status)
+        timings = state['phase_timings']
+        if vanna_server.SERVER_TIMING_ENABLED:
+            response.headers['server-timing'] = metrics.server_timing_header(timings, elapsed)
+        if elapsed * 1000 >= vanna_server.SLOW_REQUEST_MS:
+            metrics.slow_requests_total.inc(endpoint)
+            vanna_server.app.logger.warning(
+                'Slow request %s %s: %.1f ms phases=%s sql=%s',
+                request.method, request.url.path, elapsed * 1000,
+                {phase: round(value * 1000, 1) for phase, value in timings.items()},
+                state['request_sql']
+            )
+        return response
+
+    return wrapper
+
+
+async def generate_sql_async(question: str):
+    """Genera SQL (con caché) sin bloquear el event loop"""
+    loop = asyncio.get_running_loop()
+    # Con el contexto de la petición, para que la fase generate_sql cuente en sus métricas
+    call = functools.partial(contextvars.copy_context().run, vanna_server.generate_sql_cached, question)
+    return await loop.run_in_executor(llm_executor, call)
+
+
+async def execute_sql_async(sql: str, fmt: str = 'records', budget=None, question=None, executed=None,
+                            request: Request = None):
+    """Ejecuta SQL con asyncpg y retorna los resultados en el formato pedido
+
+    Si se pasa `executed`, se le añade (clave, filas) de las estadísticas por huella para
+    atribuirle después los bytes de la respuesta. Con `request`, la consulta se cancela si el
+    cliente se desconecta.
+    """
+    budget = budget or vanna_server.EXECUTION_BUDGETS['default']
+    result_cache = vanna_server.result_cache
+    query_stats = vanna_server.query_stats
+    database = vanna_server.db_registry.default_database
+    namespace = f"{database}:{fmt}:{budget['max_rows']}:{budget['max_response_bytes']}"
+    cached = result_cache.lookup(sql, namespace=namespace)
+    if cached is not None:
+        query_stats.record_cache_hit(sql, database)
+        return cached
+
+    if is_multi_statement(sql):
+        # asyncpg solo prepara sentencias sueltas: varias sentencias se ejecutan con el camino de Flask
+        return await execute_sql_flask(sql, fmt, budget, question, database)
+
+    record_sql(sql)
+    query = run_query(sql, budget, database, question)
+    if request is not None:
+        query = cancel_on_disconnect(request, query)
+    columns, converters, batches, truncation, elapsed = await query
+
+    with span('serialize'):
+        if converters:
+            batches = [convert_rows([tuple(record) for record in batch], converters) for batch in batches]
+        else:
+            batches = [[tuple(record) for record in batch] for batch in batches]
+        result = build_result(columns, batches, fmt)
+    result['truncated'] = truncation is not None
+    if truncation:
+        result['truncation_reason'] = truncation
+        result['limits'] = {'max_rows': budget['max_rows'], 'max_response_bytes': budget['max_response_bytes']}
+    key = query_stats.record(sql, database, elapsed, result['row_count'], question)
+    if executed is not None:
+        executed.append((key, result['row_count']))
+    vanna_server.invalidate_after_write(sql, database)
+    result_cache.store(sql, result, namespace=namespace)
+    return result
+
+
+async def execute_sql_flask(sql, fmt, budget, question, database):
+    """Ejecuta SQL con execute_sql de Flask (psycopg2) en un hilo, con el contexto de la petición"""
+    def run():
+        with vanna_server.app.app_context():
+            g.database = database
+            return vanna_server.execute_sql(sql, fmt, budget, question)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, run))
+
+
+async def run_query(sql, budget, database, question=None):
+    """(columnas, conversores, lotes, motivo de truncado, segundos) dentro del presupuesto de filas y bytes"""
+    query_stats = vanna_server.query_stats
+    limited = budget['max_rows'] or budget['max_response_bytes']
+    with span('pool_checkout'):
+        conn = await db_pool.acquire()
+    try:
+        async with conn.transaction():
+            if budget['statement_timeout_ms']:
+                await conn.execute(f"SET LOCAL statement_timeout = {int(budget['statement_timeout_ms'])}")
+            started = time.perf_counter()
+            try:
+                with span('execute'):
+                    statement = await conn.prepare(sql)
+                    attributes = statement.get_attributes()
+                    columns = [attribute.name for attribute in attributes]
+                    converters = vanna_server.result_converters([(a.name, a.type.oid) for a in attributes])
+                with span('fetch'):
+                    if limited and vanna_server.supports_server_cursor(sql):
+                        # Cursor de servidor: se deja de leer al llegar a max_rows + 1 filas o a max_response_bytes
+                        cursor = await statement.cursor()
+                        batches, truncation = await fetch_within_budget_async(
+                            cursor, budget, vanna_server.STREAM_BATCH_SIZE
+                        )
+                    else:
+                        batches, truncation = split_within_budget(
+                            await statement.fetch(), budget, vanna_server.STREAM_BATCH_SIZE
+                        )
+            except BaseException:
+                query_stats.record(sql, database, time.perf_counter() - started, 0, question, error=True)
+                raise
+            return columns, converters, batches, truncation, time.perf_counter() - started
+    finally:
+        await db_pool.release(conn)
+
+
+async def cancel_on_disconnect(request: Request, query):
+    """Espera a `query` y la cancela si el cliente se desconecta antes (asyncpg cancela la consulta en el servidor)"""
+    task = asyncio.ensure_future(query)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            raise vanna_server.QueryCancelled('Query cancelled: client disconnected')
+
+
+def with_response_bytes(response, executed):
+    """Atribuye el tamaño de la respuesta a las consultas que la produjeron (estadísticas por huella)"""
+    vanna_server.query_stats.add_response_bytes(executed, len(response.body))
+    return response
+
+
+def compressed(request: Request, response):
+    """Comprime la respuesta según Accept-Encoding, igual que el middleware de la aplicación Flask"""
+    compressor = vanna_server.response_compressor
+    if not compressor.enabled:
+        return response
+    body, encoding = compressor.compress(response.body, request.headers.get('accept-encoding'), response.media_type)
+    response.headers['vary'] = 'Accept-Encoding'
+    if encoding is not None:
+        response.body = body
+        response.headers['content-encoding'] = encoding
+        response.headers['content-length'] = str(len(body))
+    return response
+
+
+async def read_json(request: Request):
+    body = await request.body()
+    if not body:
+        return {}, body
+    return vanna_server.app.json.loads(body), body
+
+
+def needs_flask(data, request: Request):
+    """Streaming, Arrow, otras bases de datos, réplicas y paginación se sirven desde Flask"""
+    fmt = data.get('format') or request.query_params.get('format')
+    if data.get('stream') or request.query_params.get('stream') or fmt == 'arrow':
+        return True
+    # El pool asyncpg solo conoce el primario de la base por defecto
+    database = data.get('database') or request.query_params.get('database') or request.headers.get('x-database')
+    if database and database != vanna_server.db_registry.default_database:
+        return True
+    if vanna_server.db_registry.replicas:
+        return True
+    return bool(data.get('cursor') or vanna_server.query_guard.enabled)
+
+
+def _replay(body: bytes):
+    """Canal receive ASGI que entrega de nuevo un cuerpo ya leído"""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return {'type': 'http.disconnect'}
+
+    return receive
+
+
+class _Delegated:
+    """Respuesta ASGI que ejecuta la aplicación Flask con el cuerpo original"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+
+    async def __call__(self, scope, receive, send):
+        await flask_fallback(self.scope, self.receive, send)
+
+
+@instrumented
+async def generate_sql(request: Request):
+    """Genera SQL basado en una pregunta natural"""
+    try:
+        question = request.query_params.get('question')
+        if not question:
+            return json_response({'error': 'Question parameter is required'}, 400)
+
+        sql = await generate_sql_async(question)
+        return json_response({'sql': sql})
+    except LLMUnavailable as e:
+        return json_response({'error': str(e)}, 503)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@instrumented
+async def run_sql(request: Request):
+    """Ejecuta SQL y retorna los resultados"""
+    try:
+        data, body = await read_json(request)
+        if needs_flask(data, request):
+            return _Delegated(request.scope, _replay(body))
+        sql = data.get('sql')
+
+        if not sql:
+            return json_response({'error': 'SQL query is required'}, 400)
+
+        result_format = data.get('format') or request.query_params.get('format') or 'records'
+        if result_format not in RESULT_FORMATS:
+            return json_response({'error': f'Unsupported result format: {result_format}'}, 400)
+
+        executed = []
+        results = await execute_sql_async(
+            sql, result_format, vanna_server.EXECUTION_BUDGETS['run_sql'], executed=executed, request=request
+        )
+        return compressed(request, with_response_bytes(json_response(results), executed))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@instrumented
+async def chat(request: Request):
+    """Endpoint para chat completo: genera SQL y ejecuta"""
+    question = None
+    try:
+        data, body = await read_json(request)
+        if needs_flask(data, request):
+            return _Delegated(request.scope, _replay(body))
+        question = data.get('question')
+
+        if not question:
+            return json_response({'error': 'Question is required'}, 400)
+
+        result_format = data.get('format') or request.query_params.get('format') or 'records'
+        if result_format not in RESULT_FORMATS:
+            return json_response({'error': f'Unsupported result format: {result_format}'}, 400)
+
+        answer = vanna_server.materialized_answer(question, result_format, vanna_server.EXECUTION_BUDGETS['chat'])
+        if answer:
+            # Pregunta materializada: resultado precalculado, sin LLM ni base de datos
+            sql, results, extra = answer
+            return compressed(request, json_response({'question': question, 'sql': sql, 'results': results, **extra}))
+
+        sql = await generate_sql_async(question)
+        executed = []
+        results = await execute_sql_async(
+            sql, result_format, vanna_server.EXECUTION_BUDGETS['chat'], question, executed, request
+        )
+        vanna_server.observe_answer(question, sql, {})
+
+        return compressed(request, with_response_bytes(json_response({
+            'question': question,
+            'sql': sql,
+            'results': results
+        }), executed))
+    except LLMUnavailable as e:
+        return json_response({'error': str(e), 'question': question}, 503)
+    except Exception as e:
+        return json_response({'error': str(e), 'question': question}, 500)
+
+
+@instrumented
+async def ask(request: Request):
+    """Endpoint similar al de la API oficial de Vanna"""
+    try:
+        data, body = await read_json(request)
+        if needs_flask(data, request):
+            return _Delegated(request.scope, _replay(body))
+        question = data.get('question')
+
+        if not question:
+            return json_response({'error': 'Question is required'}, 400)
+
+        result_format = data.get('format') or request.query_params.get('format') or 'records'
+        if result_format not in RESULT_FORMATS:
+            return json_response({'error': f'Unsupported result format: {result_format}'}, 400)
+
+        answer = vanna_server.materialized_answer(question, result_format, vanna_server.EXECUTION_BUDGETS['ask'])
+        if answer:
+            # Pregunta materializada: resultado precalculado, sin LLM ni base de datos
+            sql, results, extra = answer
+            executed = []
+        else:
+            sql = await generate_sql_async(question)
+            executed = []
+            results = await execute_sql_async(
+                sql, result_format, vanna_server.EXECUTION_BUDGETS['ask'], question, executed, request
+            )
+            vanna_server.observe_answer(question, sql, {})
+            extra = {}
+
+        return compressed(request, with_response_bytes(json_response({
+            'type': 'sql',
+            'explanation': f"Generated SQL for: {question}",
+            'sql': sql,
+            'format': result_format,
+            'df': results['data'],
+            'columns': results['columns'],
+            'row_count': results['row_count'],
+            'truncated': results['truncated'],
+            **extra
+        }), executed))
+    except LLMUnavailable as e:
+        return json_response({'error': str(e)}, 503)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+async def database_health(refresh=False):
+    """Una sola consulta a la base; el resultado se reutiliza durante HEALTH_CACHE_TTL segundos"""
+    global health_cache
+    if (health_cache is not None and not refresh
+            and time.monotonic() - health_cache['monotonic'] < vanna_server.HEALTH_CACHE_TTL):
+        return health_cache, True
+    async with health_lock:
+        if (health_cache is not None and not refresh
+                and time.monotonic() - health_cache['monotonic'] < vanna_server.HEALTH_CACHE_TTL):
+            return health_cache, True
+        started = time.perf_counter()
+        try:
+            async with db_pool.acquire() as conn:
+                row = await conn.fetchrow('SELECT version(), current_database(), current_user')
+            check = {'ok': True, 'database': {
+                'name': row[1],
+                'host': vanna_server.DB_CONFIG['host'],
+                'port': vanna_server.DB_CONFIG['port'],
+                'version': row[0],
+                'user': row[2]
+            }}
+        except Exception as e:
+            check = {'ok': False, 'error': str(e)}
+        check['check_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        check['checked_at'] = time.time()
+        check['monotonic'] = time.monotonic()
+        health_cache = check
+        return check, False
+
+
+@instrumented
+async def health_check(request: Request):
+    """Endpoint de verificación de salud (cacheado; ?refresh=1 fuerza una comprobación nueva)"""
+    refresh = request.query_params.get('refresh', '').lower() in ('1', 'true', 'yes')
+    check, cached = await database_health(refresh)
+    circuit = vanna_server.llm_client.breaker.stats()
+    if not check['ok']:
+        status = 'unhealthy'
+    elif circuit['state'] != 'closed' or vanna_server.startup_state['status'] != 'ready':
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    body = {
+        'status': status,
+        'mode': 'asgi',
+        'check': {
+            'cached': cached,
+            'age_seconds': round(time.monotonic() - check['monotonic'], 3),
+            'ttl': vanna_server.HEALTH_CACHE_TTL,
+            'checked_at': check['checked_at'],
+            'duration_ms': check['check_ms']
+        },
+        'startup': vanna_server.startup_state['status'],
+        'database': check.get('database'),
+        'pool': {
+            'min_size': db_pool.get_min_size(),
+            'max_size': db_pool.get_max_size(),
+            'total': db_pool.get_size(),
+            'idle': db_pool.get_idle_size()
+        },
+        'caches': {
+            'question_cache': vanna_server.question_cache.stats(),
+            'answer_store': vanna_server.answer_store.stats()
+        },
+        'llm_circuit': circuit,
+        'llm_concurrency': LLM_CONCURRENCY
+    }
+    if not check['ok']:
+        body['error'] = check['error']
+        return json_response(body, 500)
+    return json_response(body)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool
+    vanna_server.check_cursor_secret(int(os.getenv('ASGI_WORKERS', '1')))
+    # Vanna y la base de datos del lado Flask se preparan en segundo plano (ver /ready)
+    vanna_server.start_warm_up()
+    config = vanna_server.DB_CONFIG
+    db_pool = await asyncpg.create_pool(
+        host=config['host'],
+        port=int(config['port']),
+        database=config['database'],
+        user=config['user'],
+        password=config['password'],
+        min_size=vanna_server.POOL_CONFIG['min_size'],
+        max_size=vanna_server.POOL_CONFIG['max_size'],
+        max_inactive_connection_lifetime=vanna_server.POOL_CONFIG['max_idle']
+    )
+    try:
+        yield
+    finally:
+        await db_pool.close()
+        llm_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/v0/generate_sql', generate_sql, methods=['GET']),
+        Route('/api/v0/run_sql', run_sql, methods=['POST']),
+        Route('/api/v0/chat', chat, methods=['POST']),
+        Route('/api/v0/ask', ask, methods=['POST']),
+        Route('/api/v0/health', health_check, methods=['GET']),
+        Mount('/', app=flask_fallback)
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    workers = int(os.getenv('ASGI_WORKERS', str(os.cpu_count() or 1)))
+    # Antes de lanzar los procesos: con varios workers los cursores necesitan un secreto común
+    vanna_server.check_cursor_secret(workers)
+    uvicorn.run(
+        'asgi_server:app',
+        host=os.getenv('ASGI_HOST', '0.0.0.0'),
+        port=int(os.getenv('ASGI_PORT', '8080')),
+        workers=workers,
+        log_level=os.getenv('ASGI_LOG_LEVEL', 'info')
+    )
@@ -0,0 +1,359 @@
+"""Benchmark reproducible de extremo a extremo de los endpoints /api/v0
+
+Crea una base de datos temporal sembrada con tablas sintéticas, levanta vanna_server en el mismo
+proceso (LLM simulado, almacén vectorial local, sin claves ni red) y mide latencia, throughput,
+memoria y asignaciones por escenario. El resultado es JSON para comparar ejecuciones:
+
+    # PostgreSQL existente (usuario con permiso para CREATE DATABASE)
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=postgres BENCH_DB_PASSWORD=1234 \\
+        python benchmarks/endpoints.py --tables 5 --rows 20000 --output bench.json
+
+    # Clúster desechable con initdb/pg_ctl del PATH
+    python benchmarks/endpoints.py --init-cluster --output bench.json
+
+    # Comparar con una ejecución anterior (p. ej. JSON_PROVIDER=default frente a fast)
+    python benchmarks/endpoints.py --output before.json
+    python benchmarks/endpoints.py --server-env JSON_PROVIDER=fast --baseline before.json --output after.json
+
+Los clientes y el servidor comparten proceso (y GIL): los números sirven para comparar cambios
+entre ejecuciones en la misma máquina, no como capacidad absoluta del servidor.
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from import_time import measure_import
+from load_compare import run_scenario, send
+
+ENDPOINTS = ('generate_sql', 'run_sql', 'chat', 'ask', 'get_schema', 'update_schema')
+SIZED_ENDPOINTS = ('run_sql', 'chat', 'ask')
+
+
+class PostgresFixture:
+    """Base de datos temporal sembrada con `tables` tablas de `rows` filas cada una"""
+
+    def __init__(self, tables=5, rows=10000, init_cluster=False, keep=False):
+        self.tables = tables
+        self.rows = rows
+        self.init_cluster = init_cluster
+        self.keep = keep
+        self.cluster_dir = None
+        self.config = {
+            'host': os.getenv('BENCH_DB_HOST', '127.0.0.1'),
+            'port': os.getenv('BENCH_DB_PORT', '5432'),
+            'user': os.getenv('BENCH_DB_USER', 'postgres'),
+            'password': os.getenv('BENCH_DB_PASSWORD', '')
+        }
+        self.database = f'vanna_bench_{os.getpid()}'
+
+    def __enter__(self):
+        if self.init_cluster:
+            self._start_cluster()
+        self._admin(f'DROP DATABASE IF EXISTS {self.database}')
+        self._admin(f'CREATE DATABASE {self.database}')
+        started = time.perf_counter()
+        self._seed()
+        self.seed_seconds = round(time.perf_counter() - started, 3)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if not self.keep:
+                self._admin(f'DROP DATABASE IF EXISTS {self.database}')
+        finally:
+            if self.cluster_dir:
+                subprocess.run(['pg_ctl', '-D', self.cluster_dir, '-m', 'fast', '-w', 'stop'],
+                               check=False, capture_output=True)
+                shutil.rmtree(self.cluster_dir, ignore_errors=True)
+
+    def _connect(self, database):
+        import psycopg2
+        return psycopg2.connect(database=database, **self.config)
+
+    def _admin(self, statement):
+        conn = self._connect('postgres')
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(statement)
+        finally:
+            conn.close()
+
+    def _seed(self):
+        """Tablas con los tipos habituales (numeric, timestamptz, uuid...) generadas en el servidor"""
+        conn = self._connect(self.database)
+        try:
+            with conn, conn.cursor() as cursor:
+                for index in range(self.tables):
+                    cursor.execute(f'''
+                        CREATE TABLE bench_t{index} (
+                            id bigint PRIMARY KEY,
+                            nombre text NOT NULL,
+                            precio numeric(12, 2),
+                            creado timestamptz NOT NULL,
+                            referencia uuid,
+                            categoria integer,
+                            activo boolean
+                        )
+                    ''')
+                    cursor.execute(f'''
+                        INSERT INTO bench_t{index}
+                        SELECT g, 'item ' || g, (g % 1000) / 7.0, now() - g * interval '1 minute',
+                               md5(g::text)::uuid, g % 50, g % 2 = 0
+                        FROM generate_series(1, %s) AS g
+                    ''', (self.rows,))
+                    cursor.execute(f"COMMENT ON TABLE bench_t{index} IS 'Tabla sintética de benchmark {index}'")
+                cursor.execute('ANALYZE')
+        finally:
+            conn.close()
+
+    def _start_cluster(self):
+        if not shutil.which('initdb') or not shutil.which('pg_ctl'):
+            raise RuntimeError('--init-cluster requires initdb and pg_ctl on PATH')
+        self.cluster_dir = tempfile.mkdtemp(prefix='vanna-bench-pg-')
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        subprocess.run(['initdb', '-D', self.cluster_dir, '-U', 'postgres', '--auth=trust'],
+                       check=True, capture_output=True)
+        subprocess.run(['pg_ctl', '-D', self.cluster_dir, '-w', '-l', os.path.join(self.cluster_dir, 'log'),
+                        '-o', f'-p {port} -k {self.cluster_dir} -c listen_addresses=127.0.0.1', 'start'],
+                       check=True, capture_output=True)
+        self.config.update({'host': '127.0.0.1', 'port': str(port), 'user': 'postgres', 'password': ''})
+
+
+def question_for(size):
+    return f'benchmark rows {size}'
+
+
+def sql_for(size):
+    return f'SELECT * FROM bench_t0 ORDER BY id LIMIT {int(size)}'
+
+
+def server_environment(fixture, workdir, args):
+    """Variables de entorno del servidor: LLM simulado, almacén local y cachés según --with-cache"""
+    responses = {question_for(size): sql_for(size) for size in args.result_sizes}
+    responses_path = os.path.join(workdir, 'mock_responses.json')
+    with open(responses_path, 'w', encoding='utf-8') as f:
+        json.dump(responses, f)
+    env = {
+        'DB_HOST': fixture.config['host'],
+        'DB_PORT': fixture.config['port'],
+        'DB_USER': fixture.config['user'],
+        'DB_PASSWORD': fixture.config['password'],
+        'DB_NAME': fixture.database,
+        'DB_POOL_MAX': str(max(args.concurrency) + 2),
+        'LLM_BACKEND': 'mock',
+        'LLM_MOCK_RESPONSES': responses_path,
+        'LLM_MOCK_LATENCY_MS': str(args.llm_latency_ms),
+        'VECTOR_STORE': 'local',
+        'VECTOR_STORE_PATH': os.path.join(workdir, 'vector_data'),
+        'SCHEMA_TRAINING_STATE': os.path.join(workdir, 'schema_training_state.json'),
+        'SLOW_REQUEST_MS': '600000'
+    }
+    if not args.with_cache:
+        env.update({'RESULT_CACHE_ENABLED': 'false', 'QUESTION_CACHE_TTL': '0.000001'})
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def start_server(env, ready_timeout=120.0):
+    """Importa vanna_server con la configuración del benchmark, lo sirve en un hilo y espera a /ready
+
+    Retorna (servidor, URL base, segundos hasta estar listo).
+    """
+    os.environ.update(env)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    from werkzeug.serving import make_server
+    import vanna_server
+    started = time.perf_counter()
+    server = make_server('127.0.0.1', 0, vanna_server.create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    while send(base_url, '/ready', None, ready_timeout)[1] != 200:
+        if time.perf_counter() - started > ready_timeout:
+            raise RuntimeError(f'Server not ready after {ready_timeout:.0f}s: {vanna_server.startup_state}')
+        time.sleep(0.05)
+    return server, base_url, time.perf_counter() - started
+
+
+def rss_kb():
+    """Memoria residente actual del proceso (Linux) o el máximo histórico en otros sistemas"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def scenario_plan(args):
+    """Lista de (endpoint, tamaño de resultado, concurrencia, ruta, cuerpo)"""
+    plan = []
+    for endpoint in args.endpoints:
+        sizes = args.result_sizes if endpoint in SIZED_ENDPOINTS else [None]
+        levels = [1] if endpoint == 'update_schema' else args.concurrency
+        for size in sizes:
+            for concurrency in levels:
+                if endpoint == 'generate_sql':
+                    route = '/api/v0/generate_sql?' + urllib.parse.urlencode({'question': question_for(args.result_sizes[0])})
+                    payload = None
+                elif endpoint == 'run_sql':
+                    route, payload = '/api/v0/run_sql', {'sql': sql_for(size)}
+                elif endpoint in ('chat', 'ask'):
+                    route, payload = f'/api/v0/{endpoint}', {'question': question_for(size)}
+                elif endpoint == 'get_schema':
+                    route, payload = '/api/v0/get_schema', None
+                else:
+                    route, payload = '/api/v0/update_schema', {'mode': 'full'}
+                plan.append((endpoint, size, concurrency, route, payload))
+    return plan
+
+
+def run_measured(base_url, route, payload, concurrency, total, timeout, trace):
+    """Ejecuta un escenario y añade memoria y asignaciones del proceso"""
+    gc.collect()
+    collections_before = sum(stat['collections'] for stat in gc.get_stats())
+    blocks_before = sys.getallocatedblocks()
+    rss_before = rss_kb()
+    if trace:
+        tracemalloc.reset_peak()
+    result = run_scenario(base_url, route, payload, concurrency, total, timeout)
+    result['memory'] = {
+        'rss_before_kb': rss_before,
+        'rss_after_kb': rss_kb(),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'allocated_blocks_delta': sys.getallocatedblocks() - blocks_before,
+        'gc_collections': sum(stat['collections'] for stat in gc.get_stats()) - collections_before
+    }
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        result['memory']['traced_peak_bytes'] = peak
+        result['memory']['traced_current_bytes'] = current
+    return result
+
+
+def compare(report, baseline):
+    """Diferencia porcentual de p50/p95/p99 y throughput frente a una ejecución anterior"""
+    previous = {(s['endpoint'], s['result_rows'], s['concurrency']): s for s in baseline.get('scenarios', [])}
+    for scenario in report['scenarios']:
+        old = previous.get((scenario['endpoint'], scenario['result_rows'], scenario['concurrency']))
+        if not old:
+            continue
+        delta = {}
+        for key in ('p50', 'p95', 'p99'):
+            before, after = old['latency_ms'].get(key), scenario['latency_ms'].get(key)
+            if before and after is not None:
+                delta[f'{key}_pct'] = round((after - before) / before * 100, 2)
+        if old.get('throughput_rps') and scenario.get('throughput_rps') is not None:
+            delta['throughput_pct'] = round((scenario['throughput_rps'] - old['throughput_rps']) / old['throughput_rps'] * 100, 2)
+        scenario['vs_baseline'] = delta
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=10000, help='Filas por tabla')
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument('--result-sizes', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por escenario')
+    parser.add_argument('--update-schema-requests', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=5, help='Peticiones de calentamiento por escenario')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='Latencia simulada del LLM')
+    parser.add_argument('--with-cache', action='store_true', help='Mantener activas las cachés de preguntas y resultados')
+    parser.add_argument('--server-env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='Configuración extra del servidor (p. ej. JSON_PROVIDER=fast)')
+    parser.add_argument('--init-cluster', action='store_true', help='Crear un clúster temporal con initdb')
+    parser.add_argument('--keep-db', action='store_true')
+    parser.add_argument('--tracemalloc', action='store_true', help='Medir memoria asignada con tracemalloc (más lento)')
+    parser.add_argument('--import-repeat', type=int, default=3,
+                        help='Arranques en frío para medir la importación con -X importtime (0 = omitir)')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--baseline', default=None, help='JSON de una ejecución anterior para comparar')
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto stdout)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='vanna-bench-')
+    try:
+        with PostgresFixture(args.tables, args.rows, args.init_cluster, args.keep_db) as fixture:
+            env = server_environment(fixture, workdir, args)
+            import_time = measure_import(repeat=args.import_repeat, env=env) if args.import_repeat else None
+            server, base_url, ready_seconds = start_server(env, args.timeout)
+            if args.tracemalloc:
+                tracemalloc.start()
+            try:
+                scenarios = []
+                for endpoint, size, concurrency, route, payload in scenario_plan(args):
+                    total = args.update_schema_requests if endpoint == 'update_schema' else max(args.requests, concurrency)
+                    if args.warmup and endpoint != 'update_schema':
+                        run_scenario(base_url, route, payload, min(concurrency, args.warmup), args.warmup, args.timeout)
+                    result = run_measured(base_url, route, payload, concurrency, total, args.timeout, args.tracemalloc)
+                    result.update({'endpoint': endpoint, 'result_rows': size})
+                    scenarios.append(result)
+            finally:
+                server.shutdown()
+                if args.tracemalloc:
+                    tracemalloc.stop()
+
+        report = {
+            'meta': {
+                'label': args.label,
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'git_revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'server_env': {k: v for k, v in env.items() if 'PASSWORD' not in k},
+                'with_cache': args.with_cache,
+                'import_time': import_time,
+                'ready_seconds': round(ready_seconds, 3)
+            },
+            'fixture': {'tables': args.tables, 'rows_per_table': args.rows, 'seed_seconds': fixture.seed_seconds},
+            'scenarios': scenarios
+        }
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                compare(report, json.load(f))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
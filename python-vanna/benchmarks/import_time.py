@@ -0,0 +1,82 @@
+"""Presupuesto de tiempo de importación de vanna_server medido con python -X importtime
+
+Cada ejecución importa el módulo en un intérprete nuevo (arranque en frío de un worker) y se
+toma la mediana. Sale con código 1 si supera --budget-ms, para usarlo en CI:
+
+    python benchmarks/import_time.py --repeat 5 --budget-ms 400
+    python benchmarks/import_time.py --module asgi_server --top 20 --output import.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """[(tiempo propio en µs, acumulado en µs, profundidad, módulo)] de la salida de -X importtime"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return entries
+
+
+def measure_import(module='vanna_server', repeat=5, top=15, env=None):
+    """Mediana del tiempo de importación de `module` y los módulos que más aportan"""
+    runs = []
+    last = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=SERVER_DIR, capture_output=True, text=True, env=dict(os.environ, **(env or {}))
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f'import {module} failed:\n{completed.stderr[-2000:]}')
+        last = parse_importtime(completed.stderr)
+        total = next((cumulative for _, cumulative, depth, name in last if name == module and depth == 0), None)
+        runs.append(total / 1000 if total is not None else None)
+    measured = [run for run in runs if run is not None]
+    children = [(cumulative, name) for _, cumulative, depth, name in last if depth == 1]
+    return {
+        'module': module,
+        'runs_ms': [round(run, 1) for run in measured],
+        'median_ms': round(statistics.median(measured), 1) if measured else None,
+        'top_dependencies_ms': [
+            {'module': name, 'cumulative_ms': round(cumulative / 1000, 1)}
+            for cumulative, name in sorted(children, reverse=True)[:top]
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='vanna_server')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='Dependencias directas más costosas a listar')
+    parser.add_argument('--budget-ms', type=float, default=None, help='Falla si la mediana lo supera')
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto stdout)')
+    args = parser.parse_args()
+
+    report = measure_import(args.module, args.repeat, args.top)
+    report['budget_ms'] = args.budget_ms
+    report['within_budget'] = args.budget_ms is None or report['median_ms'] <= args.budget_ms
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if not report['within_budget']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
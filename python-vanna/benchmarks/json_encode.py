@@ -0,0 +1,107 @@
+"""Benchmark de serialización: filas por segundo del proveedor JSON de Flask frente a la ruta rápida
+
+No necesita base de datos: genera filas con los tipos que devuelve psycopg2 (int, text, numeric,
+timestamptz, date, uuid, bool) y mide el camino completo build_result + respuesta JSON.
+
+    python benchmarks/json_encode.py --rows 1000 10000 100000 --repeat 5
+"""
+import argparse
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_fast
+from json_fast import FastJSONProvider, column_converters, convert_batches
+from result_formats import build_result
+
+COLUMNS = [('id', 23), ('nombre', 25), ('precio', 1700), ('creado', 1184), ('entrega', 1082),
+           ('referencia', 2950), ('activo', 16)]
+
+
+def make_rows(count):
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [
+        (i, f'producto {i}', decimal.Decimal(i) / 7, base + datetime.timedelta(minutes=i),
+         (base + datetime.timedelta(days=i % 365)).date(), uuid.UUID(int=i), i % 2 == 0)
+        for i in range(count)
+    ]
+
+
+def encode_default(app, columns, batches, fmt):
+    return app.json.response(build_result(columns, batches, fmt)).get_data()
+
+
+def encode_fast(app, columns, batches, fmt):
+    converters = column_converters([type_code for _, type_code in COLUMNS])
+    return app.json.response(build_result(columns, list(convert_batches(batches, converters)), fmt)).get_data()
+
+
+def measure(name, provider_class, encode, rows, fmt, repeat, use_orjson=True):
+    app = Flask(__name__)
+    app.json = provider_class(app)
+    columns = [name for name, _ in COLUMNS]
+    batches = [rows[i:i + 2000] for i in range(0, len(rows), 2000)]
+    saved = json_fast.orjson
+    if not use_orjson:
+        json_fast.orjson = None
+    try:
+        timings = []
+        with app.app_context():
+            for _ in range(repeat):
+                start = time.perf_counter()
+                body = encode(app, columns, batches, fmt)
+                timings.append(time.perf_counter() - start)
+    finally:
+        json_fast.orjson = saved
+    best = min(timings)
+    return {
+        'serializer': name,
+        'format': fmt,
+        'rows': len(rows),
+        'best_s': round(best, 6),
+        'rows_per_sec': round(len(rows) / best, 1) if best else None,
+        'bytes': len(body)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--formats', nargs='+', default=['records', 'rows'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto stdout)')
+    args = parser.parse_args()
+
+    report = {'orjson_available': json_fast.orjson is not None, 'results': []}
+    for count in args.rows:
+        rows = make_rows(count)
+        for fmt in args.formats:
+            baseline = measure('flask_default', DefaultJSONProvider, encode_default, rows, fmt, args.repeat)
+            report['results'].append(baseline)
+            variants = [('fast_stdlib', False)]
+            if json_fast.orjson is not None:
+                variants.append(('fast_orjson', True))
+            for name, use_orjson in variants:
+                result = measure(name, FastJSONProvider, encode_fast, rows, fmt, args.repeat, use_orjson)
+                result['speedup'] = round(result['rows_per_sec'] / baseline['rows_per_sec'], 2)
+                report['results'].append(result)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark de carga: compara el servidor Flask (vanna_server.py) con el modo ASGI
+
+Ambos servidores deben estar levantados contra la misma base de datos, por ejemplo:
+
+    python vanna_server.py                                   # Flask en :8080
+    ASGI_PORT=8081 ASGI_WORKERS=1 python asgi_server.py      # ASGI en :8081
+
+    python benchmarks/load_compare.py --flask http://localhost:8080 \\
+        --asgi http://localhost:8081 --concurrency 1 10 50 200 --requests 400
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def send(base_url, endpoint, payload, timeout):
+    """Envía una petición y retorna (latencia en segundos, código HTTP)"""
+    if payload is None:
+        req = urllib.request.Request(base_url + endpoint)
+    else:
+        req = urllib.request.Request(
+            base_url + endpoint,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return time.perf_counter() - start, status
+
+
+def run_scenario(base_url, endpoint, payload, concurrency, total, timeout):
+    """Lanza `total` peticiones con `concurrency` clientes simultáneos"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: send(base_url, endpoint, payload, timeout), range(total)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, status in results if status == 200]
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': sum(1 for _, status in results if status != 200),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+            'p50': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+            'p99': round(percentile(latencies, 99) * 1000, 3) if latencies else None
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flask', default='http://localhost:8080', help='URL base del servidor Flask')
+    parser.add_argument('--asgi', default='http://localhost:8081', help='URL base del servidor ASGI')
+    parser.add_argument('--endpoint', default='/api/v0/chat')
+    parser.add_argument('--question', default='¿Cuántos productos hay en stock?')
+    parser.add_argument('--sql', default=None, help='SQL para /api/v0/run_sql')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por escenario')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto stdout)')
+    args = parser.parse_args()
+
+    if args.endpoint.endswith('run_sql'):
+        payload = {'sql': args.sql or 'SELECT 1'}
+    elif args.endpoint.endswith('generate_sql'):
+        payload = None
+        args.endpoint += '?' + urllib.parse.urlencode({'question': args.question})
+    else:
+        payload = {'question': args.question}
+
+    report = {'endpoint': args.endpoint, 'targets': {}}
+    for name, base_url in (('flask', args.flask), ('asgi', args.asgi)):
+        if not base_url:
+            continue
+        report['targets'][name] = [
+            run_scenario(base_url, args.endpoint, payload, concurrency, max(args.requests, concurrency), args.timeout)
+            for concurrency in args.concurrency
+        ]
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Throughput de consultas repetidas con literales distintos: texto literal frente a PREPARE/EXECUTE
+
+Compara, con las mismas consultas y conexiones, el camino anterior de execute_sql (SQL literal
+leído con un cursor de servidor) con el de sentencias preparadas por conexión:
+
+    BENCH_DB_HOST=127.0.0.1 BENCH_DB_USER=postgres python benchmarks/prepared_queries.py \\
+        --queries 5000 --concurrency 1 4 8 --output prepared.json
+    python benchmarks/prepared_queries.py --init-cluster --shapes join
+
+Cada forma de consulta se ejecuta con literales aleatorios (misma plantilla, distinto valor),
+que es lo que ocurre con las preguntas frecuentes cacheadas o fijadas.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from endpoints import PostgresFixture, git_revision
+from execution_budget import fetch_within_budget
+from load_compare import percentile
+from prepared_statements import PreparedStatements
+
+# Formas de consulta: una de planificación barata y una con joins donde planificar pesa más
+SHAPES = {
+    'point': lambda rng: (
+        f'SELECT id, nombre, precio FROM bench_t0 WHERE id = {rng.randint(1, 1000)}'
+    ),
+    'filter': lambda rng: (
+        f'SELECT id, nombre, precio FROM bench_t0 WHERE categoria = {rng.randint(0, 49)} '
+        f'AND precio > {rng.randint(0, 100)} ORDER BY id LIMIT 20'
+    ),
+    'join': lambda rng: (
+        'SELECT a.id, a.nombre, b.precio, c.creado FROM bench_t0 a '
+        'JOIN bench_t1 b ON b.id = a.id JOIN bench_t2 c ON c.id = a.id '
+        f"WHERE a.categoria = {rng.randint(0, 49)} AND b.precio > {rng.randint(0, 100)} "
+        f"AND c.nombre LIKE 'item {rng.randint(1, 9)}%' ORDER BY a.id LIMIT 50"
+    )
+}
+BUDGET = {'max_rows': 1000, 'max_response_bytes': 0}
+
+
+def run_literal(conn, sql, statements):
+    """Camino anterior: SQL literal con cursor de servidor (parse y plan en cada ejecución)"""
+    cursor = conn.cursor(name=f'query_{uuid.uuid4().hex}')
+    cursor.execute(sql)
+    batches, _ = fetch_within_budget(cursor, BUDGET, 1000)
+    cursor.close()
+    conn.commit()
+    return sum(len(batch) for batch in batches)
+
+
+def run_prepared(conn, sql, statements):
+    """Camino nuevo: EXECUTE de la plantilla preparada en la conexión (o literal si no aplica)"""
+    prepared = statements.statement(conn, sql, BUDGET['max_rows'] + 1)
+    if prepared is None:
+        return run_literal(conn, sql, statements)
+    cursor = conn.cursor()
+    cursor.execute(*prepared)
+    batches, _ = fetch_within_budget(cursor, BUDGET, 1000)
+    cursor.close()
+    conn.commit()
+    return sum(len(batch) for batch in batches)
+
+
+MODES = {'literal': run_literal, 'prepared': run_prepared}
+
+
+def run_scenario(connections, shape, mode, concurrency, total, seed):
+    """`total` consultas repartidas entre `concurrency` hilos, una conexión por hilo"""
+    statements = PreparedStatements(threshold=1)
+    execute = MODES[mode]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_worker = total // concurrency
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        conn = connections[index]
+        local = []
+        for _ in range(per_worker):
+            sql = SHAPES[shape](rng)
+            started = time.perf_counter()
+            try:
+                execute(conn, sql, statements)
+            except Exception as e:
+                conn.rollback()
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    # Sin DEALLOCATE entre escenarios cada modo empezaría con sentencias del anterior
+    for conn in connections[:concurrency]:
+        with conn.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        conn.commit()
+    return {
+        'shape': shape,
+        'mode': mode,
+        'concurrency': concurrency,
+        'queries': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(elapsed, 3),
+        'qps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'prepared_statements': statements.stats() if mode == 'prepared' else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shapes', nargs='+', default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--queries', type=int, default=2000, help='Consultas por escenario')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--init-cluster', action='store_true', help='Levanta un clúster desechable con initdb')
+    parser.add_argument('--keep-db', action='store_true')
+    parser.add_argument('--output', default=None, help='Archivo JSON de salida (por defecto stdout)')
+    args = parser.parse_args()
+
+    with PostgresFixture(tables=3, rows=args.rows, init_cluster=args.init_cluster, keep=args.keep_db) as fixture:
+        connections = [fixture._connect(fixture.database) for _ in range(max(args.concurrency))]
+        try:
+            results = []
+            for shape in args.shapes:
+                for concurrency in args.concurrency:
+                    # Calentamiento para que ambos modos midan con cachés del servidor en el mismo estado
+                    run_scenario(connections, shape, 'literal', concurrency, min(args.queries, 200), args.seed)
+                    scenario = {mode: run_scenario(connections, shape, mode, concurrency, args.queries, args.seed)
+                                for mode in MODES}
+                    literal, prepared = scenario['literal'], scenario['prepared']
+                    prepared['speedup'] = (round(prepared['qps'] / literal['qps'], 3)
+                                           if literal['qps'] and prepared['qps'] else None)
+                    results += [literal, prepared]
+                    print(f"{shape:>6} c={concurrency:<3} literal {literal['qps']} qps  "
+                          f"prepared {prepared['qps']} qps  x{prepared['speedup']}", file=sys.stderr)
+        finally:
+            for conn in connections:
+                conn.close()
+
+    report = {
+        'meta': {'revision': git_revision(), 'rows': args.rows, 'queries': args.queries, 'seed': args.seed},
+        'results': results
+    }
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+import threading
+import time
+import zlib
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él no se ofrece Content-Encoding: br
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional: sin él no se ofrece Content-Encoding: zstd
+    zstandard = None
+
+DEFAULT_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 5}
+DEFAULT_MIMETYPES = (
+    'application/json', 'application/x-ndjson', 'application/vnd.apache.arrow.stream',
+    'text/csv', 'text/plain', 'text/html'
+)
+_ALIASES = {'x-gzip': 'gzip'}
+# Estados en los que el cuerpo es el recurso y puede codificarse
+_COMPRESSIBLE_STATUS = {200, 201, 202, 203}
+
+
+class _GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    """Codificaciones soportadas en este proceso, de mayor a menor preferencia"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate(accept_encoding, encodings):
+    """Codificación con mayor q en Accept-Encoding; a igual q gana el orden de `encodings`"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[_ALIASES.get(name, name)] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class ResponseCompressor:
+    """Compresión negociada (zstd, br, gzip) por encima de `min_size` bytes, con métricas de ratio"""
+
+    def __init__(self, encodings=None, min_size=1024, levels=None, mimetypes=DEFAULT_MIMETYPES, enabled=True):
+        available = available_encodings()
+        self.encodings = [encoding for encoding in (encodings or available) if encoding in available]
+        self.min_size = min_size
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self.mimetypes = tuple(mimetypes)
+        self.enabled = enabled and bool(self.encodings)
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def encoder(self, encoding):
+        level = self.levels[encoding]
+        if encoding == 'zstd':
+            return _ZstdEncoder(level)
+        if encoding == 'br':
+            return _BrotliEncoder(level)
+        return _GzipEncoder(level)
+
+    def choose(self, accept_encoding, content_type, headers=()):
+        """Codificación a aplicar o None si la respuesta debe ir tal cual"""
+        if not self.enabled:
+            return None
+        mimetype = (content_type or '').split(';')[0].strip().lower()
+        if mimetype not in self.mimetypes:
+            return None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding' or (name == 'cache-control' and 'no-transform' in value.lower()):
+                return None
+        return negotiate(accept_encoding, self.encodings)
+
+    def compress(self, body, accept_encoding, content_type):
+        """(cuerpo, codificación) para una respuesta completa; codificación None si no se comprime"""
+        if len(body) < self.min_size:
+            return body, None
+        encoding = self.choose(accept_encoding, content_type)
+        if encoding is None:
+            return body, None
+        started = time.perf_counter()
+        encoder = self.encoder(encoding)
+        compressed = encoder.compress(body) + encoder.finish()
+        self.record(encoding, len(body), len(compressed), time.perf_counter() - started)
+        return compressed, encoding
+
+    def record(self, encoding, size_in, size_out, elapsed):
+        metrics.compression_bytes_total.inc(encoding, 'in', amount=size_in)
+        metrics.compression_bytes_total.inc(encoding, 'out', amount=size_out)
+        metrics.compression_duration.observe(elapsed, encoding)
+        if size_out:
+            metrics.compression_ratio.observe(size_in / size_out, encoding)
+        with self._lock:
+            totals = self._totals.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0})
+            totals['responses'] += 1
+            totals['bytes_in'] += size_in
+            totals['bytes_out'] += size_out
+            totals['seconds'] += elapsed
+
+    def stats(self):
+        with self._lock:
+            by_encoding = {
+                encoding: dict(
+                    totals,
+                    seconds=round(totals['seconds'], 6),
+                    ratio=round(totals['bytes_in'] / totals['bytes_out'], 3) if totals['bytes_out'] else None
+                )
+                for encoding, totals in self._totals.items()
+            }
+        return {
+            'enabled': self.enabled,
+            'encodings': self.encodings,
+            'min_size': self.min_size,
+            'levels': {encoding: self.levels[encoding] for encoding in self.encodings},
+            'by_encoding': by_encoding
+        }
+
+
+class CompressionMiddleware:
+    """Middleware WSGI: comprime respuestas completas y en streaming según Accept-Encoding
+
+    En streaming se acumula hasta `min_size` antes de decidir y cada parte se envía con un
+    flush del compresor, para que el cliente reciba las filas sin esperar al final.
+    """
+
+    def __init__(self, app, compressor):
+        self.app = app
+        self.compressor = compressor
+
+    def __call__(self, environ, start_response):
+        accept_encoding = environ.get('HTTP_ACCEPT_ENCODING')
+        if not self.compressor.enabled or not accept_encoding or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['response'] = (status, headers, exc_info)
+            return captured.setdefault('written', []).append
+
+        body = self.app(environ, capture)
+        status, headers, exc_info = captured['response']
+        written = captured.get('written')
+        encoding = None
+        if int(status.split(' ', 1)[0]) in _COMPRESSIBLE_STATUS:
+            content_type = next((value for name, value in headers if name.lower() == 'content-type'), None)
+            encoding = self.compressor.choose(accept_encoding, content_type, headers)
+        length = next((value for name, value in headers if name.lower() == 'content-length'), None)
+        if encoding is None or (length is not None and int(length) < self.compressor.min_size):
+            start_response(status, _with_vary(headers), exc_info)
+            return _chain(written, body)
+        if length is not None:
+            # Longitud conocida (el caso de jsonify): el cuerpo ya está en memoria, una sola pasada
+            try:
+                payload = b''.join(_chain(written, body))
+            finally:
+                _close(body)
+            compressed, encoding = self.compressor.compress(payload, accept_encoding, content_type)
+            start_response(status, _encoded_headers(headers, encoding, len(compressed)), exc_info)
+            return [compressed]
+        return _Chained(self._stream(iter(_chain(written, body)), status, headers, exc_info, encoding,
+                                     start_response), body)
+
+    def _stream(self, iterator, status, headers, exc_info, encoding, start_response):
+        # Sin longitud conocida: se decide al juntar min_size bytes (o al terminar el cuerpo)
+        pending = []
+        buffered = 0
+        for chunk in iterator:
+            if chunk:
+                pending.append(chunk)
+                buffered += len(chunk)
+                if buffered >= self.compressor.min_size:
+                    break
+        if buffered < self.compressor.min_size:
+            start_response(status, _with_vary(headers), exc_info)
+            yield b''.join(pending)
+            return
+        start_response(status, _encoded_headers(headers, encoding), exc_info)
+        encoder = self.compressor.encoder(encoding)
+        size_in = size_out = 0
+        elapsed = 0.0
+        chunk = b''.join(pending)
+        while True:
+            started = time.perf_counter()
+            # Flush por parte: cada lote de filas llega al cliente sin esperar al siguiente
+            out = encoder.compress(chunk) + encoder.flush()
+            elapsed += time.perf_counter() - started
+            size_in += len(chunk)
+            size_out += len(out)
+            if out:
+                yield out
+            chunk = next(iterator, None)
+            while chunk is not None and not chunk:
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+        out = encoder.finish()
+        size_out += len(out)
+        self.compressor.record(encoding, size_in, size_out, elapsed)
+        yield out
+
+
+def _chain(written, body):
+    """Lo escrito con write() seguido del cuerpo"""
+    if not written:
+        return body
+    return _Chained(written, body, body)
+
+
+def _close(iterable):
+    close = getattr(iterable, 'close', None)
+    if close is not None:
+        close()
+
+
+class _Chained:
+    """Itera `head` y luego `tail`; close() llega siempre al cuerpo original de la aplicación"""
+
+    def __init__(self, head, body, tail=None):
+        self.head = head
+        self.body = body
+        self.tail = tail
+
+    def __iter__(self):
+        yield from self.head
+        if self.tail is not None:
+            yield from self.tail
+
+    def close(self):
+        try:
+            _close(self.head)
+        finally:
+            _close(self.body)
+
+
+def _with_vary(headers):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' in value.lower():
+                return headers
+            return headers[:index] + [(name, f'{value}, Accept-Encoding')] + headers[index + 1:]
+    return list(headers) + [('Vary', 'Accept-Encoding')]
+
+
+def _encoded_headers(headers, encoding, length=None):
+    """Cabeceras de la respuesta codificada: sin la longitud original y con ETag débil"""
+    result = []
+    for name, value in _with_vary(headers):
+        lower = name.lower()
+        if lower == 'content-length':
+            continue
+        if lower == 'etag' and not value.startswith('W/'):
+            # Otra representación del mismo recurso: If-None-Match sigue validando por comparación débil
+            value = f'W/{value}'
+        result.append((name, value))
+    result.append(('Content-Encoding', encoding))
+    if length is not None:
+        result.append(('Content-Length', str(length)))
+    return result
@@ -0,0 +1,264 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """No se obtuvo una conexión del pool dentro del tiempo de espera"""
+
+
+class ConnectionPool:
+    """Pool de conexiones PostgreSQL thread-safe, acotado y con métricas
+
+    - checkout bloqueante con timeout (las peticiones esperan en cola en vez de fallar)
+    - verificación de salud de conexiones inactivas antes de entregarlas
+    - reciclaje de conexiones rotas, inactivas o demasiado antiguas
+    """
+
+    def __init__(self, dsn_params, min_size=1, max_size=10, timeout=30.0, max_idle=300.0,
+                 max_lifetime=3600.0, health_check_interval=30.0, connect=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: require 0 <= min_size <= max_size and max_size >= 1')
+        self.dsn_params = dict(dsn_params)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self._connect = connect or (lambda: psycopg2.connect(**self.dsn_params))
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = deque()
+        self._in_use = {}
+        self._created_at = {}
+        self._opening = 0
+        self._waiting = 0
+        self._closed = False
+        self._metrics = {
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'waits': 0
+        }
+
+    # --- ciclo de vida ---
+
+    def warm_up(self):
+        """Abre las conexiones mínimas por adelantado; retorna cuántas hay inactivas"""
+        while True:
+            with self._cond:
+                if self._closed or self._total() >= self.min_size:
+                    return len(self._idle)
+                self._opening += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def start_maintenance(self, interval=30.0):
+        """Hilo en segundo plano que recicla conexiones inactivas y repone el mínimo"""
+        def run():
+            while not self._closed:
+                time.sleep(interval)
+                try:
+                    self.prune()
+                    self.warm_up()
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=run, name='db-pool-maintenance', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """Cierra todas las conexiones inactivas y rechaza nuevos checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # --- checkout / devolución ---
+
+    def getconn(self, timeout=None):
+        """Obtiene una conexión, esperando hasta `timeout` segundos si el pool está lleno"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        self._metrics['checkout_failures'] += 1
+                        raise PoolTimeout('Connection pool is closed')
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        # Se reserva como en uso mientras se verifica para no superar max_size
+                        self._in_use[id(conn)] = time.monotonic()
+                        break
+                    if self._total() < self.max_size:
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        self._metrics['checkout_failures'] += 1
+                        raise PoolTimeout(
+                            f'Timed out after {timeout:.1f}s waiting for a database connection '
+                            f'({self.max_size} in use)'
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._opening -= 1
+                        self._metrics['checkout_failures'] += 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opening -= 1
+                    self._in_use[id(conn)] = time.monotonic()
+            elif not self._usable(conn, idle_since):
+                with self._cond:
+                    self._in_use.pop(id(conn), None)
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                wait_time = time.monotonic() - start
+                self._metrics['checkouts'] += 1
+                if waited:
+                    self._metrics['waits'] += 1
+                self._metrics['wait_time_total'] += wait_time
+                self._metrics['wait_time_max'] = max(self._metrics['wait_time_max'], wait_time)
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Devuelve una conexión al pool, descartándola si está rota o se pide cerrarla"""
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+        if close or conn.closed or self._closed or self._too_old(conn):
+            self._discard(conn)
+            with self._cond:
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # --- mantenimiento ---
+
+    def prune(self):
+        """Cierra conexiones inactivas de más (por encima del mínimo) o demasiado antiguas"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            keep = deque()
+            for conn, idle_since in self._idle:
+                surplus = self._total() - len(expired) > self.min_size
+                if self._too_old(conn) or (surplus and self.max_idle and now - idle_since > self.max_idle):
+                    expired.append(conn)
+                else:
+                    keep.append((conn, idle_since))
+            self._idle = keep
+        for conn in expired:
+            self._discard(conn)
+        return len(expired)
+
+    def stats(self):
+        """Métricas del pool: tamaño, uso, esperas y fallos de checkout"""
+        with self._cond:
+            metrics = dict(self._metrics)
+            checkouts = metrics['checkouts']
+            metrics['wait_time_avg'] = metrics['wait_time_total'] / checkouts if checkouts else 0.0
+            for key in ('wait_time_total', 'wait_time_max', 'wait_time_avg'):
+                metrics[key] = round(metrics[key], 6)
+            metrics.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'total': self._total(),
+                'waiting': self._waiting,
+                'timeout': self.timeout
+            })
+            return metrics
+
+    # --- internos ---
+
+    def _total(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._metrics['connections_created'] += 1
+        return conn
+
+    def _too_old(self, conn):
+        created = self._created_at.get(id(conn))
+        return bool(self.max_lifetime) and created is not None and time.monotonic() - created > self.max_lifetime
+
+    def _usable(self, conn, idle_since):
+        """Comprueba una conexión inactiva antes de entregarla"""
+        if conn.closed or self._too_old(conn):
+            return False
+        if self.max_idle and time.monotonic() - idle_since > self.max_idle and self._total() > self.min_size:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._metrics['health_check_failures'] += 1
+            return False
+
+    def _discard(self, conn):
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._metrics['connections_discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
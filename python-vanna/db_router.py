@@ -0,0 +1,263 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from db_pool import ConnectionPool
+
+ROLES = ('primary', 'replica')
+
+# Retraso de réplica en segundos: 0 si ya aplicó todo lo recibido (evita falsos positivos
+# cuando el primario está inactivo y pg_last_xact_replay_timestamp no avanza)
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class UnknownDatabase(Exception):
+    """La base de datos pedida no está permitida en este servidor"""
+
+
+def parse_hosts(value, default_port):
+    """Convierte 'host1:5433,host2' en [(host, puerto), ...]"""
+    hosts = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        hosts.append((host, port or str(default_port)))
+    return hosts
+
+
+def parse_databases(value):
+    """Lista de bases permitidas: None si no hay restricción ('*')"""
+    value = (value or '').strip()
+    if value == '*':
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class _ReplicaState:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.lag = None
+        self.healthy = True
+        self.checked_at = 0.0
+        self.error = None
+        self.lock = threading.Lock()
+
+    @property
+    def key(self):
+        return f'{self.host}:{self.port}'
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'port': self.port,
+            'healthy': self.healthy,
+            'lag_seconds': None if self.lag is None else round(self.lag, 3),
+            'checked_at': self.checked_at or None,
+            'error': self.error
+        }
+
+
+class PoolRegistry:
+    """Pools de conexiones por (base de datos, rol, servidor) creados bajo demanda
+
+    Las lecturas se reparten entre las réplicas sanas cuyo retraso no supera max_replica_lag;
+    si no hay ninguna disponible se usa el primario. Las escrituras siempre van al primario.
+    """
+
+    def __init__(self, base_params, pool_config, replicas=(), allowed_databases=(),
+                 max_replica_lag=5.0, lag_check_interval=5.0, tenant_min_size=0, max_pools=32,
+                 pool_factory=None):
+        self.base_params = dict(base_params)
+        self.default_database = self.base_params['database']
+        self.pool_config = dict(pool_config)
+        self.replicas = [_ReplicaState(host, port) for host, port in replicas]
+        # None = cualquier base de datos; si no, la base por defecto siempre está permitida
+        self.allowed_databases = (
+            None if allowed_databases is None
+            else [self.default_database] + [d for d in allowed_databases if d != self.default_database]
+        )
+        self.max_replica_lag = max_replica_lag
+        self.lag_check_interval = lag_check_interval
+        self.tenant_min_size = tenant_min_size
+        self.max_pools = max_pools
+        self._pool_factory = pool_factory or ConnectionPool
+        self._pools = OrderedDict()
+        self._owners = {}
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._maintenance_interval = None
+        self.routed = {'primary': 0, 'replica': 0, 'replica_fallbacks': 0}
+
+    # --- selección ---
+
+    def resolve_database(self, name=None):
+        """Valida el nombre pedido y retorna la base de datos a usar"""
+        if not name:
+            return self.default_database
+        if self.allowed_databases is not None and name not in self.allowed_databases:
+            raise UnknownDatabase(f'Database not available: {name}')
+        return name
+
+    def pool(self, database=None, replica=None):
+        """Pool del primario (replica=None) o de una réplica para la base indicada"""
+        database = database or self.default_database
+        key = (database, replica.key if replica else 'primary')
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None:
+                self._pools.move_to_end(key)
+                return pool
+            params = dict(self.base_params, database=database)
+            if replica:
+                params.update(host=replica.host, port=replica.port)
+            config = dict(self.pool_config)
+            if database != self.default_database:
+                # Las bases de inquilinos no reservan conexiones hasta que se usan
+                config['min_size'] = min(self.tenant_min_size, config.get('max_size', 1))
+            pool = self._pool_factory(params, **config)
+            self._pools[key] = pool
+            evicted = self._evict_locked()
+        for old in evicted:
+            old.close()
+        if self._maintenance_interval:
+            pool.start_maintenance(self._maintenance_interval)
+        return pool
+
+    def choose_replica(self):
+        """Réplica sana con retraso aceptable (en turno rotatorio), o None"""
+        candidates = []
+        for replica in self.replicas:
+            self._refresh_lag(replica)
+            if replica.healthy and replica.lag is not None and replica.lag <= self.max_replica_lag:
+                candidates.append(replica)
+        if not candidates:
+            return None
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    # --- checkout / devolución ---
+
+    def getconn(self, database=None, read_only=False):
+        """Conexión para la base indicada; las lecturas van a una réplica si hay alguna apta"""
+        database = database or self.default_database
+        if read_only and self.replicas:
+            replica = self.choose_replica()
+            if replica is not None:
+                try:
+                    pool = self.pool(database, replica)
+                    conn = pool.getconn()
+                    self._track(conn, pool, database, replica.key)
+                    return conn
+                except Exception as e:
+                    self._mark_unhealthy(replica, e)
+            with self._lock:
+                self.routed['replica_fallbacks'] += 1
+        pool = self.pool(database)
+        conn = pool.getconn()
+        self._track(conn, pool, database, 'primary')
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            owner = self._owners.pop(id(conn), None)
+        if owner is None:
+            conn.close()
+            return
+        owner[0].putconn(conn, close=close)
+
+    def route_of(self, conn):
+        """(base de datos, servidor) de una conexión entregada por el registro"""
+        with self._lock:
+            owner = self._owners.get(id(conn))
+        return owner[1:] if owner else None
+
+    # --- ciclo de vida ---
+
+    def warm_up(self):
+        return self.pool().warm_up()
+
+    def start_maintenance(self, interval=30.0):
+        self._maintenance_interval = interval
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.start_maintenance(interval)
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def stats(self):
+        with self._lock:
+            pools = list(self._pools.items())
+            routed = dict(self.routed)
+        return {
+            'default_database': self.default_database,
+            'allowed_databases': self.allowed_databases or '*',
+            'pools': {f'{database}@{server}': pool.stats() for (database, server), pool in pools},
+            'replicas': [replica.to_dict() for replica in self.replicas],
+            'max_replica_lag': self.max_replica_lag,
+            'routed': routed
+        }
+
+    # --- internos ---
+
+    def _track(self, conn, pool, database, server):
+        with self._lock:
+            self._owners[id(conn)] = (pool, database, server)
+            self.routed['replica' if server != 'primary' else 'primary'] += 1
+
+    def _evict_locked(self):
+        """Cierra los pools menos usados por encima de max_pools (nunca el primario por defecto)"""
+        evicted = []
+        for key in list(self._pools):
+            if len(self._pools) - len(evicted) <= self.max_pools:
+                break
+            pool = self._pools[key]
+            if key == (self.default_database, 'primary') or pool.stats()['in_use']:
+                continue
+            evicted.append(self._pools.pop(key))
+        return evicted
+
+    def _refresh_lag(self, replica):
+        """Mide el retraso de la réplica si el dato caducó; solo un hilo mide a la vez"""
+        if time.monotonic() - replica.checked_at < self.lag_check_interval:
+            return
+        if not replica.lock.acquire(blocking=False):
+            return
+        try:
+            pool = self.pool(self.default_database, replica)
+            conn = pool.getconn(timeout=min(pool.timeout, 2.0))
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(REPLICA_LAG_QUERY)
+                    lag = cursor.fetchone()[0]
+                conn.rollback()
+            finally:
+                pool.putconn(conn)
+            replica.lag = float(lag or 0)
+            replica.healthy = True
+            replica.error = None
+        except Exception as e:
+            replica.healthy = False
+            replica.error = str(e)
+        finally:
+            replica.checked_at = time.monotonic()
+            replica.lock.release()
+
+    def _mark_unhealthy(self, replica, error):
+        replica.healthy = False
+        replica.error = str(error)
+        replica.checked_at = time.monotonic()
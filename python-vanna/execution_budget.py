@@ -0,0 +1,175 @@
+import json
+import os
+import select
+import socket
+import threading
+
+BUDGET_PROFILES = ('default', 'run_sql', 'chat', 'ask', 'stream')
+
+
+def load_budgets(environ=None):
+    """Presupuestos de ejecución por endpoint a partir del entorno
+
+    SQL_STATEMENT_TIMEOUT_MS, SQL_MAX_ROWS y SQL_MAX_RESPONSE_BYTES fijan los valores por
+    defecto; <PERFIL>_SQL_... (p. ej. CHAT_SQL_MAX_ROWS) los sobrescriben para un endpoint.
+    Un valor 0 desactiva el límite correspondiente.
+    """
+    environ = os.environ if environ is None else environ
+    defaults = {
+        'statement_timeout_ms': int(environ.get('SQL_STATEMENT_TIMEOUT_MS', '30000')),
+        'max_rows': int(environ.get('SQL_MAX_ROWS', '10000')),
+        'max_response_bytes': int(environ.get('SQL_MAX_RESPONSE_BYTES', str(50 * 1024 * 1024)))
+    }
+    budgets = {}
+    for profile in BUDGET_PROFILES:
+        budget = dict(defaults)
+        if profile == 'stream':
+            # Las exportaciones en streaming no acumulan filas en memoria: sin límite por defecto
+            budget.update({'max_rows': 0, 'max_response_bytes': 0})
+        prefix = profile.upper()
+        for key, env_name in (('statement_timeout_ms', 'SQL_STATEMENT_TIMEOUT_MS'),
+                              ('max_rows', 'SQL_MAX_ROWS'),
+                              ('max_response_bytes', 'SQL_MAX_RESPONSE_BYTES')):
+            value = environ.get(f'{prefix}_{env_name}')
+            if value is not None:
+                budget[key] = int(value)
+        budget['profile'] = profile
+        budgets[profile] = budget
+    return budgets
+
+
+def widest_budget(budgets, name):
+    """Presupuesto que admite lo que admite cualquiera de `budgets` (0 = sin límite prevalece)"""
+    budget = {'profile': name}
+    for key in ('statement_timeout_ms', 'max_rows', 'max_response_bytes'):
+        values = [item[key] for item in budgets]
+        budget[key] = 0 if 0 in values else max(values)
+    return budget
+
+
+def _estimate_bytes(rows):
+    """Tamaño JSON aproximado de un lote a partir de su primera fila"""
+    if not rows:
+        return 0
+    return (len(json.dumps(list(rows[0]), default=str)) + 1) * len(rows)
+
+
+class BudgetCounter:
+    """Filas y bytes estimados ya aceptados frente a max_rows y max_response_bytes"""
+
+    def __init__(self, budget):
+        self.max_rows = budget.get('max_rows') or 0
+        self.max_bytes = budget.get('max_response_bytes') or 0
+        self.rows = 0
+        self.bytes = 0
+
+    def next_size(self, batch_size):
+        """Filas a pedir en el siguiente lote (una extra sobre max_rows para detectar el truncado)"""
+        return batch_size if not self.max_rows else min(batch_size, self.max_rows + 1 - self.rows)
+
+    def admit(self, rows):
+        """(filas del lote que caben, motivo de truncado o None)"""
+        if self.max_rows and self.rows + len(rows) > self.max_rows:
+            return rows[:self.max_rows - self.rows], 'max_rows'
+        if self.max_bytes:
+            estimate = _estimate_bytes(rows)
+            if self.bytes + estimate > self.max_bytes:
+                allowed = int(len(rows) * (self.max_bytes - self.bytes) / estimate) if estimate else 0
+                return rows[:max(allowed, 0)], 'max_response_bytes'
+            self.bytes += estimate
+        self.rows += len(rows)
+        return rows, None
+
+
+def fetch_within_budget(cursor, budget, batch_size):
+    """Lee lotes del cursor respetando max_rows y max_response_bytes
+
+    Retorna (lotes, motivo de truncado o None). Se pide una fila extra para saber si el
+    resultado tenía más filas que el límite sin leerlas todas.
+    """
+    counter = BudgetCounter(budget)
+    batches = []
+    while True:
+        rows = cursor.fetchmany(counter.next_size(batch_size))
+        if not rows:
+            return batches, None
+        rows, truncation = counter.admit(rows)
+        if rows:
+            batches.append(rows)
+        if truncation:
+            return batches, truncation
+
+
+async def fetch_within_budget_async(cursor, budget, batch_size):
+    """fetch_within_budget para un cursor de asyncpg (cursor.fetch(n))"""
+    counter = BudgetCounter(budget)
+    batches = []
+    while True:
+        rows = await cursor.fetch(counter.next_size(batch_size))
+        if not rows:
+            return batches, None
+        rows, truncation = counter.admit(rows)
+        if rows:
+            batches.append(rows)
+        if truncation:
+            return batches, truncation
+
+
+def split_within_budget(rows, budget, batch_size):
+    """Lotes de filas ya leídas recortados a max_rows y max_response_bytes"""
+    counter = BudgetCounter(budget)
+    batches = []
+    for start in range(0, len(rows), batch_size):
+        batch, truncation = counter.admit(rows[start:start + batch_size])
+        if batch:
+            batches.append(batch)
+        if truncation:
+            return batches, truncation
+    return batches, None
+
+
+def client_socket(environ):
+    """Socket del cliente expuesto por el servidor WSGI (Werkzeug o Gunicorn), si existe"""
+    sock = environ.get('werkzeug.socket') or environ.get('gunicorn.socket')
+    return sock if isinstance(sock, socket.socket) else None
+
+
+class DisconnectWatcher:
+    """Vigila el socket del cliente mientras corre una consulta y la cancela si se desconecta"""
+
+    def __init__(self, sock, on_disconnect, interval=0.5):
+        self.sock = sock
+        self.on_disconnect = on_disconnect
+        self.interval = interval
+        self.disconnected = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='disconnect-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Con el lock: al volver, on_disconnect ya no puede ejecutarse (la conexión puede
+        # devolverse al pool sin riesgo de cancelar la consulta de otra petición)
+        with self._lock:
+            self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                readable, _, _ = select.select([self.sock], [], [], self.interval)
+                if not readable:
+                    continue
+                data = self.sock.recv(1, socket.MSG_PEEK)
+            except (OSError, ValueError):
+                data = b''
+            if data == b'':
+                with self._lock:
+                    if not self._stop.is_set():
+                        self.disconnected = True
+                        self.on_disconnect()
+                return
+            # Hay datos pendientes (p. ej. la siguiente petición keep-alive): seguir esperando
+            self._stop.wait(self.interval)
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class FanOutTimeout(Exception):
+    """La tarea no terminó dentro del tiempo total del lote"""
+
+
+class FanOutExecutor:
+    """Ejecuta una función sobre varias entradas en paralelo con un límite de concurrencia por lote
+
+    Los hilos se comparten entre peticiones; cada lote solo mantiene `concurrency` tareas
+    encoladas a la vez, de modo que un lote grande no acapara el executor.
+    """
+
+    def __init__(self, max_workers=16):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fan-out')
+        self._lock = threading.Lock()
+        self._active = 0
+        self.batches = 0
+        self.tasks = 0
+        self.timeouts = 0
+
+    def map(self, fn, items, concurrency=None, timeout=None):
+        """Retorna [(ok, resultado o excepción)] en el mismo orden que `items`"""
+        concurrency = max(1, min(concurrency or self.max_workers, self.max_workers))
+        deadline = time.monotonic() + timeout if timeout else None
+        outcomes = [None] * len(items)
+        pending = {}
+        next_index = 0
+        with self._lock:
+            self.batches += 1
+            self.tasks += len(items)
+            self._active += 1
+        try:
+            while next_index < len(items) or pending:
+                while next_index < len(items) and len(pending) < concurrency:
+                    future = self._executor.submit(fn, items[next_index])
+                    pending[future] = next_index
+                    next_index += 1
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        outcomes[index] = (True, future.result())
+                    except Exception as e:
+                        outcomes[index] = (False, e)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+        # Las tareas que no llegaron a tiempo siguen en segundo plano pero no se esperan
+        for future, index in pending.items():
+            future.cancel()
+        for index, outcome in enumerate(outcomes):
+            if outcome is None:
+                outcomes[index] = (False, FanOutTimeout('Timed out waiting for this question'))
+                with self._lock:
+                    self.timeouts += 1
+        return outcomes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'active_batches': self._active,
+                'batches': self.batches,
+                'tasks': self.tasks,
+                'timeouts': self.timeouts
+            }
@@ -0,0 +1,169 @@
+import base64
+import datetime
+import decimal
+import json
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la biblioteca estándar
+    orjson = None
+
+DECIMAL_MODES = ('str', 'float')
+
+# OIDs de PostgreSQL agrupados por la conversión que necesitan para ser JSON nativo
+_NUMERIC_OIDS = {1700, 790}
+_TEMPORAL_OIDS = {1082, 1083, 1114, 1184, 1266}
+_INTERVAL_OIDS = {1186}
+_UUID_OIDS = {2950}
+_BYTEA_OIDS = {17}
+_TEXTUAL_OIDS = {869, 650, 829, 774, 3220, 1560, 1562}  # inet, cidr, macaddr, macaddr8, pg_lsn, bit, varbit
+# orjson ya serializa fechas, horas sin zona y UUID en C: no hace falta convertirlos antes
+_ORJSON_NATIVE_OIDS = {1082, 1083, 1114, 1184, 2950}
+# Arreglos: OID del arreglo → OID del elemento
+_ARRAY_OIDS = {
+    1231: 1700, 1182: 1082, 1183: 1083, 1115: 1114, 1185: 1184, 1270: 1266,
+    1187: 1186, 2951: 2950, 1001: 17, 1041: 869, 651: 650
+}
+
+
+def _decimal(mode):
+    if mode == 'float':
+        return lambda value: None if value is None else float(value)
+    return lambda value: None if value is None else str(value)
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _seconds(value):
+    return None if value is None else value.total_seconds()
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _base64(value):
+    return None if value is None else base64.b64encode(bytes(value)).decode('ascii')
+
+
+def _scalar_converter(type_code, decimal_mode):
+    if orjson is not None and type_code in _ORJSON_NATIVE_OIDS:
+        return None
+    if type_code in _NUMERIC_OIDS:
+        return _decimal(decimal_mode)
+    if type_code in _TEMPORAL_OIDS:
+        return _isoformat
+    if type_code in _INTERVAL_OIDS:
+        return _seconds
+    if type_code in _UUID_OIDS or type_code in _TEXTUAL_OIDS:
+        return _text
+    if type_code in _BYTEA_OIDS:
+        return _base64
+    return None
+
+
+def column_converter(type_code, decimal_mode='str'):
+    """Conversión a tipos JSON nativos para una columna según su OID (None = ya es nativo)"""
+    converter = _scalar_converter(type_code, decimal_mode)
+    if converter is not None:
+        return converter
+    element = _ARRAY_OIDS.get(type_code)
+    if element is not None:
+        convert = _scalar_converter(element, decimal_mode)
+        if convert is None:
+            return None
+
+        def convert_array(value):
+            if value is None:
+                return None
+            return [convert_array(item) if isinstance(item, list) else convert(item) for item in value]
+        return convert_array
+    return None
+
+
+def column_converters(type_codes, decimal_mode='str'):
+    """Conversores por columna, calculados una sola vez a partir de los OIDs del cursor"""
+    return [column_converter(type_code, decimal_mode) for type_code in type_codes]
+
+
+def convert_rows(rows, converters):
+    """Aplica los conversores de columna a un lote (solo recorre las columnas que lo necesitan)"""
+    if not rows or not any(converters):
+        return rows
+    # Por columnas: map() recorre cada columna en C en lugar de tocar fila por fila
+    columns = list(zip(*rows))
+    for index, convert in enumerate(converters):
+        if convert is not None:
+            columns[index] = map(convert, columns[index])
+    return list(zip(*columns))
+
+
+def convert_batches(batches, converters):
+    """Generador de lotes convertidos"""
+    if not any(converters):
+        return batches
+    return (convert_rows(rows, converters) for rows in batches)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask con orjson (si está instalado) y conversión directa de tipos de PostgreSQL
+
+    Las claves se emiten en el orden original (las columnas conservan el orden del SELECT).
+    """
+
+    sort_keys = False
+    decimal_mode = 'str'
+
+    def default(self, o):
+        if isinstance(o, decimal.Decimal):
+            return float(o) if self.decimal_mode == 'float' else str(o)
+        if isinstance(o, (datetime.datetime, datetime.date, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, datetime.timedelta):
+            return o.total_seconds()
+        if isinstance(o, uuid.UUID):
+            return str(o)
+        if isinstance(o, (bytes, bytearray, memoryview)):
+            return base64.b64encode(bytes(o)).decode('ascii')
+        if isinstance(o, (set, frozenset)):
+            return list(o)
+        return super().default(o)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, **kwargs).decode('utf-8') if orjson is not None else self._stdlib_dumps(obj, **kwargs)
+
+    def dumps_bytes(self, obj, **kwargs):
+        if orjson is None:
+            return self._stdlib_dumps(obj, **kwargs).encode('utf-8')
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys'):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def _stdlib_dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', False)
+        if not kwargs.get('indent'):
+            kwargs.setdefault('separators', (',', ':'))
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        dump_args = {}
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args['indent'] = 2
+        else:
+            dump_args['separators'] = (',', ':')
+        return self._app.response_class(self.dumps_bytes(obj, **dump_args) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,208 @@
+import base64
+import hashlib
+import json
+import threading
+from bisect import bisect_left, bisect_right
+
+from query_guard import InvalidCursor
+
+TRAINING_FIELDS = ('question', 'content', 'training_data_type')
+TRAINING_TYPE_ALIASES = {'question_sql': 'sql'}
+SCHEMA_FIELDS = (
+    'schema', 'name', 'type', 'columns', 'primary_key', 'foreign_keys', 'indexes', 'row_estimate',
+    'partition_key', 'partitions'
+)
+# Alias aceptados en ?type= para los tipos de relación de la foto del esquema
+SCHEMA_TYPES = {
+    'table': 'BASE TABLE', 'base_table': 'BASE TABLE', 'view': 'VIEW',
+    'materialized_view': 'MATERIALIZED VIEW', 'matview': 'MATERIALIZED VIEW', 'foreign': 'FOREIGN'
+}
+
+
+def encode_cursor(after):
+    """Cursor opaco con la última clave entregada (paginación por clave, estable ante altas y bajas)"""
+    payload = json.dumps({'after': after}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        after = json.loads(raw)['after']
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor('Malformed cursor token')
+    if not isinstance(after, str):
+        raise InvalidCursor('Malformed cursor token')
+    return after
+
+
+def parse_fields(value, allowed):
+    """?fields=a,b → tupla validada (None = todos los campos)"""
+    if not value:
+        return None
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unsupported fields: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return fields
+
+
+def parse_page(args, max_limit):
+    """limit, offset y cursor de la query string; limit=None conserva la respuesta completa"""
+    limit = args.get('limit', type=int)
+    offset = args.get('offset', 0, type=int)
+    cursor = args.get('cursor') or None
+    if (limit is not None and limit < 0) or offset < 0:
+        raise ValueError('limit and offset must be non-negative')
+    if cursor and offset:
+        raise ValueError('Use either cursor or offset, not both')
+    if limit is not None:
+        limit = min(limit, max_limit)
+    return limit, offset, decode_cursor(cursor) if cursor else None
+
+
+def page_etag(tag, args):
+    """ETag de una página: versión del contenido + parámetros que la definen"""
+    canonical = '&'.join(f'{key}={value}' for key, value in sorted(args.items(multi=True)) if key != 'refresh')
+    return hashlib.sha256(f'{tag}|{canonical}'.encode('utf-8')).hexdigest()[:32]
+
+
+def _page(keys, start, end, limit, after, offset):
+    """Rango [inicio, fin) de la página dentro de `keys` (ordenadas) y la clave para el siguiente cursor"""
+    if after is not None:
+        start = max(start, bisect_right(keys, after, start, end))
+    else:
+        start = min(start + offset, end)
+    stop = end if limit is None else min(end, start + limit)
+    return start, stop, keys[stop - 1] if stop < end and stop > start else None
+
+
+def _text_match(needle, *values):
+    return any(needle in value.lower() for value in values if isinstance(value, str))
+
+
+class TrainingDataSnapshot:
+    """Copia en memoria de los datos de entrenamiento, ordenada por id
+
+    Se carga del almacén la primera vez y de nuevo solo tras invalidate() (train, remove, jobs).
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._generation = 0
+        self._loaded = None
+        self.loads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+    def get(self):
+        """(registros, ids ordenados, huella del contenido)"""
+        loaded = self._current()
+        if loaded is not None:
+            return loaded
+        with self._load_lock:
+            # Una sola carga a la vez: las peticiones concurrentes reutilizan la que acaba de terminar
+            loaded = self._current()
+            if loaded is not None:
+                return loaded
+            with self._lock:
+                generation = self._generation
+            data = self._loader()
+            records = data.to_dict('records') if hasattr(data, 'to_dict') else list(data or [])
+            records = [
+                {key: None if value != value else value for key, value in record.items()}  # NaN de pandas → None
+                for record in records
+            ]
+            for record in records:
+                record['id'] = str(record.get('id'))
+            records.sort(key=lambda record: record['id'])
+            ids = [record['id'] for record in records]
+            tag = hashlib.sha256(json.dumps(records, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+            with self._lock:
+                # Si hubo una invalidación durante la carga, la siguiente lectura vuelve a cargar
+                self._loaded = (generation, records, ids, tag)
+                self.loads += 1
+            return records, ids, tag
+
+    def _current(self):
+        with self._lock:
+            loaded = self._loaded
+            if loaded is not None and loaded[0] == self._generation:
+                return loaded[1:]
+        return None
+
+    def stats(self):
+        loaded = self._loaded
+        return {
+            'entries': len(loaded[1]) if loaded else None,
+            'stale': loaded is None or loaded[0] != self._generation,
+            'loads': self.loads
+        }
+
+
+def list_training_data(records, ids, data_type=None, search=None, fields=None, limit=None, after=None, offset=0):
+    """Página de datos de entrenamiento filtrada por tipo y texto; retorna (página, total, next_cursor)"""
+    data_type = TRAINING_TYPE_ALIASES.get(data_type, data_type)
+    if data_type or search:
+        needle = search.lower() if search else None
+        selected = [
+            index for index, record in enumerate(records)
+            if (not data_type or record.get('training_data_type') == data_type)
+            and (needle is None or _text_match(needle, record.get('question'), record.get('content'), record['id']))
+        ]
+        keys = [ids[index] for index in selected]
+    else:
+        selected = None
+        keys = ids
+    start, stop, last = _page(keys, 0, len(keys), limit, after, offset)
+    page = [records[index] for index in selected[start:stop]] if selected is not None else records[start:stop]
+    if fields is not None:
+        page = [dict({'id': record['id']}, **{field: record.get(field) for field in fields}) for record in page]
+    return page, len(keys), encode_cursor(last) if last is not None else None
+
+
+def list_schema(snapshot, types=None, prefix=None, search=None, fields=None, limit=None, after=None, offset=0,
+                schemas=None):
+    """Página de tablas de la foto del esquema; retorna ({tabla: definición}, total, next_cursor)"""
+    names = snapshot.table_names
+    start, end = 0, len(names)
+    if prefix:
+        # Los nombres están ordenados: el prefijo es un rango contiguo
+        start = bisect_left(names, prefix)
+        end = bisect_left(names, prefix + '\U0010ffff', start)
+    if types or search or schemas:
+        needle = search.lower() if search else None
+        tables = snapshot.tables
+        names = [
+            name for name in names[start:end]
+            if (not types or tables[name]['type'] in types)
+            and (not schemas or tables[name].get('schema') in schemas)
+            and (needle is None or needle in name.lower()
+                 or any(needle in column['name'].lower() for column in tables[name]['columns']))
+        ]
+        start, end = 0, len(names)
+    first, stop, last = _page(names, start, end, limit, after, offset)
+    if fields is None:
+        page = {name: snapshot.tables[name] for name in names[first:stop]}
+    else:
+        page = {name: {field: snapshot.tables[name].get(field) for field in fields} for name in names[first:stop]}
+    return page, end - start, encode_cursor(last) if last is not None else None
+
+
+def parse_schema_types(value):
+    """?type=table,view → conjunto de tipos de la foto del esquema"""
+    if not value:
+        return None
+    types = set()
+    for item in value.split(','):
+        item = item.strip().lower().replace(' ', '_')
+        if not item:
+            continue
+        if item not in SCHEMA_TYPES:
+            raise ValueError(f"Unsupported schema type: {item} (allowed: {', '.join(sorted(SCHEMA_TYPES))})")
+        types.add(SCHEMA_TYPES[item])
+    return types or None
@@ -0,0 +1,361 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+LLM_BACKENDS = ('vanna', 'gemini', 'openai', 'mock')
+
+
+class LLMError(Exception):
+    """Error devuelto por el backend de LLM"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LLMTimeout(LLMError):
+    """El backend no respondió dentro del tiempo configurado"""
+
+    def __init__(self, message):
+        super().__init__(message, retryable=True)
+
+
+class LLMUnavailable(LLMError):
+    """Se falla sin llamar al backend (los endpoints responden 503)"""
+
+
+class CircuitOpen(LLMUnavailable):
+    """El circuito está abierto tras varios fallos seguidos: se falla sin llamar al backend"""
+
+
+class LLMBusy(LLMUnavailable):
+    """Todas las llamadas concurrentes permitidas están ocupadas; no cuenta como fallo del backend"""
+
+
+def is_retryable(error):
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+    # Errores de red (requests.RequestException hereda de OSError)
+    return isinstance(error, (OSError, ConnectionError))
+
+
+def prompt_text(prompt):
+    """Texto plano de una lista de mensajes {'role', 'content'}"""
+    if isinstance(prompt, str):
+        return prompt
+    return '\n'.join(str(message.get('content', '')) for message in prompt)
+
+
+class MockLLM:
+    """Backend local y determinista para pruebas y benchmarks (no usa red ni claves)
+
+    Responde con el SQL de `responses` para la última pregunta del usuario, o con `default_sql`.
+    """
+
+    name = 'mock'
+
+    def __init__(self, responses=None, default_sql='SELECT 1 AS mock', latency=0.0):
+        self.responses = {self._normalize(q): sql for q, sql in (responses or {}).items()}
+        self.default_sql = default_sql
+        self.latency = latency
+        self.model = 'mock'
+
+    @staticmethod
+    def _normalize(question):
+        return ' '.join(question.lower().split())
+
+    def complete(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        question = prompt if isinstance(prompt, str) else next(
+            (m.get('content', '') for m in reversed(prompt) if m.get('role') == 'user'), ''
+        )
+        return self.responses.get(self._normalize(question), self.default_sql)
+
+
+class VannaRPCLLM:
+    """LLM alojado de Vanna: delega en el submit_prompt original de VannaDefault"""
+
+    name = 'vanna'
+
+    def __init__(self, submit_prompt, model):
+        self._submit_prompt = submit_prompt
+        self.model = model
+
+    def complete(self, prompt):
+        response = self._submit_prompt(prompt)
+        if response is None:
+            raise LLMError('Vanna returned an empty completion', retryable=True)
+        return response
+
+
+class GeminiLLM:
+    """Gemini directo con google-generativeai (dependencia opcional)"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key, model='gemini-1.5-flash', timeout=30.0, temperature=0.7):
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            raise ImportError('LLM_BACKEND=gemini requires the google-generativeai package')
+        genai.configure(api_key=api_key)
+        self.model = model
+        self.timeout = timeout
+        self.temperature = temperature
+        self._model = genai.GenerativeModel(model)
+
+    def complete(self, prompt):
+        response = self._model.generate_content(
+            prompt_text(prompt),
+            generation_config={'temperature': self.temperature},
+            request_options={'timeout': self.timeout}
+        )
+        return response.text
+
+
+class OpenAICompatibleLLM:
+    """Cualquier API compatible con /chat/completions (OpenAI, vLLM, Ollama, LM Studio...)"""
+
+    name = 'openai'
+
+    def __init__(self, base_url, model, api_key=None, timeout=30.0, temperature=0.7):
+        import requests
+        self._session = requests.Session()
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.temperature = temperature
+
+    def complete(self, prompt):
+        headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+        messages = [{'role': 'user', 'content': prompt}] if isinstance(prompt, str) else prompt
+        response = self._session.post(
+            f'{self.base_url}/chat/completions',
+            json={'model': self.model, 'messages': messages, 'temperature': self.temperature},
+            headers=headers,
+            timeout=self.timeout
+        )
+        if response.status_code >= 400:
+            raise LLMError(
+                f'LLM backend returned HTTP {response.status_code}: {response.text[:200]}',
+                retryable=response.status_code >= 500 or response.status_code == 429
+            )
+        return response.json()['choices'][0]['message']['content']
+
+
+class SingleFlight:
+    """Coalesce llamadas simultáneas con la misma clave: solo la primera ejecuta la función"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class CircuitBreaker:
+    """Abre el circuito tras `failure_threshold` fallos seguidos y prueba de nuevo tras `reset_timeout`"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpen('LLM circuit is open after repeated failures')
+                self.state = 'half_open'
+                self._trial = False
+            if self.state == 'half_open':
+                if self._trial:
+                    raise CircuitOpen('LLM circuit is half-open and a trial call is in progress')
+                self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.state == 'half_open' or (self.failure_threshold and self.failures >= self.failure_threshold):
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            retry_in = None
+            if self.state == 'open':
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 3)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'times_opened': self.times_opened,
+                'retry_in': retry_in
+            }
+
+
+class LLMClient:
+    """Capa común sobre el backend: coalescencia, timeout, reintentos con backoff y circuit breaker"""
+
+    def __init__(self, backend, timeout=30.0, retries=2, backoff=0.5, failure_threshold=5,
+                 reset_timeout=30.0, max_concurrency=32, queue_timeout=10.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-call')
+        # Un hueco por worker, ocupado hasta que la llamada termina de verdad (también tras un timeout):
+        # con hueco libre la llamada empieza al instante y el timeout mide solo al backend
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._metrics = {
+            'calls': 0, 'completions': 0, 'failures': 0, 'retries': 0, 'timeouts': 0, 'rejected': 0, 'busy': 0
+        }
+
+    def submit_prompt(self, prompt, **kwargs):
+        """Sustituye a submit_prompt de Vanna: prompts idénticos simultáneos comparten la respuesta"""
+        key = hashlib.sha256(json.dumps(prompt, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return self.flight.do(key, lambda: self._complete(prompt))
+
+    def _complete(self, prompt):
+        self._count('calls')
+        error = None
+        for attempt in range(self.retries + 1):
+            # La espera por un hueco es carga, no un fallo del backend: no pasa por el circuit breaker
+            if not self._slots.acquire(timeout=self.queue_timeout or None):
+                self._count('busy')
+                raise LLMBusy(f'All {self.max_concurrency} LLM calls are busy; gave up after {self.queue_timeout:.1f}s')
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                self._slots.release()
+                self._count('rejected')
+                raise
+            try:
+                result = self._call_with_timeout(prompt)
+            except Exception as e:
+                self.breaker.record_failure()
+                self._count('failures')
+                error = e
+                if attempt >= self.retries or not is_retryable(e):
+                    break
+                self._count('retries')
+                # Backoff exponencial con jitter para no sincronizar los reintentos
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random() / 2))
+                continue
+            self.breaker.record_success()
+            self._count('completions')
+            return result
+        raise error
+
+    def _call_with_timeout(self, prompt):
+        """Llama al backend con un hueco ya reservado, que se libera cuando la llamada termina"""
+        try:
+            future = self._executor.submit(self._run, prompt)
+        except BaseException:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=self.timeout or None)
+        except FutureTimeout:
+            # La llamada sigue en su worker (no se puede interrumpir) y conserva el hueco hasta terminar
+            self._count('timeouts')
+            raise LLMTimeout(f'LLM backend did not answer within {self.timeout:.1f}s')
+
+    def _run(self, prompt):
+        try:
+            return self.backend.complete(prompt)
+        finally:
+            self._slots.release()
+
+    def _count(self, key):
+        with self._lock:
+            self._metrics[key] += 1
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics.update({
+            'backend': self.backend.name,
+            'model': self.backend.model,
+            'timeout': self.timeout,
+            'retries': self.retries,
+            'max_concurrency': self.max_concurrency,
+            'queue_timeout': self.queue_timeout,
+            'coalesced': self.flight.coalesced,
+            'in_flight': self.flight.in_flight(),
+            'circuit': self.breaker.stats()
+        })
+        return metrics
+
+
+def create_llm_backend(name, model, api_key=None, vanna_submit_prompt=None, base_url=None, timeout=30.0,
+                       mock_responses_path=None, mock_sql='SELECT 1 AS mock', mock_latency=0.0):
+    """Backend de LLM según la configuración (LLM_BACKEND)"""
+    if name == 'vanna':
+        return VannaRPCLLM(vanna_submit_prompt, model)
+    if name == 'gemini':
+        return GeminiLLM(api_key, model=model.split('/', 1)[-1], timeout=timeout)
+    if name == 'openai':
+        if not base_url:
+            raise ValueError('LLM_BACKEND=openai requires LLM_BASE_URL')
+        return OpenAICompatibleLLM(base_url, model, api_key=api_key, timeout=timeout)
+    if name == 'mock':
+        responses = None
+        if mock_responses_path:
+            with open(mock_responses_path, encoding='utf-8') as f:
+                responses = json.load(f)
+        return MockLLM(responses, default_sql=mock_sql, latency=mock_latency)
+    raise ValueError(f'Unsupported LLM backend: {name}')
@@ -0,0 +1,166 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, has_request_context, request
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas, en formato Prometheus"""
+
+    def __init__(self, name, help_text, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['counts']):
+                    label_text = _format_labels(self.label_names, labels, 'le="%s"' % bound)
+                    lines.append(f'{self.name}_bucket{label_text} {count}')
+                label_text = _format_labels(self.label_names, labels, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{label_text} {series["count"]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {series["count"]}')
+        return lines
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+def render_gauges(name, help_text, values):
+    """Líneas Prometheus para un gauge calculado en el momento ({etiquetas: valor})"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for labels, value in values.items():
+        label_text = _format_labels([k for k, _ in labels], [v for _, v in labels])
+        lines.append(f'{name}{label_text} {value}')
+    return lines
+
+
+request_duration = Histogram(
+    'vanna_request_duration_seconds', 'Duración total de la petición HTTP', ('endpoint', 'method', 'status')
+)
+phase_duration = Histogram(
+    'vanna_phase_duration_seconds', 'Duración de cada fase de la petición', ('endpoint', 'phase')
+)
+requests_total = Counter('vanna_requests_total', 'Peticiones HTTP atendidas', ('endpoint', 'method', 'status'))
+slow_requests_total = Counter('vanna_slow_requests_total', 'Peticiones por encima del umbral lento', ('endpoint',))
+compression_bytes_total = Counter(
+    'vanna_compression_bytes_total', 'Bytes de respuesta antes (in) y después (out) de comprimir', ('encoding', 'stage')
+)
+compression_ratio = Histogram(
+    'vanna_compression_ratio', 'Ratio de compresión (bytes originales / comprimidos) por respuesta', ('encoding',),
+    buckets=(1.5, 2, 3, 5, 8, 12, 20, 40)
+)
+compression_duration = Histogram(
+    'vanna_compression_duration_seconds', 'CPU dedicada a comprimir cada respuesta', ('encoding',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+
+# Petición en curso de las rutas nativas de asgi_server, que no tienen contexto de Flask:
+# {'endpoint', 'phase_timings', 'request_sql'}
+asgi_request = ContextVar('asgi_request', default=None)
+
+
+def current_endpoint():
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    state = asgi_request.get()
+    if state is not None:
+        return state['endpoint']
+    return 'background'
+
+
+def _request_state(key, default):
+    """Dato de la petición actual (g en Flask, asgi_request en ASGI) o None fuera de una petición"""
+    if has_request_context():
+        return g.setdefault(key, default)
+    state = asgi_request.get()
+    return state[key] if state is not None else None
+
+
+@contextmanager
+def span(phase):
+    """Mide una fase y la registra en el histograma y en los tiempos de la petición actual"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        phase_duration.observe(elapsed, current_endpoint(), phase)
+        timings = _request_state('phase_timings', {})
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + elapsed
+
+
+def record_sql(sql):
+    """Guarda el SQL de la petición actual para el log de peticiones lentas"""
+    statements = _request_state('request_sql', [])
+    if statements is not None:
+        statements.append(sql)
+
+
+def server_timing_header(timings, total=None):
+    parts = [f'{phase};dur={elapsed * 1000:.2f}' for phase, elapsed in timings.items()]
+    if total is not None:
+        parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def render_all(extra_lines=()):
+    lines = []
+    for metric in (request_duration, phase_duration, requests_total, slow_requests_total,
+                   compression_bytes_total, compression_ratio, compression_duration):
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
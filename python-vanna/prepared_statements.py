@@ -0,0 +1,201 @@
+import decimal
+import hashlib
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+
+from sql_utils import SQL_TOKENS, normalize_sql
+
+# Solo se extraen literales cuyo tipo PostgreSQL puede inferir del contexto: a la derecha de una
+# comparación, LIKE, BETWEEN ... AND, LIMIT/OFFSET o dentro de una lista IN (...). Los de la lista
+# SELECT, ORDER BY 1 o DATE '...' cambiarían de significado o de tipo como parámetros
+_PARAM_CONTEXT = re.compile(
+    r"""(?:(?:<=|>=|<>|!=|=|<|>)|\b(?:I?LIKE|BETWEEN|AND|LIMIT|OFFSET)|\bIN\s*\((?:\s*\$\d+(?:::\w+)?\s*,)*)\s*$""",
+    re.I
+)
+
+
+# SQLSTATE: la sesión no tiene la sentencia / ya existe una con ese nombre
+INVALID_STATEMENT_NAME = '26000'
+DUPLICATE_PREPARED_STATEMENT = '42P05'
+REJECTED_CLASSES = ('42', '22', '0A')
+
+
+def _literal_value(kind, text):
+    if kind == 'string':
+        return text[1:-1].replace("''", "'")
+    if text.isdigit():
+        return int(text)
+    return decimal.Decimal(text)
+
+
+def _literal_type(value):
+    """Tipo que PostgreSQL da al literal numérico (integer, bigint o numeric)
+
+    Sin él el parámetro toma el tipo de la columna: `int_col > 10.5` se prepararía como
+    `int_col > $1::integer` y EXECUTE redondearía 10.5 a 11. Los literales entre comillas
+    no llevan tipo (son `unknown` y se resuelven por contexto igual que un parámetro).
+    """
+    if isinstance(value, str):
+        return None
+    if isinstance(value, int):
+        if -2 ** 31 <= value < 2 ** 31:
+            return 'integer'
+        if -2 ** 63 <= value < 2 ** 63:
+            return 'bigint'
+    return 'numeric'
+
+
+@lru_cache(maxsize=2048)
+def parameterize(sql: str):
+    """(plantilla con $1..$n, valores) o None si la sentencia no tiene literales extraíbles
+
+    Los parámetros numéricos llevan el tipo de su literal ($1::numeric), no el de la columna.
+    """
+    text = normalize_sql(sql)
+    template = ''
+    params = []
+    position = 0
+    for match in SQL_TOKENS.finditer(text):
+        kind = match.lastgroup
+        if kind not in ('string', 'number'):
+            continue
+        before = template + text[position:match.start()]
+        if not _PARAM_CONTEXT.search(before[-200:]):
+            continue
+        value = _literal_value(kind, match.group())
+        params.append(value)
+        literal_type = _literal_type(value)
+        # El tipo forma parte de la plantilla: 10 y 10.5 nunca comparten sentencia preparada
+        template = f'{before}${len(params)}' + (f'::{literal_type}' if literal_type else '')
+        position = match.end()
+    if not params:
+        return None
+    return template + text[position:], tuple(params)
+
+
+def statement_name(template):
+    """Nombre estable por plantilla (el mismo en todas las conexiones)"""
+    return 'vanna_' + hashlib.sha256(template.encode('utf-8')).hexdigest()[:20]
+
+
+class PreparedStatements:
+    """PREPARE por conexión de las consultas generadas que solo difieren en sus literales
+
+    Cada plantilla se prepara en una conexión la primera vez que la usa (tras verse `threshold`
+    veces en el proceso) y se reutiliza con EXECUTE; cada conexión guarda como mucho
+    `max_per_connection` sentencias y libera con DEALLOCATE las menos usadas. La plantilla se
+    envuelve con LIMIT $n para acotar las filas igual que el cursor de servidor.
+    """
+
+    def __init__(self, enabled=True, threshold=2, max_per_connection=100, max_templates=5000):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_per_connection = max_per_connection
+        self.max_templates = max_templates
+        self._connections = weakref.WeakKeyDictionary()
+        self._seen = OrderedDict()
+        self._rejected = {}
+        self._lock = threading.Lock()
+        self._metrics = {'prepared': 0, 'reused': 0, 'deallocated': 0, 'failed': 0, 'below_threshold': 0}
+
+    def _count(self, template):
+        with self._lock:
+            calls = self._seen.pop(template, 0) + 1
+            self._seen[template] = calls
+            while len(self._seen) > self.max_templates:
+                self._seen.popitem(last=False)
+            return calls
+
+    def statement(self, conn, sql, row_limit):
+        """(EXECUTE ..., parámetros) para ejecutar `sql` ya preparada en `conn`, o None"""
+        if not self.enabled:
+            return None
+        parameterized = parameterize(sql)
+        if parameterized is None:
+            return None
+        template, params = parameterized
+        if template in self._rejected:
+            return None
+        if self._count(template) < self.threshold:
+            with self._lock:
+                self._metrics['below_threshold'] += 1
+            return None
+
+        name = statement_name(template)
+        statements = self._connections.get(conn)
+        if statements is None:
+            statements = self._connections.setdefault(conn, OrderedDict())
+        if name in statements:
+            statements.move_to_end(name)
+            with self._lock:
+                self._metrics['reused'] += 1
+        elif not self._prepare(conn, statements, name, template, len(params)):
+            return None
+        placeholders = ', '.join(['%s'] * (len(params) + 1))
+        # LIMIT NULL equivale a sin límite
+        return f'EXECUTE {name} ({placeholders})', params + (int(row_limit) if row_limit else None,)
+
+    def _prepare(self, conn, statements, name, template, param_count):
+        evicted = []
+        while len(statements) >= self.max_per_connection:
+            evicted.append(statements.popitem(last=False)[0])
+        # Todo en una ida y vuelta; el SAVEPOINT deja la transacción usable si PREPARE falla
+        # (p. ej. un parámetro cuyo tipo no se puede inferir): la plantilla se ejecuta como texto
+        commands = ['SAVEPOINT vanna_prepare;']
+        commands += [f'DEALLOCATE {old};' for old in evicted]
+        commands.append(
+            f'PREPARE {name} AS SELECT * FROM ({template}) AS _prepared LIMIT ${param_count + 1};'
+        )
+        commands.append('RELEASE SAVEPOINT vanna_prepare;')
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(' '.join(commands))
+        except Exception as e:
+            with conn.cursor() as cursor:
+                cursor.execute('ROLLBACK TO SAVEPOINT vanna_prepare; RELEASE SAVEPOINT vanna_prepare;')
+            pgcode = getattr(e, 'pgcode', None)
+            if pgcode == DUPLICATE_PREPARED_STATEMENT:
+                # El nombre deriva de la plantilla: la sesión ya la tenía preparada
+                statements[name] = template
+                return True
+            if pgcode == INVALID_STATEMENT_NAME:
+                # El registro no coincidía con la sesión: se libera todo y se empieza de cero
+                with conn.cursor() as cursor:
+                    cursor.execute('DEALLOCATE ALL')
+                self._connections.pop(conn, None)
+            with self._lock:
+                self._metrics['failed'] += 1
+                # Errores de la propia plantilla (sintaxis, tipos no inferibles, no soportado): no se
+                # vuelve a intentar; los transitorios (timeouts, bloqueos) sí
+                if pgcode and pgcode[:2] in REJECTED_CLASSES:
+                    self._rejected[template] = True
+                    while len(self._rejected) > self.max_templates:
+                        self._rejected.pop(next(iter(self._rejected)))
+            return False
+        statements[name] = template
+        with self._lock:
+            self._metrics['prepared'] += 1
+            self._metrics['deallocated'] += len(evicted)
+        return True
+
+    def forget(self, conn, error=None):
+        """Olvida las sentencias de `conn` si `error` indica que la sesión ya no las tiene"""
+        if error is None or getattr(error, 'pgcode', None) == INVALID_STATEMENT_NAME:
+            self._connections.pop(conn, None)
+
+    def stats(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics.update({
+                'enabled': self.enabled,
+                'threshold': self.threshold,
+                'max_per_connection': self.max_per_connection,
+                'templates': len(self._seen),
+                'rejected_templates': len(self._rejected)
+            })
+        metrics['connections'] = len(self._connections)
+        metrics['statements'] = sum(len(statements) for statements in list(self._connections.values()))
+        return metrics
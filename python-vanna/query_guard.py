@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
+import time
+
+from sql_utils import normalize_sql, top_level_code
+
+GUARD_ACTIONS = ('reject', 'rewrite')
+_TRAILING_LIMIT_RE = re.compile(r'\bLIMIT\s+(\d+)(?:\s+OFFSET\s+\d+)?\s*$', re.I)
+_ORDER_BY_RE = re.compile(r'\bORDER\s+BY\b', re.I)
+_ROW_LIMIT_RE = re.compile(r'\b(?:LIMIT|OFFSET|FETCH)\b', re.I)
+
+
+class QueryRejected(Exception):
+    """El plan estimado de la consulta supera los umbrales configurados"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+class InvalidCursor(Exception):
+    """Token de paginación inválido o manipulado"""
+
+
+class QueryGuard:
+    """Verificación previa con EXPLAIN y paginación automática del SQL generado"""
+
+    def __init__(self, enabled=False, max_cost=100000.0, max_rows=10000, action='rewrite',
+                 page_size=1000, secret=None, cursor_ttl=3600):
+        if action not in GUARD_ACTIONS:
+            raise ValueError(f'Unsupported guard action: {action}')
+        self.enabled = enabled
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.page_size = page_size
+        self.cursor_ttl = cursor_ttl
+        # Sin secreto configurado los cursores solo valen en el proceso que los emitió
+        self.ephemeral_secret = not secret
+        self._secret = (secret or os.urandom(32).hex()).encode('utf-8')
+        self.checked = 0
+        self.rejected = 0
+        self.rewritten = 0
+
+    def estimate(self, conn, sql):
+        """Costo y filas estimadas por el planificador (EXPLAIN sin ejecutar la consulta)"""
+        with conn.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {normalize_sql(sql)}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]['Plan']
+        return {'cost': root.get('Total Cost'), 'rows': root.get('Plan Rows'), 'node': root.get('Node Type')}
+
+    def decide(self, sql, estimate, explain=None):
+        """Retorna (sql a ejecutar, tamaño de página o None); lanza QueryRejected si corresponde
+
+        `explain(sql)` estima el plan de la primera página: si el gate saltó por costo solo se pagina
+        cuando ese plan es más barato, porque cada página vuelve a ejecutar la consulta.
+        """
+        self.checked += 1
+        over_cost = self.max_cost and estimate['cost'] is not None and estimate['cost'] > self.max_cost
+        over_rows = self.max_rows and estimate['rows'] is not None and estimate['rows'] > self.max_rows
+        if not (over_cost or over_rows):
+            return sql, None
+        if self.action == 'reject':
+            self.rejected += 1
+            reason = 'cost' if over_cost else 'rows'
+            raise QueryRejected(f'Query rejected by cost gate: estimated {reason} above threshold', estimate)
+        text = normalize_sql(sql)
+        limit = _TRAILING_LIMIT_RE.search(text)
+        if limit and int(limit.group(1)) <= self.page_size and not over_cost:
+            return sql, None
+        top_level = top_level_code(text)
+        if _ORDER_BY_RE.search(top_level) and _ROW_LIMIT_RE.search(top_level):
+            # Paginar por encima de su propio LIMIT obligaría a reordenar y cambiaría el resultado pedido
+            self.rejected += 1
+            raise QueryRejected('Query rejected by cost gate: an ordered and limited result cannot be paginated',
+                                estimate)
+        page = self.paginate(sql, 0, self.page_size)
+        if over_cost:
+            page_estimate = explain(page) if explain else None
+            page_cost = page_estimate['cost'] if page_estimate else None
+            if page_cost is None or page_cost > self.max_cost:
+                self.rejected += 1
+                raise QueryRejected('Query rejected by cost gate: estimated cost above threshold '
+                                    'and paginating does not make it cheaper', dict(estimate, page_cost=page_cost))
+        self.rewritten += 1
+        return page, self.page_size
+
+    @staticmethod
+    def paginate(sql, offset, page_size):
+        """Página de la consulta con un orden estable entre ejecuciones
+
+        Con ORDER BY propio se conserva su orden y se añade LIMIT/OFFSET. Sin él, PostgreSQL no garantiza
+        el mismo orden en cada ejecución: se ordena por la fila completa como texto (equivale a
+        ORDER BY 1..k y admite columnas de cualquier tipo).
+        """
+        text = normalize_sql(sql)
+        window = f'LIMIT {int(page_size)} OFFSET {int(offset)}'
+        top_level = top_level_code(text)
+        if _ORDER_BY_RE.search(top_level) and not _ROW_LIMIT_RE.search(top_level):
+            return f'{text} {window}'
+        return f'SELECT * FROM ({text}) AS _page ORDER BY _page::text {window}'
+
+    def encode_cursor(self, sql, offset, page_size, question=None, database=None):
+        """Token firmado para pedir la página siguiente sin volver a generar el SQL
+
+        Lleva la base de datos y la caducidad dentro de la firma: no se puede reutilizar en otra base.
+        """
+        payload = json.dumps({'sql': sql, 'offset': offset, 'page_size': page_size, 'question': question,
+                              'database': database, 'expires': int(time.time() + self.cursor_ttl)},
+                             separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        signature = hmac.new(self._secret, payload, hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(signature + payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, token, database=None):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        except (ValueError, TypeError):
+            raise InvalidCursor('Malformed cursor token')
+        signature, payload = raw[:16], raw[16:]
+        expected = hmac.new(self._secret, payload, hashlib.sha256).digest()[:16]
+        if not hmac.compare_digest(signature, expected):
+            raise InvalidCursor('Invalid cursor token signature')
+        state = json.loads(payload.decode('utf-8'))
+        if state.get('database') != database:
+            raise InvalidCursor('Cursor token was issued for another database')
+        if not state.get('expires') or state['expires'] < time.time():
+            raise InvalidCursor('Cursor token expired')
+        return state
+
+    def page_info(self, sql, offset, page_size, row_count, question=None, database=None):
+        """Metadatos de paginación para la respuesta (una página llena implica que puede haber más)"""
+        has_more = row_count >= page_size
+        return {
+            'offset': offset,
+            'page_size': page_size,
+            'has_more': has_more,
+            'next_cursor': self.encode_cursor(sql, offset + page_size, page_size, question, database)
+            if has_more else None
+        }
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'action': self.action,
+            'max_cost': self.max_cost,
+            'max_rows': self.max_rows,
+            'page_size': self.page_size,
+            'cursor_ttl': self.cursor_ttl,
+            'shared_secret': not self.ephemeral_secret,
+            'checked': self.checked,
+            'rejected': self.rejected,
+            'rewritten': self.rewritten
+        }
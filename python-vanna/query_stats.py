@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sql_utils import query_shape
+
+QUERY_STATS_SORTS = ('total_time', 'mean_time', 'max_time', 'calls', 'rows', 'bytes', 'errors')
+
+
+def fingerprint(sql: str) -> str:
+    """Identificador estable de la forma de una consulta (mismo valor para distintos literales)"""
+    return hashlib.sha256(query_shape(sql).encode('utf-8')).hexdigest()[:16]
+
+
+class QueryStats:
+    """Estadísticas agregadas por huella de consulta y base de datos, al estilo de pg_stat_statements
+
+    Los agregados viven en memoria y se guardan cada `snapshot_interval` segundos en `path`;
+    al arrancar se retoman desde la última instantánea.
+    """
+
+    def __init__(self, path=None, max_entries=1000, snapshot_interval=300.0, max_questions=5, enabled=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.snapshot_interval = snapshot_interval
+        self.max_questions = max_questions
+        self.enabled = enabled
+        self.since = time.time()
+        self.last_snapshot = None
+        self.evicted = 0
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if enabled and path:
+            self._load()
+
+    def record(self, sql, database, elapsed, rows=0, question=None, error=False):
+        """Registra una ejecución; retorna la clave de la entrada para atribuirle bytes después"""
+        if not self.enabled:
+            return None
+        query = query_shape(sql)
+        key = (database, hashlib.sha256(query.encode('utf-8')).hexdigest()[:16])
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Se hace sitio antes de insertar: la entrada nueva (aún sin tiempo) no puede ser la víctima
+                if len(self._entries) >= self.max_entries:
+                    self._evict()
+                entry = self._entries[key] = {
+                    'fingerprint': key[1], 'database': database, 'query': query, 'sample': sql,
+                    'calls': 0, 'errors': 0, 'cache_hits': 0, 'total_time': 0.0, 'max_time': 0.0,
+                    'rows': 0, 'bytes': 0, 'questions': [], 'first_seen': now, 'last_seen': now
+                }
+            entry['calls'] += 1
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            entry['rows'] += rows or 0
+            entry['last_seen'] = now
+            if error:
+                entry['errors'] += 1
+            if question:
+                questions = entry['questions']
+                if question in questions:
+                    questions.remove(question)
+                questions.append(question)
+                del questions[:-self.max_questions]
+            self._dirty = True
+        return key
+
+    def record_cache_hit(self, sql, database):
+        """Una respuesta servida desde la caché de resultados no toca la base de datos: solo se cuenta"""
+        if not self.enabled:
+            return
+        key = (database, fingerprint(sql))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['cache_hits'] += 1
+                self._dirty = True
+
+    def add_response_bytes(self, executed, size):
+        """Reparte los bytes de una respuesta entre las consultas que la produjeron, según sus filas
+
+        `executed` es una lista de (clave, filas) de la petición.
+        """
+        executed = [(key, rows) for key, rows in executed if key is not None]
+        if not executed or not size:
+            return
+        weights = sum((rows or 0) + 1 for _, rows in executed)
+        with self._lock:
+            for key, rows in executed:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['bytes'] += int(size * ((rows or 0) + 1) / weights)
+            self._dirty = True
+
+    def _evict(self):
+        # Como pg_stat_statements: se descarta el 10 % con menos tiempo acumulado
+        victims = sorted(self._entries, key=lambda key: self._entries[key]['total_time'])
+        for key in victims[:max(1, len(victims) // 10)]:
+            del self._entries[key]
+            self.evicted += 1
+
+    @staticmethod
+    def _public(entry):
+        calls = entry['calls']
+        return {
+            'fingerprint': entry['fingerprint'],
+            'database': entry['database'],
+            'query': entry['query'],
+            'sample': entry['sample'],
+            'calls': calls,
+            'errors': entry['errors'],
+            'cache_hits': entry['cache_hits'],
+            'total_time_ms': round(entry['total_time'] * 1000, 3),
+            'mean_time_ms': round(entry['total_time'] * 1000 / calls, 3) if calls else None,
+            'max_time_ms': round(entry['max_time'] * 1000, 3),
+            'rows': entry['rows'],
+            'mean_rows': round(entry['rows'] / calls, 1) if calls else None,
+            'bytes': entry['bytes'],
+            'questions': list(entry['questions']),
+            'first_seen': entry['first_seen'],
+            'last_seen': entry['last_seen']
+        }
+
+    def top(self, limit=20, sort='total_time', database=None):
+        """Las `limit` consultas con mayor valor de `sort`"""
+        if sort not in QUERY_STATS_SORTS:
+            raise ValueError(f'Unsupported sort: {sort}')
+        with self._lock:
+            entries = [dict(entry, questions=list(entry['questions'])) for entry in self._entries.values()
+                       if database is None or entry['database'] == database]
+        if sort == 'mean_time':
+            keyfunc = lambda entry: entry['total_time'] / entry['calls'] if entry['calls'] else 0.0
+        else:
+            keyfunc = lambda entry: entry[sort]
+        entries.sort(key=keyfunc, reverse=True)
+        return [self._public(entry) for entry in entries[:limit]]
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.since = time.time()
+            self.evicted = 0
+            self._dirty = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'fingerprints': len(self._entries),
+                'max_entries': self.max_entries,
+                'evicted': self.evicted,
+                'since': self.since,
+                'path': self.path,
+                'snapshot_interval': self.snapshot_interval,
+                'last_snapshot': self.last_snapshot
+            }
+
+    def save(self):
+        """Escribe la instantánea de forma atómica (solo si hubo cambios)"""
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {
+                'since': self.since,
+                'saved_at': time.time(),
+                'entries': [dict(entry, questions=list(entry['questions'])) for entry in self._entries.values()]
+            }
+            self._dirty = False
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.last_snapshot = data['saved_at']
+        return True
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.since = data.get('since', self.since)
+        self.last_snapshot = data.get('saved_at')
+        for entry in data.get('entries', []):
+            self._entries[(entry['database'], entry['fingerprint'])] = entry
+
+    def start(self):
+        """Hilo que guarda instantáneas periódicas"""
+        if not self.enabled or not self.path or not self.snapshot_interval or self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name='query-stats-snapshot', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.save()
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_interval):
+            try:
+                self.save()
+            except OSError:
+                pass
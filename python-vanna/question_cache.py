@@ -0,0 +1,135 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza una pregunta para la búsqueda exacta en caché"""
+    text = unicodedata.normalize('NFKD', question.strip().lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[¿?¡!.,;:"\']+', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class QuestionSQLCache:
+    """Caché pregunta→SQL con búsqueda exacta normalizada, similitud opcional, TTL y LRU"""
+
+    def __init__(self, max_size=512, ttl=3600, similarity_threshold=0.0, embed_fn=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed_fn = embed_fn
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def semantic_enabled(self):
+        return self.embed_fn is not None and self.similarity_threshold > 0
+
+    @property
+    def generation(self):
+        """Versión actual del conjunto de entrenamiento que respalda la caché"""
+        return self._generation
+
+    def _embed(self, text):
+        # numpy solo hace falta con la búsqueda por similitud: se importa aquí para no cargarlo al arrancar
+        import numpy as np
+        vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry['created'] > self.ttl
+
+    def get(self, question: str):
+        """Busca el SQL de una pregunta; retorna None si no está en caché"""
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry['sql']
+            if not self.semantic_enabled or not self._entries:
+                self.misses += 1
+                return None
+            generation = self._generation
+
+        # El embedding se calcula fuera del lock porque puede ser una llamada remota
+        try:
+            query_vector = self._embed(key)
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            if generation == self._generation:
+                for entry_key, entry in self._entries.items():
+                    vector = entry.get('vector')
+                    if vector is None or self._expired(entry, now) or vector.shape != query_vector.shape:
+                        continue
+                    score = float(vector @ query_vector)
+                    if score >= best_score:
+                        best_key, best_score = entry_key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key]['sql']
+
+    def put(self, question: str, sql: str, generation=None):
+        """Guarda el SQL generado; se descarta si el entrenamiento cambió mientras se generaba"""
+        if not sql:
+            return
+        key = normalize_question(question)
+        vector = None
+        if self.semantic_enabled:
+            try:
+                vector = self._embed(key)
+            except Exception:
+                vector = None
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = {'sql': sql, 'vector': vector, 'created': time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Vacía la caché tras un cambio en los datos de entrenamiento"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self.invalidations += 1
+
+    def stats(self):
+        """Contadores de aciertos y fallos de la caché"""
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'semantic_enabled': self.semantic_enabled,
+                'similarity_threshold': self.similarity_threshold,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,212 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from sql_utils import normalize_sql, extract_tables, is_cacheable, is_read_only
+
+ALL_TABLES = '*'
+
+
+class LocalCacheBackend:
+    """Backend en memoria del proceso con límite LRU (también sirve como sustituto en pruebas)
+
+    Los valores se guardan serializados, como en Redis: cada get retorna una copia nueva y ni quien
+    guardó el resultado ni quien lo lee pueden modificar la entrada compartida.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires'] and entry['expires'] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            raw = entry['value']
+        return pickle.loads(raw)
+
+    def set(self, key, value, tables, ttl):
+        raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            expires = time.monotonic() + ttl if ttl > 0 else 0
+            self._entries[key] = {'value': raw, 'tables': tables, 'expires': expires}
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_tables(self, tables):
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._by_table.get(table, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._by_table.clear()
+            return count
+
+    def size(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry['tables']:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+
+class RedisCacheBackend:
+    """Backend compartido entre procesos sobre Redis (requiere el paquete redis)"""
+
+    def __init__(self, url, prefix='vanna:results'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _table_key(self, table):
+        return f'{self.prefix}:table:{table}'
+
+    def get(self, key):
+        raw = self.client.get(f'{self.prefix}:{key}')
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, tables, ttl):
+        pipe = self.client.pipeline()
+        if ttl > 0:
+            pipe.set(f'{self.prefix}:{key}', pickle.dumps(value), ex=int(max(ttl, 1)))
+        else:
+            pipe.set(f'{self.prefix}:{key}', pickle.dumps(value))
+        for table in tables:
+            pipe.sadd(self._table_key(table), key)
+        pipe.execute()
+
+    def invalidate_tables(self, tables):
+        keys = set()
+        for table in tables:
+            keys |= {k.decode() if isinstance(k, bytes) else k for k in self.client.smembers(self._table_key(table))}
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.delete(f'{self.prefix}:{key}')
+        for table in tables:
+            pipe.delete(self._table_key(table))
+        pipe.execute()
+        return len(keys)
+
+    def clear(self):
+        count = 0
+        for key in self.client.scan_iter(f'{self.prefix}:*'):
+            self.client.delete(key)
+            count += 1
+        return count
+
+    def size(self):
+        return None
+
+
+class ResultCache:
+    """Caché de resultados de execute_sql con dependencias por tabla y TTL"""
+
+    def __init__(self, backend, ttl=60, max_rows=5000, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(sql: str, namespace: str = '') -> str:
+        normalized = normalize_sql(sql)
+        return hashlib.sha256(f'{namespace}\x00{normalized}'.encode('utf-8')).hexdigest()
+
+    def lookup(self, sql: str, namespace: str = ''):
+        """Retorna el resultado en caché o None si no existe o la sentencia no es cacheable"""
+        if not self.enabled or not is_cacheable(sql):
+            return None
+        value = self.backend.get(self.make_key(sql, namespace))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def store(self, sql: str, result: dict, namespace: str = ''):
+        """Guarda el resultado de una lectura si cumple los límites de tamaño"""
+        if not self.enabled or not is_cacheable(sql):
+            return
+        if result.get('row_count', 0) > self.max_rows:
+            return
+        tables = extract_tables(sql) or {ALL_TABLES}
+        self.backend.set(self.make_key(sql, namespace), result, tables, self.ttl)
+        with self._lock:
+            self.stores += 1
+
+    def invalidate_for(self, sql: str):
+        """Invalida los resultados que dependen de las tablas que modifica una sentencia"""
+        if not self.enabled or is_read_only(sql):
+            return 0
+        tables = extract_tables(sql)
+        if tables:
+            evicted = self.backend.invalidate_tables(tables | {ALL_TABLES})
+        else:
+            # Sentencia de escritura sin tablas reconocibles (DO, CALL...): se vacía todo
+            evicted = self.backend.clear()
+        with self._lock:
+            self.evictions += evicted
+        return evicted
+
+    def clear(self):
+        evicted = self.backend.clear()
+        with self._lock:
+            self.evictions += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'backend': type(self.backend).__name__,
+                'size': self.backend.size(),
+                'ttl': self.ttl,
+                'max_rows': self.max_rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def create_result_cache(backend_name='local', redis_url=None, max_entries=256, **kwargs):
+    """Construye la caché de resultados según la configuración"""
+    if backend_name == 'redis':
+        backend = RedisCacheBackend(redis_url or 'redis://localhost:6379/0')
+    else:
+        backend = LocalCacheBackend(max_entries=max_entries)
+    return ResultCache(backend, **kwargs)
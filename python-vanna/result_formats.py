@@ -0,0 +1,161 @@
+import json
+
+# pyarrow es opcional (solo para format=arrow) y caro de importar: se carga en el primer uso
+pa = None
+_pyarrow_checked = False
+
+RESULT_FORMATS = ('records', 'columnar', 'rows')
+BINARY_FORMATS = ('arrow',)
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+def build_result(columns, batches, fmt='records'):
+    """Construye la respuesta a partir de los lotes del cursor en el formato pedido
+
+    - records: lista de objetos {columna: valor} (formato original)
+    - columnar: un arreglo de valores por columna, alineado con 'columns'
+    - rows: lista de filas (arreglos) más la cabecera 'columns'
+    """
+    row_count = 0
+    if fmt == 'columnar':
+        data = [[] for _ in columns]
+        for rows in batches:
+            row_count += len(rows)
+            for values, column_values in zip(data, zip(*rows)):
+                values.extend(column_values)
+    elif fmt == 'rows':
+        data = []
+        for rows in batches:
+            row_count += len(rows)
+            data.extend(rows)
+    else:
+        data = []
+        for rows in batches:
+            row_count += len(rows)
+            data.extend(dict(zip(columns, row)) for row in rows)
+
+    result = {
+        'data': data,
+        'columns': columns,
+        'row_count': row_count
+    }
+    if fmt != 'records':
+        result['format'] = fmt
+    return result
+
+
+def _load_pyarrow():
+    global pa, _pyarrow_checked
+    if not _pyarrow_checked:
+        try:
+            import pyarrow
+            pa = pyarrow
+        except ImportError:
+            pass
+        _pyarrow_checked = True
+    return pa
+
+
+def arrow_available():
+    return _load_pyarrow() is not None
+
+
+def _arrow_type(type_code, precision=None, scale=None):
+    """Tipo Arrow para un OID de PostgreSQL (None = inferir de los valores)"""
+    if type_code == 1700:
+        if precision and scale is not None and 0 < precision <= 38:
+            return pa.decimal128(precision, scale)
+        return pa.float64()
+    return {
+        16: pa.bool_(),
+        20: pa.int64(),
+        21: pa.int16(),
+        23: pa.int32(),
+        26: pa.int64(),
+        700: pa.float32(),
+        701: pa.float64(),
+        18: pa.string(),
+        19: pa.string(),
+        25: pa.string(),
+        1042: pa.string(),
+        1043: pa.string(),
+        114: pa.string(),
+        3802: pa.string(),
+        2950: pa.string(),
+        1186: pa.duration('us'),
+        17: pa.binary(),
+        1082: pa.date32(),
+        1083: pa.time64('us'),
+        1114: pa.timestamp('us'),
+        1184: pa.timestamp('us', tz='UTC')
+    }.get(type_code)
+
+
+def _arrow_converter(type_code):
+    """Conversión previa de valores que Arrow no acepta directamente"""
+    if type_code in (114, 3802):
+        return lambda value: None if value is None else json.dumps(value, default=str)
+    if type_code in (2950, 18, 19):
+        return lambda value: None if value is None else str(value)
+    if type_code == 17:
+        return lambda value: None if value is None else bytes(value)
+    return None
+
+
+def arrow_schema(description, metadata=None):
+    """Esquema Arrow derivado de cursor.description"""
+    _load_pyarrow()
+    fields = []
+    for desc in description:
+        arrow_type = _arrow_type(desc[1], getattr(desc, 'precision', None), getattr(desc, 'scale', None))
+        fields.append(pa.field(desc[0], arrow_type if arrow_type is not None else pa.string()))
+    return pa.schema(fields, metadata={k: str(v) for k, v in (metadata or {}).items()})
+
+
+class _ChunkSink:
+    """Destino de escritura que acumula los bytes IPC para ir enviándolos por partes"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_arrow_ipc(description, batches, metadata=None):
+    """Genera un stream Arrow IPC con un RecordBatch por lote del cursor"""
+    schema = arrow_schema(description, metadata)
+    converters = [_arrow_converter(desc[1]) for desc in description]
+    for index, desc in enumerate(description):
+        if desc[1] == 1700 and pa.types.is_floating(schema.field(index).type):
+            converters[index] = lambda value: None if value is None else float(value)
+    known = [_arrow_type(desc[1]) is not None or desc[1] == 1700 for desc in description]
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, schema)
+    yield sink.drain()
+    for rows in batches:
+        arrays = []
+        for index, values in enumerate(zip(*rows)):
+            if converters[index]:
+                values = [converters[index](value) for value in values]
+            elif not known[index]:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=schema.field(index).type))
+        if rows:
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,367 @@
+import hashlib
+import json
+from functools import cached_property
+import threading
+import time
+
+# Esquemas del sistema: nunca se introspeccionan aunque coincidan con SCHEMA_INCLUDE
+SYSTEM_SCHEMAS = ('pg_catalog', 'information_schema', 'pg_toast%', 'pg_temp_%', 'pg_toast_temp_%')
+
+# Filtro de esquemas común a las consultas: patrones LIKE de inclusión y exclusión
+SCHEMA_FILTER = """n.nspname LIKE ANY (%(include)s::text[])
+      AND NOT (n.nspname LIKE ANY (%(exclude)s::text[]))"""
+
+# Introspección completa en una sola consulta a pg_catalog: tablas, columnas, tipos,
+# nulabilidad, valores por defecto, clave primaria, claves foráneas e índices. Las particiones
+# hijas se pliegan en su tabla padre (clave de partición, número de particiones y filas estimadas)
+SCHEMA_QUERY = f"""
+    SELECT n.nspname AS table_schema,
+           c.relname AS table_name,
+           CASE c.relkind
+               WHEN 'v' THEN 'VIEW'
+               WHEN 'm' THEN 'MATERIALIZED VIEW'
+               WHEN 'f' THEN 'FOREIGN'
+               ELSE 'BASE TABLE'
+           END AS table_type,
+           CASE WHEN c.relkind = 'p' THEN pg_get_partkeydef(c.oid) END AS partition_key,
+           CASE WHEN c.relkind = 'p' THEN (
+               SELECT count(*) FROM pg_partition_tree(c.oid) pt WHERE pt.isleaf
+           ) END AS partitions,
+           CASE WHEN c.relkind = 'p' THEN (
+               SELECT sum(GREATEST(pc.reltuples, 0))
+               FROM pg_partition_tree(c.oid) pt
+               JOIN pg_class pc ON pc.oid = pt.relid
+               WHERE pt.isleaf
+           ) ELSE GREATEST(c.reltuples, 0) END AS row_estimate,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'name', a.attname,
+                          'type', format_type(a.atttypid, NULL),
+                          'full_type', format_type(a.atttypid, a.atttypmod),
+                          'nullable', NOT a.attnotnull,
+                          'default', pg_get_expr(d.adbin, d.adrelid),
+                          'indexed', EXISTS (
+                              SELECT 1 FROM pg_index i WHERE i.indrelid = c.oid AND a.attnum = ANY (i.indkey)
+                          )
+                      ) ORDER BY a.attnum)
+               FROM pg_attribute a
+               LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+               WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+           ), '[]') AS columns,
+           COALESCE((
+               SELECT json_agg(a.attname ORDER BY array_position(con.conkey, a.attnum))
+               FROM pg_constraint con
+               JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = ANY (con.conkey)
+               WHERE con.conrelid = c.oid AND con.contype = 'p'
+           ), '[]') AS primary_key,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'name', con.conname,
+                          'references', con.confrelid::regclass::text,
+                          'definition', pg_get_constraintdef(con.oid)
+                      ) ORDER BY con.conname)
+               FROM pg_constraint con
+               WHERE con.conrelid = c.oid AND con.contype = 'f'
+           ), '[]') AS foreign_keys,
+           COALESCE((
+               SELECT json_agg(json_build_object(
+                          'name', ic.relname,
+                          'unique', i.indisunique,
+                          'primary', i.indisprimary,
+                          'definition', pg_get_indexdef(i.indexrelid)
+                      ) ORDER BY ic.relname)
+               FROM pg_index i
+               JOIN pg_class ic ON ic.oid = i.indexrelid
+               WHERE i.indrelid = c.oid
+           ), '[]') AS indexes
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE {SCHEMA_FILTER}
+      AND c.relkind::text = ANY (%(relkinds)s)
+      AND NOT (%(collapse_partitions)s AND c.relispartition)
+      AND (pg_has_role(c.relowner, 'USAGE')
+           OR has_table_privilege(c.oid, 'SELECT, INSERT, UPDATE, DELETE, TRUNCATE, REFERENCES, TRIGGER'))
+    ORDER BY n.nspname, c.relname;
+"""
+
+# Estadísticas de columnas en bloque (una consulta para todas las tablas): inherited = true
+# son las de una tabla particionada sobre todas sus particiones. Las particiones hijas plegadas
+# se descartan aquí para no traer filas de pg_stats que nadie usa
+COLUMN_STATS_QUERY = f"""
+    SELECT s.schemaname, s.tablename, s.attname, s.inherited, s.n_distinct, s.null_frac
+    FROM pg_stats s
+    JOIN pg_namespace n ON n.nspname = s.schemaname
+    JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = s.tablename
+    WHERE {SCHEMA_FILTER}
+      AND NOT (%(collapse_partitions)s AND c.relispartition);
+"""
+
+# Estadísticas de planificador: cambian con cada ANALYZE y no forman parte de la estructura
+TABLE_STATS_KEYS = ('row_estimate',)
+COLUMN_STATS_KEYS = ('n_distinct', 'null_frac')
+
+# Checksum barato del catálogo: cualquier DDL crea nuevas versiones (xmin) de estas filas
+CATALOG_CHECKSUM_QUERY = f"""
+    SELECT md5(COALESCE(string_agg(x, ',' ORDER BY x), '')) FROM (
+        SELECT 'r' || c.oid || ':' || c.xmin AS x
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE {SCHEMA_FILTER}
+        UNION ALL
+        SELECT 'a' || a.attrelid || '.' || a.attnum || ':' || a.xmin
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE {SCHEMA_FILTER} AND a.attnum > 0
+        UNION ALL
+        SELECT 'c' || con.oid || ':' || con.xmin
+        FROM pg_constraint con JOIN pg_namespace n ON n.oid = con.connamespace
+        WHERE {SCHEMA_FILTER}
+        UNION ALL
+        SELECT 'd' || d.oid || ':' || d.xmin
+        FROM pg_attrdef d
+        JOIN pg_class c ON c.oid = d.adrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE {SCHEMA_FILTER}
+    ) s;
+"""
+
+
+def like_pattern(pattern):
+    """Patrón de configuración (con * como comodín) → patrón LIKE"""
+    escaped = pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace('*', '%')
+
+
+def parse_schema_list(value, default=()):
+    """SCHEMA_INCLUDE=public,ventas_* → ['public', 'ventas_*']"""
+    if value is None:
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def table_key(schema, name):
+    """Las tablas de public conservan el nombre sin calificar (son visibles con el search_path por defecto)"""
+    return name if schema == 'public' else f'{schema}.{name}'
+
+
+def approximate(value):
+    """Una cifra significativa (~30K): estable entre ANALYZE para que el DDL no cambie por poco"""
+    if value is None or value < 1:
+        return None
+    rounded = int(float(f'{value:.0e}'))
+    for size, suffix in ((10 ** 9, 'B'), (10 ** 6, 'M'), (10 ** 3, 'K')):
+        if rounded >= size:
+            return f'~{rounded // size}{suffix}'
+    return f'~{rounded}'
+
+
+def distinct_estimate(column, row_estimate):
+    """n_distinct de pg_stats como texto (negativo = fracción de las filas)"""
+    n_distinct = column.get('n_distinct')
+    if n_distinct is None:
+        return None
+    if n_distinct == -1:
+        return 'unique'
+    if n_distinct < 0:
+        n_distinct = -n_distinct * (row_estimate or 0)
+    estimate = approximate(n_distinct)
+    return f'{estimate} distinct' if estimate else None
+
+
+def _digest(value):
+    canonical = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def fingerprint_tables(tables):
+    """Hash estable de la estructura del esquema (sin estadísticas: un ANALYZE no cambia la versión)"""
+    structure = {
+        key: dict(
+            {name: value for name, value in table.items() if name not in TABLE_STATS_KEYS},
+            columns=[{name: value for name, value in column.items() if name not in COLUMN_STATS_KEYS}
+                     for column in table['columns']]
+        )
+        for key, table in tables.items()
+    }
+    return _digest(structure)
+
+
+class SchemaSnapshot:
+    """Foto inmutable del esquema con huella (fingerprint) y número de versión"""
+
+    def __init__(self, tables, catalog_checksum, version, fingerprint=None):
+        self.tables = tables
+        # Orden de Python (no la intercalación de PostgreSQL) para paginar por nombre con bisect
+        self.table_names = sorted(tables)
+        self.catalog_checksum = catalog_checksum
+        self.version = version
+        self.loaded_at = time.time()
+        self.fingerprint = fingerprint or fingerprint_tables(tables)
+
+    @cached_property
+    def content_hash(self):
+        """Hash de la foto completa, estadísticas incluidas: valida los ETag de get_schema"""
+        return _digest(self.tables)
+
+    def table_ddl(self, table_name, stats=True):
+        """DDL simple de una tabla a partir de la foto del esquema
+
+        Las notas de columna (indexada, valores distintos) orientan al LLM hacia filtros baratos.
+        Con stats=False se omiten las estimaciones de pg_stats (filas y valores distintos).
+        """
+        table = self.tables[table_name]
+        row_estimate = table.get('row_estimate') if stats else None
+        header = []
+        if table['type'] != 'BASE TABLE':
+            header.append(f"-- {table['type']}")
+        if table.get('partitions') is not None:
+            header.append(f"-- {table['partitions']} partitions")
+        rows = approximate(row_estimate)
+        if rows:
+            header.append(f'-- {rows} rows')
+        entries = []
+        for col in table['columns']:
+            notes = [note for note in (
+                'indexed' if col.get('indexed') else None,
+                distinct_estimate(col, row_estimate) if stats else None
+            ) if note]
+            entries.append((
+                f"    {col['name']} {col['full_type']} {'NULL' if col['nullable'] else 'NOT NULL'}",
+                ', '.join(notes)
+            ))
+        if table['primary_key']:
+            entries.append((f"    PRIMARY KEY ({', '.join(table['primary_key'])})", ''))
+        for fk in table['foreign_keys']:
+            entries.append((f"    CONSTRAINT {fk['name']} {fk['definition']}", ''))
+        lines = []
+        for index, (line, note) in enumerate(entries):
+            line += ',' if index < len(entries) - 1 else ''
+            lines.append(f'{line} -- {note}' if note else line)
+        partition_by = f" PARTITION BY {table['partition_key']}" if table.get('partition_key') else ''
+        return ''.join(f'{line}\n' for line in header) + \
+            f"CREATE TABLE {table_name} (\n" + "\n".join(lines) + f"\n){partition_by};"
+
+
+class SchemaCache:
+    """Mantiene la foto del esquema en memoria y la recarga solo cuando cambia el catálogo
+
+    `include`/`exclude` son listas de esquemas (admiten * como comodín). Las tablas fuera de
+    public se identifican como esquema.tabla.
+    """
+
+    def __init__(self, schema='public', check_interval=30.0, include=None, exclude=None,
+                 collapse_partitions=True, include_views=True, include_materialized_views=True,
+                 column_stats=True):
+        self.include = list(include) if include else [schema]
+        self.exclude = list(exclude or [])
+        self.schema = ','.join(self.include)
+        self.check_interval = check_interval
+        self.collapse_partitions = collapse_partitions
+        self.include_views = include_views
+        self.include_materialized_views = include_materialized_views
+        self.column_stats = column_stats
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._version = 0
+        self.loads = 0
+        self.checks = 0
+
+    def _params(self):
+        relkinds = ['r', 'p', 'f']
+        if self.include_views:
+            relkinds.append('v')
+        if self.include_materialized_views:
+            relkinds.append('m')
+        return {
+            'include': [like_pattern(pattern) for pattern in self.include],
+            'exclude': [like_pattern(pattern) for pattern in self.exclude] + list(SYSTEM_SCHEMAS),
+            'relkinds': relkinds,
+            'collapse_partitions': self.collapse_partitions
+        }
+
+    def _load(self, cursor, params):
+        cursor.execute(SCHEMA_QUERY, params)
+        tables = {}
+        for (table_schema, table_name, table_type, partition_key, partitions, row_estimate,
+             columns, primary_key, foreign_keys, indexes) in cursor.fetchall():
+            table = {
+                'schema': table_schema,
+                'name': table_name,
+                'type': table_type,
+                'columns': columns,
+                'primary_key': primary_key,
+                'foreign_keys': foreign_keys,
+                'indexes': indexes
+            }
+            if partition_key is not None:
+                table['partition_key'] = partition_key
+                table['partitions'] = partitions
+            if self.column_stats:
+                table['row_estimate'] = int(row_estimate) if row_estimate is not None else None
+            tables[table_key(table_schema, table_name)] = table
+        if self.column_stats and tables:
+            cursor.execute(COLUMN_STATS_QUERY, params)
+            stats = {}
+            for schema, table_name, column, inherited, n_distinct, null_frac in cursor.fetchall():
+                stats[(table_key(schema, table_name), column, inherited)] = (n_distinct, null_frac)
+            for key, table in tables.items():
+                inherited = 'partition_key' in table
+                for column in table['columns']:
+                    n_distinct, null_frac = stats.get((key, column['name'], inherited), (None, None))
+                    column['n_distinct'] = n_distinct
+                    column['null_frac'] = null_frac
+        return tables
+
+    def get(self, get_connection, return_connection, force=False):
+        """Retorna la foto vigente; verifica el checksum como mucho cada check_interval"""
+        with self._lock:
+            snapshot = self._snapshot
+            fresh = time.monotonic() - self._checked_at < self.check_interval
+            if snapshot is not None and fresh and not force:
+                return snapshot
+
+            params = self._params()
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(CATALOG_CHECKSUM_QUERY, params)
+                checksum = cursor.fetchone()[0]
+                self.checks += 1
+                if snapshot is None or force or checksum != snapshot.catalog_checksum:
+                    tables = self._load(cursor, params)
+                    self.loads += 1
+                    fingerprint = fingerprint_tables(tables)
+                    if snapshot is None or snapshot.fingerprint != fingerprint:
+                        self._version += 1
+                    snapshot = SchemaSnapshot(tables, checksum, self._version, fingerprint)
+                    self._snapshot = snapshot
+                cursor.close()
+                conn.commit()
+            finally:
+                return_connection(conn)
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def invalidate(self):
+        """Obliga a verificar el catálogo en la siguiente lectura"""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'schema': self.schema,
+            'include': self.include,
+            'exclude': self.exclude,
+            'collapse_partitions': self.collapse_partitions,
+            'include_views': self.include_views,
+            'include_materialized_views': self.include_materialized_views,
+            'column_stats': self.column_stats,
+            'version': snapshot.version if snapshot else None,
+            'fingerprint': snapshot.fingerprint if snapshot else None,
+            'tables': len(snapshot.tables) if snapshot else 0,
+            'loads': self.loads,
+            'checks': self.checks,
+            'check_interval': self.check_interval
+        }
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+
+UPDATE_MODES = ('incremental', 'full')
+
+
+def ddl_hash(ddl: str) -> str:
+    return hashlib.sha256(ddl.encode('utf-8')).hexdigest()
+
+
+class SchemaTrainingState:
+    """Registro persistente de qué DDL de cada tabla está entrenado (hash e id en Vanna)"""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Tablas entrenadas para esta base de datos: {tabla: {'hash': ..., 'id': ...}}"""
+        with self._lock:
+            return dict(self._read().get(self.key, {}))
+
+    def save(self, tables):
+        with self._lock:
+            data = self._read()
+            data[self.key] = tables
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def existing_ddl_ids(training_data):
+    """Mapa hash→id de los DDL que ya están en el almacén de entrenamiento"""
+    ids = {}
+    if training_data is None:
+        return ids
+    records = training_data.to_dict('records') if hasattr(training_data, 'to_dict') else training_data
+    for record in records:
+        if record.get('training_data_type') == 'ddl' and record.get('content'):
+            ids.setdefault(ddl_hash(record['content']), record.get('id'))
+    return ids
+
+
+def plan_schema_update(snapshot, trained, existing=None, mode='incremental'):
+    """Calcula qué tablas entrenar, reentrenar o eliminar comparando hashes de DDL
+
+    El hash de cada tabla se calcula sobre el DDL sin estadísticas: un ANALYZE que mueve las
+    estimaciones de filas o valores distintos no provoca un reentrenamiento. Se entrena el DDL completo.
+    """
+    existing = existing or {}
+    plan = {'added': [], 'changed': [], 'removed': [], 'unchanged': [], 'adopted': []}
+    ddls = {}
+    for table in snapshot.tables:
+        ddl = snapshot.table_ddl(table)
+        digest = ddl_hash(snapshot.table_ddl(table, stats=False))
+        ddls[table] = (ddl, digest)
+        previous = trained.get(table)
+        if previous is None:
+            # El almacén guarda el DDL completo: se busca por el hash del texto entrenado
+            if mode == 'incremental' and ddl_hash(ddl) in existing:
+                # Ya estaba en el almacén (p. ej. entrenado antes de existir este registro)
+                plan['adopted'].append(table)
+            else:
+                plan['added'].append(table)
+        elif previous['hash'] != digest or mode == 'full':
+            plan['changed'].append(table)
+        else:
+            plan['unchanged'].append(table)
+    plan['removed'] = sorted(table for table in trained if table not in snapshot.tables)
+    return plan, ddls
+
+
+def apply_schema_update(vn, plan, ddls, trained, existing=None):
+    """Aplica el plan sobre Vanna y retorna (nuevo registro, errores)"""
+    existing = existing or {}
+    state = dict(trained)
+    errors = []
+
+    not_removed = set()
+    for table in plan['removed'] + plan['changed']:
+        training_id = state.get(table, {}).get('id')
+        try:
+            if training_id:
+                vn.remove_training_data(id=training_id)
+            if table in plan['removed']:
+                state.pop(table, None)
+        except Exception as e:
+            # Se conserva el registro anterior: la próxima ejecución vuelve a intentarlo
+            not_removed.add(table)
+            errors.append({'table': table, 'action': 'remove', 'error': str(e)})
+
+    for table in plan['adopted']:
+        ddl, digest = ddls[table]
+        state[table] = {'hash': digest, 'id': existing.get(ddl_hash(ddl))}
+
+    for table in plan['added'] + plan['changed']:
+        if table in not_removed:
+            # Entrenar el DDL nuevo dejaría dos versiones de la tabla en el almacén
+            continue
+        ddl, digest = ddls[table]
+        try:
+            training_id = vn.train(ddl=ddl)
+            state[table] = {'hash': digest, 'id': training_id}
+        except Exception as e:
+            if table in plan['changed']:
+                # El DDL anterior ya se eliminó: la próxima ejecución lo tratará como nuevo
+                state.pop(table, None)
+            errors.append({'table': table, 'action': 'train', 'error': str(e)})
+
+    return state, errors
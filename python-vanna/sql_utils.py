@@ -0,0 +1,175 @@
+import re
+from functools import lru_cache
+
+# Único tokenizador SQL del servidor: comentarios, identificadores entre comillas, literales
+# (con prefijo E/B/X/N/U&, simples y con $tag$), parámetros, números y espacios
+SQL_TOKENS = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<prefixed>(?<![\w$])(?:[EeBbXxNn]|[Uu]&)'(?:[^'\\]|''|\\.)*')
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*|)\$.*?\$(?P=tag)\$)
+  | (?P<param>\$\d+|%\(\w+\)s|%s)
+  | (?P<number>(?<![\w$.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.]))
+  | (?P<space>\s+)
+""", re.S | re.X)
+_LITERALS = ('prefixed', 'string', 'dollar')
+
+_NAME = r'(?:"(?:[^"]|"")+"|[A-Za-z_][A-Za-z0-9_$]*)'
+_QUALIFIED = rf'{_NAME}(?:\s*\.\s*{_NAME})*'
+_TABLE_REF_RE = re.compile(
+    rf'\b(?:FROM|JOIN|UPDATE|INTO|TABLE|TRUNCATE(?:\s+TABLE)?|ONLY)\s+((?:ONLY\s+)?{_QUALIFIED}(?:\s*(?:AS\s+)?{_NAME})?(?:\s*,\s*{_QUALIFIED}(?:\s*(?:AS\s+)?{_NAME})?)*)',
+    re.I
+)
+_NAME_RE = re.compile(_QUALIFIED)
+
+READ_KEYWORDS = {'SELECT', 'WITH', 'VALUES', 'TABLE', 'SHOW', 'EXPLAIN'}
+WRITE_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'TRUNCATE', 'COPY', 'CREATE', 'ALTER',
+    'DROP', 'GRANT', 'REVOKE', 'VACUUM', 'REINDEX', 'CLUSTER', 'REFRESH', 'CALL', 'DO', 'LOCK'
+}
+_RESERVED = {
+    'select', 'where', 'group', 'order', 'limit', 'offset', 'on', 'using', 'join', 'left', 'right',
+    'inner', 'outer', 'full', 'cross', 'natural', 'lateral', 'set', 'values', 'returning', 'as',
+    'union', 'except', 'intersect', 'having', 'window', 'for', 'only', 'table', 'default', 'fetch'
+}
+_VOLATILE_RE = re.compile(
+    r'\b(?:now|random|nextval|setval|clock_timestamp|statement_timestamp|timeofday|'
+    r'current_timestamp|current_date|current_time|localtime|localtimestamp|gen_random_uuid|pg_sleep)\b',
+    re.I
+)
+_LOCKING_RE = re.compile(r'\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b', re.I)
+
+
+def _code_only(sql: str) -> str:
+    """Reemplaza literales y comentarios por marcadores para analizar solo el código"""
+    def repl(match):
+        kind = match.lastgroup
+        if kind in _LITERALS:
+            return "''"
+        if kind in ('comment', 'space'):
+            return ' '
+        return match.group(0)
+    return SQL_TOKENS.sub(repl, sql)
+
+
+def normalize_sql(sql: str) -> str:
+    """Normaliza el texto SQL: sin comentarios, espacios colapsados y sin ';' final"""
+    def repl(match):
+        # Marcador que PostgreSQL no admite en el texto SQL: solo se colapsa el espacio entre
+        # tokens, nunca el de dentro de un literal ('a  b' y 'a b' son consultas distintas)
+        if match.lastgroup in ('comment', 'space'):
+            return '\x00'
+        return match.group(0)
+    text = re.sub('\x00+', ' ', SQL_TOKENS.sub(repl, sql))
+    return text.strip().rstrip(';').strip()
+
+
+_PUNCTUATION = ((re.compile(r'\(\s+'), '('), (re.compile(r'\s+\)'), ')'), (re.compile(r'\s*,\s*'), ', '),
+                (re.compile(r'\)(?=\w)'), ') '))
+_OPERATORS = re.compile(r'\s*(<=|>=|<>|!=|=|<|>)\s*')
+# IN (?, ?, ?) y VALUES (?, ?), (?, ?) colapsan a una sola forma sin importar cuántos valores haya
+_VALUE_LIST = re.compile(r'\(\?(?:, \?)*\)')
+_VALUE_ROWS = re.compile(r'\(\.\.\.\)(?:, \(\.\.\.\))+')
+
+
+@lru_cache(maxsize=2048)
+def query_shape(sql: str) -> str:
+    """Forma de la consulta: sin literales, comentarios ni diferencias de espacios o mayúsculas"""
+    parts = []
+    position = 0
+    for match in SQL_TOKENS.finditer(sql):
+        parts.append(sql[position:match.start()].lower())
+        kind = match.lastgroup
+        if kind in ('comment', 'space'):
+            parts.append(' ')
+        elif kind == 'ident':
+            parts.append(match.group())
+        else:
+            parts.append('?')
+        position = match.end()
+    parts.append(sql[position:].lower())
+    text = re.sub(r'\s+', ' ', ''.join(parts)).strip().rstrip(';').strip()
+    for pattern, replacement in _PUNCTUATION:
+        text = pattern.sub(replacement, text)
+    text = _OPERATORS.sub(r' \1 ', text)
+    text = _VALUE_LIST.sub('(...)', text)
+    return _VALUE_ROWS.sub('(...)', text)
+
+
+def _clean_name(name: str) -> str:
+    """Nombre de tabla sin esquema; los identificadores sin comillas se pasan a minúsculas"""
+    last = re.split(r'\s*\.\s*(?=(?:[^"]*"[^"]*")*[^"]*$)', name.strip())[-1]
+    if last.startswith('"'):
+        return last[1:-1].replace('""', '"')
+    return last.lower()
+
+
+def extract_tables(sql: str) -> set:
+    """Obtiene las tablas referenciadas por una sentencia"""
+    code = _code_only(sql)
+    tables = set()
+    for match in _TABLE_REF_RE.finditer(code):
+        for part in match.group(1).split(','):
+            part = re.sub(r'^\s*ONLY\s+', '', part, flags=re.I)
+            name = _NAME_RE.match(part.strip())
+            if not name:
+                continue
+            table = _clean_name(name.group(0))
+            if table and table.lower() not in _RESERVED:
+                tables.add(table)
+    return tables
+
+
+def top_level_code(sql: str) -> str:
+    """Código de la sentencia (sin literales ni comentarios) con el contenido de los paréntesis vaciado"""
+    code = re.sub(r'"(?:[^"]|"")*"', '""', _code_only(sql))
+    parts = []
+    depth = 0
+    for char in code:
+        if char == '(':
+            if not depth:
+                parts.append(char)
+            depth += 1
+        elif char == ')':
+            depth = max(0, depth - 1)
+            if not depth:
+                parts.append(char)
+        elif not depth:
+            parts.append(char)
+    return ''.join(parts)
+
+
+def is_multi_statement(sql: str) -> bool:
+    """Indica si el texto contiene más de una sentencia (un ';' final no cuenta)"""
+    return ';' in _code_only(sql).strip().rstrip(';')
+
+
+def statement_keywords(sql: str) -> set:
+    """Palabras clave (en mayúsculas) presentes en el código de la sentencia"""
+    code = _code_only(sql)
+    code = re.sub(r'"(?:[^"]|"")*"', ' ', code)
+    return {word.upper() for word in re.findall(r'[A-Za-z_]+', code)}
+
+
+def first_keyword(sql: str) -> str:
+    code = _code_only(sql).lstrip(' (')
+    match = re.match(r'[A-Za-z_]+', code)
+    return match.group(0).upper() if match else ''
+
+
+def is_read_only(sql: str) -> bool:
+    """Indica si la sentencia solo lee datos"""
+    if first_keyword(sql) not in READ_KEYWORDS:
+        return False
+    return not (statement_keywords(sql) & (WRITE_KEYWORDS - {'TABLE'}))
+
+
+def is_cacheable(sql: str) -> bool:
+    """Indica si el resultado de la sentencia puede guardarse en caché"""
+    if not is_read_only(sql) or first_keyword(sql) in ('SHOW', 'EXPLAIN'):
+        return False
+    if is_multi_statement(sql):
+        return False
+    code = _code_only(sql)
+    return not (_VOLATILE_RE.search(code) or _LOCKING_RE.search(code))
@@ -0,0 +1,84 @@
+STREAM_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json'
+}
+
+
+def iter_batches(cursor, batch_size):
+    """Recorre el cursor en lotes de fetchmany sin cargar todo el resultado"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_ndjson(columns, batches, dumps, extra=None):
+    """Genera NDJSON: cabecera con columnas, una fila por línea y un pie con el total"""
+    header = {'columns': columns}
+    if extra:
+        header.update(extra)
+    yield dumps(header) + '\n'
+    row_count = 0
+    try:
+        for rows in batches:
+            row_count += len(rows)
+            yield ''.join(dumps(list(row)) + '\n' for row in rows)
+    except Exception as e:
+        yield dumps({'error': str(e), 'row_count': row_count}) + '\n'
+        return
+    yield dumps({'row_count': row_count}) + '\n'
+
+
+def iter_json_array(columns, batches, dumps, extra=None):
+    """Genera un objeto JSON por partes con las filas como arreglos dentro de 'data'"""
+    head = dumps({'columns': columns, **(extra or {})})
+    yield head[:-1] + ', "data": ['
+    row_count = 0
+    error = None
+    try:
+        for rows in batches:
+            chunk = ','.join(dumps(list(row)) for row in rows)
+            yield (',' if row_count else '') + chunk
+            row_count += len(rows)
+    except Exception as e:
+        error = str(e)
+    tail = {'row_count': row_count}
+    if error is not None:
+        tail['error'] = error
+    yield '], ' + dumps(tail)[1:]
+
+
+def iter_stream(fmt, columns, batches, dumps, extra=None):
+    """Selecciona el generador según el formato de streaming"""
+    if fmt == 'ndjson':
+        return iter_ndjson(columns, batches, dumps, extra)
+    return iter_json_array(columns, batches, dumps, extra)
+
+
+class CursorBatches:
+    """Iterador de lotes sobre un cursor de servidor que libera la conexión al terminar o cerrarse"""
+
+    def __init__(self, cursor, batch_size, first, on_close):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.first = first
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            if self.first:
+                yield self.first
+                self.first = None
+                yield from iter_batches(self.cursor, self.batch_size)
+            self.close(success=True)
+        except BaseException:
+            self.close(success=False)
+            raise
+
+    def close(self, success=False):
+        if self.closed:
+            return
+        self.closed = True
+        self.on_close(success)
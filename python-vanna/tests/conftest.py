@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Los módulos del servidor se importan como módulos de primer nivel (igual que en vanna_server)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Los tests que importan vanna_server no deben escribir estadísticas ni fijaciones junto al código
+os.environ.setdefault('QUERY_STATS_PATH', '')
+os.environ.setdefault('ANSWER_PINS_PATH', '')
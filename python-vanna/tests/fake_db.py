@@ -0,0 +1,207 @@
+"""Conexiones falsas sobre SQLite con la interfaz de psycopg2 y de asyncpg que usa el servidor"""
+import re
+import sqlite3
+
+# Sentencias de sesión de PostgreSQL que SQLite no entiende y que no cambian los datos
+_SESSION_RE = re.compile(r'\s*(SET|RESET)\b', re.IGNORECASE)
+# current_user es una palabra clave en PostgreSQL (sin paréntesis); en SQLite se reemplaza por un literal
+_CURRENT_USER_RE = re.compile(r'\bcurrent_user\b(?!\s*\()', re.IGNORECASE)
+
+
+def statements(sql):
+    """Sentencias de un texto SQL (separación simple por ';', sin literales con ';')"""
+    return [part for part in sql.split(';') if part.strip()]
+
+
+def seed(path):
+    """Base SQLite con una tabla productos de 20 filas"""
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE productos (id integer primary key, nombre text, precio real)')
+    conn.executemany('INSERT INTO productos VALUES (?, ?, ?)', [(i, f'p{i}', i * 1.5) for i in range(1, 21)])
+    conn.commit()
+    conn.close()
+
+
+class FakeCursor:
+    """Cursor psycopg2: %s como parámetro, varias sentencias por execute y cursores con nombre"""
+
+    def __init__(self, conn, name=None):
+        self._cursor = conn.cursor()
+        self.name = name
+        self.itersize = 2000
+
+    @property
+    def description(self):
+        description = self._cursor.description
+        if not description:
+            return None
+        return [(column[0], 0, None, None, None, None, None) for column in description]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, params=None):
+        if _SESSION_RE.match(sql):
+            return
+        sql = _CURRENT_USER_RE.sub("'vanna'", sql)
+        for statement in statements(sql.replace('%s', '?')):
+            self._cursor.execute(statement, params or ())
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    """Conexión psycopg2 sobre un archivo SQLite"""
+    closed = 0
+    autocommit = False
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.create_function('version', 0, lambda: 'PostgreSQL 16 (fake)')
+        self._conn.create_function('current_database', 0, lambda: 'fake')
+        self.cancelled = 0
+
+    def cursor(self, name=None, **kwargs):
+        return FakeCursor(self._conn, name)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def cancel(self):
+        self.cancelled += 1
+
+    def close(self):
+        self.closed = 1
+        self._conn.close()
+
+
+class _Type:
+    def __init__(self, oid):
+        self.oid = oid
+        self.name = 'unknown'
+
+
+class _Attribute:
+    def __init__(self, name):
+        self.name = name
+        self.type = _Type(0)
+
+
+class _AsyncCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    async def fetch(self, size):
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+
+class FakeStatement:
+    """Sentencia preparada de asyncpg: se ejecuta al prepararla y guarda sus filas"""
+
+    def __init__(self, cursor):
+        self._attributes = [_Attribute(column[0]) for column in cursor.description or ()]
+        self._rows = cursor.fetchall()
+
+    def get_attributes(self):
+        return self._attributes
+
+    async def fetch(self):
+        return list(self._rows)
+
+    async def cursor(self):
+        return _AsyncCursor(list(self._rows))
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self._conn = conn
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+
+
+class FakeAsyncConnection:
+    """Conexión asyncpg: como en PostgreSQL, prepare no acepta varias sentencias"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+
+    def transaction(self):
+        return _Transaction(self._conn)
+
+    async def execute(self, sql):
+        if not _SESSION_RE.match(sql):
+            self._conn.execute(sql)
+
+    async def prepare(self, sql):
+        if len(statements(sql)) > 1:
+            raise RuntimeError('cannot insert multiple commands into a prepared statement')
+        return FakeStatement(self._conn.execute(sql))
+
+    async def fetchrow(self, sql):
+        return ('PostgreSQL 16 (fake)', 'fake', 'vanna')
+
+
+class _Acquire:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __await__(self):
+        return self._pool._open().__await__()
+
+    async def __aenter__(self):
+        return await self._pool._open()
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class FakeAsyncPool:
+    """Pool asyncpg mínimo: una conexión nueva por acquire"""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def _open(self):
+        return FakeAsyncConnection(self.path)
+
+    def acquire(self):
+        return _Acquire(self)
+
+    async def release(self, conn):
+        pass
+
+    def get_min_size(self):
+        return 1
+
+    get_max_size = get_size = get_idle_size = get_min_size
@@ -0,0 +1,133 @@
+import pytest
+
+from answer_store import AnswerStore
+from execution_budget import fetch_within_budget, load_budgets, widest_budget
+from fake_db import FakeConnection, seed
+from result_formats import build_result
+
+BUDGETS = load_budgets({'CHAT_SQL_MAX_ROWS': '15', 'ASK_SQL_MAX_ROWS': '5'})
+MATERIALIZED = widest_budget((BUDGETS['chat'], BUDGETS['ask']), 'materialized')
+PRICES = 'SELECT id, precio FROM productos ORDER BY id'
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'answers.db')
+    seed(path)
+    return path
+
+
+@pytest.fixture
+def store(path):
+    executed = []
+
+    def execute(sql, database, question):
+        """Como execute_materialized: formato 'rows' con el presupuesto más amplio de chat y ask"""
+        executed.append(sql)
+        conn = FakeConnection(path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            batches, truncation = fetch_within_budget(cursor, MATERIALIZED, 1000)
+            result = build_result([column[0] for column in cursor.description], batches, 'rows')
+            result['truncated'] = truncation is not None
+            return result
+        finally:
+            conn.close()
+
+    store = AnswerStore(execute, promote_threshold=3, refresh_workers=1)
+    store.executed = executed
+    yield store
+    store.stop()
+
+
+def drain(store):
+    """Espera a que terminen los refrescos encolados (un solo worker)"""
+    store._executor.submit(lambda: None).result()
+
+
+def write(path, sql):
+    conn = FakeConnection(path)
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_pin_materializes_and_serves_without_executing_again(store):
+    store.pin('precios', 'tienda', PRICES)
+    sql, result, extra = store.lookup('¿Precios?', 'tienda', 'rows')
+    assert sql == PRICES
+    assert result['data'][0] == (1, 1.5)
+    assert extra['materialized']['pinned'] is True
+    assert store.executed == [PRICES]
+    assert store.lookup('precios', 'otra_base') is None
+
+
+def test_pin_rejects_writes(store):
+    with pytest.raises(ValueError):
+        store.pin('borrar', 'tienda', 'DELETE FROM productos')
+
+
+def test_frequent_question_is_promoted(store):
+    for _ in range(2):
+        store.observe('precios', 'tienda', PRICES)
+    assert store.get('precios', 'tienda') is None
+    store.observe('precios', 'tienda', PRICES)
+    drain(store)
+    sql, result, extra = store.lookup('precios', 'tienda')
+    assert extra['materialized']['pinned'] is False
+    assert store.stats()['promotions'] == 1
+
+
+def test_training_change_demotes_promoted_and_outdates_generated_pins(store):
+    for _ in range(3):
+        store.observe('precios', 'tienda', PRICES)
+    store.pin('generada', 'tienda', 'SELECT count(*) FROM productos', generated=True)
+    store.pin('manual', 'tienda', 'SELECT max(precio) FROM productos')
+    drain(store)
+
+    assert store.invalidate_generated() == 2
+    assert store.get('precios', 'tienda') is None
+    assert store.lookup('generada', 'tienda') is None
+    assert store.lookup('manual', 'tienda') is not None
+
+    # La ruta normal vuelve a generar el SQL de la fijada y esta lo adopta
+    store.observe('generada', 'tienda', 'SELECT count(id) FROM productos')
+    drain(store)
+    sql, result, _ = store.lookup('generada', 'tienda', 'rows')
+    assert sql == 'SELECT count(id) FROM productos'
+    assert result['data'] == [(20,)]
+
+
+def test_write_refreshes_only_answers_on_that_table(store, path):
+    store.pin('precios', 'tienda', PRICES)
+    store.pin('otra', 'tienda', 'SELECT count(*) FROM sqlite_master')
+    store.pin('precios', 'sucursal', PRICES)
+    update = 'UPDATE productos SET precio = 0 WHERE id = 1'
+    write(path, update)
+
+    assert store.invalidate_for('SELECT * FROM productos', 'tienda') == 0
+    assert store.invalidate_for(update, 'tienda') == 1
+    drain(store)
+    assert store.lookup('precios', 'tienda', 'rows')[1]['data'][0] == (1, 0.0)
+    assert store.get('otra', 'tienda').refreshes == 1
+    assert store.get('precios', 'sucursal').refreshes == 1
+
+
+def test_result_is_trimmed_to_each_endpoint_budget(store):
+    store.pin('precios', 'tienda', PRICES)
+    _, chat, _ = store.lookup('precios', 'tienda', 'rows', BUDGETS['chat'])
+    _, ask, _ = store.lookup('precios', 'tienda', 'records', BUDGETS['ask'])
+
+    assert chat['row_count'] == 15 and chat['truncated'] is True
+    assert 'truncation_reason' not in chat
+    assert ask['row_count'] == 5
+    assert ask['data'][-1] == {'id': 5, 'precio': 7.5}
+    assert ask['truncation_reason'] == 'max_rows'
+    assert ask['limits']['max_rows'] == 5
+
+    small = dict(BUDGETS['ask'], max_rows=0, max_response_bytes=40)
+    _, trimmed, _ = store.lookup('precios', 'tienda', 'rows', small)
+    assert 0 < trimmed['row_count'] < 5
+    assert trimmed['truncation_reason'] == 'max_response_bytes'
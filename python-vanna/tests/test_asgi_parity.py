@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+import asgi_server
+import vanna_server
+from fake_db import FakeAsyncPool, FakeConnection, seed
+from schema_snapshot import SchemaCache
+
+GENERATED = {'¿Cuántos productos hay?': 'SELECT count(*) AS total FROM productos'}
+
+REQUESTS = [
+    ('/api/v0/run_sql', {'sql': 'SELECT id, nombre FROM productos WHERE id <= 3 ORDER BY id'}),
+    ('/api/v0/run_sql', {'sql': 'SELECT id, precio FROM productos WHERE id <= 2 ORDER BY id', 'format': 'columnar'}),
+    ('/api/v0/run_sql', {'sql': "INSERT INTO productos VALUES (21, 'p21', 1.0)"}),
+    ('/api/v0/run_sql', {'sql': 'UPDATE productos SET precio = 0 WHERE id = 1; SELECT id, precio FROM productos WHERE id = 1'}),
+    ('/api/v0/run_sql', {'sql': 'CREATE TABLE categorias (id integer)'}),
+    ('/api/v0/run_sql', {'sql': 'SELECT count(*) AS total FROM productos', 'format': 'rows'}),
+    ('/api/v0/run_sql', {'sql': 'SELECT * FROM no_existe'}),
+    ('/api/v0/run_sql', {'sql': 'SELECT 1', 'format': 'xml'}),
+    ('/api/v0/run_sql', {}),
+    ('/api/v0/chat', {'question': '¿Cuántos productos hay?'}),
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Las dos aplicaciones sobre la misma base SQLite (replay la vuelve a crear antes de cada una)"""
+    path = str(tmp_path / 'vanna.db')
+    monkeypatch.setattr(vanna_server, 'get_connection', lambda read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server, 'generate_sql_cached', GENERATED.get)
+    monkeypatch.setattr(vanna_server.prepared_statements, 'enabled', False)
+    monkeypatch.setattr(vanna_server.answer_store, 'enabled', False)
+    monkeypatch.setattr(asgi_server, 'db_pool', FakeAsyncPool(path))
+    invalidations = []
+    monkeypatch.setattr(SchemaCache, 'invalidate', lambda self: invalidations.append(self))
+    yield path, invalidations
+    vanna_server.result_cache.clear()
+
+
+def flask_post(url, body):
+    response = vanna_server.app.test_client().post(url, json=body)
+    return response.status_code, response.get_json()
+
+
+def asgi_post(url, body):
+    async def post():
+        transport = httpx.ASGITransport(app=asgi_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post(url, json=body)
+
+    response = asyncio.run(post())
+    return response.status_code, response.json()
+
+
+def replay(database, post):
+    """Ejecuta REQUESTS desde una base recién creada: (respuestas, invalidaciones del esquema)"""
+    path, invalidations = database
+    if os.path.exists(path):
+        os.remove(path)
+    seed(path)
+    vanna_server.result_cache.clear()
+    del invalidations[:]
+    responses = [(url, body, *post(url, body)) for url, body in REQUESTS]
+    return responses, len(invalidations)
+
+
+def test_flask_and_asgi_answer_the_same(database):
+    flask_responses, flask_invalidations = replay(database, flask_post)
+    asgi_responses, asgi_invalidations = replay(database, asgi_post)
+
+    for flask_response, asgi_response in zip(flask_responses, asgi_responses):
+        assert flask_response == asgi_response
+    # El CREATE TABLE invalida la foto del esquema en los dos caminos
+    assert flask_invalidations == asgi_invalidations == 1
+
+
+def test_asgi_runs_multi_statement_sql(database):
+    responses, _ = replay(database, asgi_post)
+    _, _, status, body = responses[3]
+    assert status == 200
+    assert body['data'] == [{'id': 1, 'precio': 0.0}]
@@ -0,0 +1,118 @@
+import json
+import zlib
+
+import pytest
+from flask import Flask, Response, jsonify
+
+from compression import CompressionMiddleware, ResponseCompressor, negotiate
+
+ROWS = [{'id': i, 'nombre': f'producto {i}', 'precio': i * 1.5} for i in range(200)]
+
+
+def gunzip(data):
+    return zlib.decompressobj(31).decompress(data)
+
+
+@pytest.fixture
+def produced():
+    return []
+
+
+@pytest.fixture
+def client(produced):
+    app = Flask(__name__)
+
+    @app.route('/big')
+    def big():
+        return jsonify(ROWS)
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/stream')
+    def stream():
+        def lines():
+            for row in ROWS:
+                produced.append(row['id'])
+                yield json.dumps(row) + '\n'
+        return Response(lines(), mimetype='application/x-ndjson')
+
+    @app.route('/encoded')
+    def encoded():
+        body = zlib.compress(json.dumps(ROWS).encode())
+        return Response(body, mimetype='application/json', headers={'Content-Encoding': 'deflate'})
+
+    @app.route('/error')
+    def error():
+        return jsonify(ROWS), 500
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, ResponseCompressor(encodings=['gzip'], min_size=512))
+    return app.test_client()
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', 'gzip'),
+    ('deflate, gzip;q=0.5', 'gzip'),
+    ('x-gzip', 'gzip'),
+    ('*;q=0.1', 'gzip'),
+    ('gzip, identity;q=0', 'gzip'),
+    ('gzip;q=0, *', None),
+    ('identity;q=0', None),
+    ('br', None),
+    ('', None),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header, ['gzip']) == expected
+
+
+def test_quality_wins_over_server_preference():
+    assert negotiate('zstd;q=0.2, gzip;q=0.8', ['zstd', 'br', 'gzip']) == 'gzip'
+    assert negotiate('zstd, gzip', ['zstd', 'br', 'gzip']) == 'zstd'
+
+
+def test_large_json_is_gzipped(client):
+    plain = client.get('/big').data
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert int(response.headers['Content-Length']) == len(response.data) < len(plain)
+    assert gunzip(response.data) == plain
+
+
+def test_below_threshold_goes_as_is(client):
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert response.get_json() == {'ok': True}
+
+
+def test_identity_refused_still_gets_plain_body_without_gzip(client):
+    response = client.get('/big', headers={'Accept-Encoding': 'identity;q=0'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == ROWS
+
+
+def test_streaming_flushes_each_part(client, produced):
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    decompressor = zlib.decompressobj(31)
+    chunks = iter(response.response)
+    first = decompressor.decompress(next(chunks))
+    # La primera parte ya se puede leer completa sin esperar al resto del cuerpo
+    assert first.endswith(b'\n') and len(produced) < len(ROWS)
+    rest = b''.join(decompressor.decompress(chunk) for chunk in chunks)
+    response.close()
+    lines = (first + rest).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+
+
+def test_already_encoded_and_error_responses_are_not_touched(client):
+    encoded = client.get('/encoded', headers={'Accept-Encoding': 'gzip'})
+    assert encoded.headers['Content-Encoding'] == 'deflate'
+    assert json.loads(zlib.decompress(encoded.data)) == ROWS
+
+    error = client.get('/error', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in error.headers
+    assert error.get_json() == ROWS
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+from psycopg2 import extensions
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql):
+        if self.conn.broken:
+            raise RuntimeError('server closed the connection unexpectedly')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StubConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.info = type('Info', (), {'transaction_status': extensions.TRANSACTION_STATUS_IDLE})()
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class Factory:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        conn = StubConnection(len(self.created))
+        self.created.append(conn)
+        return conn
+
+
+def make_pool(**options):
+    factory = Factory()
+    options = dict({'min_size': 0, 'max_size': 2, 'timeout': 1.0, 'health_check_interval': 30.0}, **options)
+    return ConnectionPool({}, connect=factory, **options), factory
+
+
+def test_checkout_times_out_when_the_pool_is_full():
+    pool, _ = make_pool(max_size=1, timeout=0.05)
+    pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+
+
+def test_waiting_checkout_gets_the_returned_connection():
+    pool, factory = make_pool(max_size=1)
+    conn = pool.getconn()
+    threading.Timer(0.05, pool.putconn, (conn,)).start()
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats['waits'] == 1 and stats['wait_time_max'] >= 0.04
+    assert len(factory.created) == 1
+
+
+def test_closed_or_unknown_state_connections_are_replaced():
+    pool, factory = make_pool()
+    conn = pool.getconn()
+    conn.closed = 1
+    pool.putconn(conn)
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+    assert pool.getconn() is factory.created[2]
+    assert pool.stats()['connections_discarded'] == 2
+
+
+def test_open_transaction_is_rolled_back_on_return():
+    pool, _ = make_pool()
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_failed_health_check_discards_the_idle_connection():
+    pool, factory = make_pool(health_check_interval=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+    assert pool.getconn() is factory.created[1]
+    assert conn.closed
+    assert pool.stats()['health_check_failures'] == 1
+
+
+def test_connections_over_max_lifetime_are_recycled():
+    pool, factory = make_pool(max_lifetime=0.05)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    time.sleep(0.06)
+    assert pool.getconn() is not conn
+    assert conn.closed
+    fresh = factory.created[1]
+    time.sleep(0.06)
+    pool.putconn(fresh)
+    assert fresh.closed and pool.stats()['idle'] == 0
+
+
+def test_prune_keeps_the_minimum_and_warm_up_tops_it_up():
+    pool, factory = make_pool(min_size=1, max_size=3, max_idle=0.01)
+    connections = [pool.getconn() for _ in range(3)]
+    for conn in connections:
+        pool.putconn(conn)
+    time.sleep(0.02)
+    assert pool.prune() == 2
+    assert pool.stats()['total'] == 1
+
+    pool.min_size = 2
+    assert pool.warm_up() == 2
+    assert len(factory.created) == 4
+
+
+def test_maintenance_thread_replaces_recycled_connections():
+    pool, factory = make_pool(min_size=2, max_lifetime=0.05)
+    pool.warm_up()
+    pool.start_maintenance(interval=0.02)
+    try:
+        deadline = time.monotonic() + 2
+        while len(factory.created) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        pool.max_lifetime = 3600
+        time.sleep(0.05)
+        assert factory.created[0].closed and factory.created[1].closed
+        assert pool.stats()['idle'] == 2
+    finally:
+        pool.close()
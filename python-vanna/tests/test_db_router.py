@@ -0,0 +1,143 @@
+import pytest
+
+from db_router import PoolRegistry, UnknownDatabase, parse_databases, parse_hosts
+
+BASE = {'host': 'primario', 'port': '5432', 'database': 'tienda', 'user': 'vanna'}
+# Retraso que reporta cada servidor; None = el servidor no responde
+LAG = {}
+
+
+class StubCursor:
+    def __init__(self, host):
+        self.host = host
+
+    def execute(self, sql):
+        if LAG.get(self.host, 0) is None:
+            raise RuntimeError(f'could not connect to {self.host}')
+
+    def fetchone(self):
+        return (LAG.get(self.host, 0),)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class StubConnection:
+    def __init__(self, params):
+        self.params = params
+
+    def cursor(self):
+        return StubCursor(self.params['host'])
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubPool:
+    def __init__(self, params, **config):
+        self.params = params
+        self.config = config
+        self.timeout = config.get('timeout', 30.0)
+        self.in_use = 0
+        self.closed = False
+
+    def getconn(self, timeout=None):
+        if LAG.get(self.params['host'], 0) is None:
+            raise RuntimeError(f"could not connect to {self.params['host']}")
+        self.in_use += 1
+        return StubConnection(self.params)
+
+    def putconn(self, conn, close=False):
+        self.in_use -= 1
+
+    def close(self):
+        self.closed = True
+
+    def start_maintenance(self, interval):
+        pass
+
+    def stats(self):
+        return {'in_use': self.in_use}
+
+
+@pytest.fixture(autouse=True)
+def lag():
+    LAG.clear()
+    return LAG
+
+
+def make_registry(**options):
+    options.setdefault('lag_check_interval', 0)
+    return PoolRegistry(BASE, {'min_size': 1, 'max_size': 4}, pool_factory=StubPool, **options)
+
+
+def test_parse_hosts_and_databases():
+    assert parse_hosts('r1:5433, r2', 5432) == [('r1', '5433'), ('r2', '5432')]
+    assert parse_databases('*') is None
+    assert parse_databases(' a, b ,') == ['a', 'b']
+    assert parse_databases('') == []
+
+
+def test_reads_round_robin_over_replicas_within_lag(lag):
+    lag.update({'r1': 0.5, 'r2': 1.0, 'r3': 30.0})
+    registry = make_registry(replicas=[('r1', '5432'), ('r2', '5432'), ('r3', '5432')], max_replica_lag=5)
+    hosts = [registry.getconn(read_only=True).params['host'] for _ in range(4)]
+    assert hosts == ['r1', 'r2', 'r1', 'r2']
+    assert registry.getconn().params['host'] == 'primario'
+    assert registry.stats()['routed'] == {'primary': 1, 'replica': 4, 'replica_fallbacks': 0}
+
+
+def test_reads_fall_back_to_the_primary(lag):
+    lag.update({'r1': 30.0, 'r2': None})
+    registry = make_registry(replicas=[('r1', '5432'), ('r2', '5432')])
+    conn = registry.getconn(read_only=True)
+    assert conn.params['host'] == 'primario'
+    assert registry.route_of(conn) == ('tienda', 'primary')
+    replicas = {replica['host']: replica for replica in registry.stats()['replicas']}
+    assert replicas['r2']['healthy'] is False and replicas['r1']['lag_seconds'] == 30.0
+    assert registry.routed['replica_fallbacks'] == 1
+
+
+def test_replica_failing_on_checkout_is_marked_unhealthy(lag):
+    registry = make_registry(replicas=[('r1', '5432')], lag_check_interval=60)
+    registry.choose_replica()
+    lag['r1'] = None
+    assert registry.getconn(read_only=True).params['host'] == 'primario'
+    assert registry.replicas[0].healthy is False
+
+
+def test_allowed_databases():
+    registry = make_registry(allowed_databases=['ventas'])
+    assert registry.allowed_databases == ['tienda', 'ventas']
+    assert registry.resolve_database(None) == 'tienda'
+    assert registry.resolve_database('ventas') == 'ventas'
+    with pytest.raises(UnknownDatabase):
+        registry.resolve_database('rrhh')
+    assert make_registry(allowed_databases=None).resolve_database('rrhh') == 'rrhh'
+
+
+def test_tenant_pools_do_not_reserve_connections():
+    registry = make_registry(tenant_min_size=0)
+    assert registry.pool().config['min_size'] == 1
+    assert registry.pool('ventas').config['min_size'] == 0
+    assert registry.getconn('ventas').params['database'] == 'ventas'
+
+
+def test_least_recently_used_pools_are_evicted():
+    registry = make_registry(max_pools=2)
+    default = registry.pool()
+    a = registry.pool('a')
+    busy = registry.getconn('a')
+    b = registry.pool('b')
+    # 'a' está en uso y el primario por defecto no se expulsa: sale 'b' aunque sea el más reciente
+    assert b.closed and not a.closed and not default.closed
+    registry.putconn(busy)
+    registry.pool('c')
+    assert a.closed
+    assert set(registry.stats()['pools']) == {'tienda@primary', 'c@primary'}
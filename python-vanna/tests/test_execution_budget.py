@@ -0,0 +1,116 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import vanna_server
+from execution_budget import BudgetCounter, DisconnectWatcher, fetch_within_budget, load_budgets, split_within_budget
+from fake_db import FakeConnection, seed
+
+ROWS = [(i, f'producto {i}') for i in range(100)]
+
+
+class ListCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.requested = []
+
+    def fetchmany(self, size):
+        self.requested.append(size)
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def budget(max_rows=0, max_response_bytes=0):
+    return {'statement_timeout_ms': 0, 'max_rows': max_rows, 'max_response_bytes': max_response_bytes}
+
+
+def test_load_budgets_per_endpoint_overrides():
+    budgets = load_budgets({'SQL_MAX_ROWS': '100', 'CHAT_SQL_MAX_ROWS': '10'})
+    assert budgets['chat']['max_rows'] == 10
+    assert budgets['ask']['max_rows'] == 100
+    assert budgets['stream']['max_rows'] == 0
+
+
+def test_max_rows_reads_one_extra_row_and_stops():
+    cursor = ListCursor(ROWS)
+    batches, truncation = fetch_within_budget(cursor, budget(max_rows=25), 10)
+    assert sum(map(len, batches)) == 25
+    assert truncation == 'max_rows'
+    assert cursor.requested == [10, 10, 6]
+
+
+def test_result_that_fits_is_not_truncated():
+    batches, truncation = fetch_within_budget(ListCursor(ROWS), budget(max_rows=100), 30)
+    assert [row for batch in batches for row in batch] == ROWS
+    assert truncation is None
+
+
+def test_max_response_bytes_cuts_inside_the_batch():
+    batches, truncation = split_within_budget(ROWS, budget(max_response_bytes=500), 10)
+    rows = sum(map(len, batches))
+    assert truncation == 'max_response_bytes'
+    assert 0 < rows < 100 and rows % 10
+    assert BudgetCounter(budget(max_response_bytes=1)).admit(ROWS[:1]) == ([], 'max_response_bytes')
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'budget.db')
+    seed(path)
+    monkeypatch.setattr(vanna_server, 'get_connection', lambda read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server.prepared_statements, 'enabled', False)
+    yield path
+    vanna_server.result_cache.clear()
+
+
+@pytest.mark.parametrize('limits, reason, rows', [
+    ({'max_rows': 5}, 'max_rows', 5),
+    ({'max_response_bytes': 100}, 'max_response_bytes', None),
+    ({'max_rows': 50}, None, 20),
+])
+def test_execute_sql_reports_truncation(database, limits, reason, rows):
+    result = vanna_server.execute_sql('SELECT id, nombre FROM productos ORDER BY id', 'rows', dict(budget(), **limits))
+    assert result['truncated'] is (reason is not None)
+    assert result.get('truncation_reason') == reason
+    if rows is not None:
+        assert result['row_count'] == rows
+    if reason:
+        assert result['limits'] == {'max_rows': limits.get('max_rows', 0),
+                                    'max_response_bytes': limits.get('max_response_bytes', 0)}
+    else:
+        assert 'limits' not in result
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_watcher_cancels_once_when_the_client_disconnects():
+    server, client = socket.socketpair()
+    cancels = []
+    watcher = DisconnectWatcher(server, lambda: cancels.append(threading.current_thread().name), interval=0.01).start()
+    client.close()
+    assert wait_for(lambda: watcher.disconnected)
+    time.sleep(0.05)
+    watcher.stop()
+    server.close()
+    assert cancels == ['disconnect-watcher']
+
+
+def test_watcher_ignores_pending_keep_alive_data_and_stop():
+    server, client = socket.socketpair()
+    cancels = []
+    watcher = DisconnectWatcher(server, lambda: cancels.append(1), interval=0.01).start()
+    client.sendall(b'GET /siguiente HTTP/1.1\r\n')
+    time.sleep(0.05)
+    watcher.stop()
+    client.close()
+    time.sleep(0.05)
+    server.close()
+    assert cancels == [] and not watcher.disconnected
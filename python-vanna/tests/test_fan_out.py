@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+import vanna_server
+from fake_db import FakeConnection, seed
+from fan_out import FanOutExecutor, FanOutTimeout
+
+
+def test_results_keep_the_input_order_and_errors():
+    executor = FanOutExecutor(max_workers=4)
+
+    def work(n):
+        time.sleep(0.01 * (3 - n))
+        if n == 2:
+            raise ValueError('dos')
+        return n * 10
+
+    outcomes = executor.map(work, [0, 1, 2, 3])
+    assert [ok for ok, _ in outcomes] == [True, True, False, True]
+    assert [value for ok, value in outcomes if ok] == [0, 10, 30]
+    assert str(outcomes[2][1]) == 'dos'
+
+
+def test_concurrency_is_limited_per_batch():
+    executor = FanOutExecutor(max_workers=8)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(n):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    executor.map(work, list(range(8)), concurrency=2)
+    assert peak[0] == 2
+
+
+def test_slow_tasks_time_out():
+    executor = FanOutExecutor(max_workers=2)
+    release = threading.Event()
+    outcomes = executor.map(lambda n: release.wait(1) if n else n, [0, 1], timeout=0.05)
+    release.set()
+    assert outcomes[0] == (True, 0)
+    assert isinstance(outcomes[1][1], FanOutTimeout)
+    assert executor.stats()['timeouts'] == 1
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = str(tmp_path / 'batch.db')
+    seed(path)
+    release = threading.Event()
+    generated = {'rápida': 'SELECT count(*) AS total FROM productos', 'lenta': 'SELECT 1 AS uno'}
+
+    def generate_sql(question):
+        if question == 'lenta':
+            release.wait(2)
+        return generated[question]
+
+    monkeypatch.setattr(vanna_server, 'get_connection', lambda read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server, 'generate_sql_cached', generate_sql)
+    monkeypatch.setattr(vanna_server.prepared_statements, 'enabled', False)
+    monkeypatch.setattr(vanna_server.answer_store, 'enabled', False)
+    monkeypatch.setattr(vanna_server, 'BATCH_TIMEOUT', 0.2)
+    yield vanna_server.app.test_client()
+    release.set()
+    vanna_server.result_cache.clear()
+
+
+def test_chat_batch_reports_a_timed_out_question_as_504(client):
+    response = client.post('/api/v0/chat/batch', json={'questions': ['rápida', 'lenta', 'rápida']})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['succeeded'] == 2 and body['failed'] == 1
+    first, slow, repeated = body['results']
+    assert first['results']['data'] == [{'total': 20}] and first['index'] == 0
+    assert repeated['results'] == first['results'] and repeated['index'] == 2
+    assert slow['status'] == 504 and slow['question'] == 'lenta' and slow['sql'] is None
+
+
+@pytest.mark.parametrize('payload', [{}, {'questions': []}, {'questions': ['ok', '']}, {'questions': ['a'], 'concurrency': 'x'}])
+def test_chat_batch_validation(client, payload):
+    assert client.post('/api/v0/chat/batch', json=payload).status_code == 400
@@ -0,0 +1,106 @@
+import asyncio
+
+import httpx
+import pytest
+
+import asgi_server
+import vanna_server
+from fake_db import FakeAsyncPool, FakeConnection, seed
+
+
+class CountingAsyncPool(FakeAsyncPool):
+    def __init__(self, path):
+        super().__init__(path)
+        self.opened = 0
+
+    async def _open(self):
+        self.opened += 1
+        return await super()._open()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'vanna.db')
+    seed(path)
+    opened = []
+
+    def get_connection(read_only=False):
+        opened.append(path)
+        return FakeConnection(path)
+
+    monkeypatch.setattr(vanna_server, 'get_connection', get_connection)
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server, '_health_checks', {})
+    monkeypatch.setattr(vanna_server, 'HEALTH_CACHE_TTL', 60.0)
+    monkeypatch.setattr(asgi_server, 'db_pool', CountingAsyncPool(path))
+    monkeypatch.setattr(asgi_server, 'health_cache', None)
+    return opened
+
+
+def flask_health(query=''):
+    response = vanna_server.app.test_client().get(f'/api/v0/health{query}')
+    return response.get_json()
+
+
+def asgi_health(query=''):
+    async def get():
+        transport = httpx.ASGITransport(app=asgi_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get(f'/api/v0/health{query}')
+
+    return asyncio.run(get()).json()
+
+
+def test_flask_health_reuses_the_check_within_the_ttl(database):
+    first = flask_health()
+    second = flask_health()
+    assert first['database']['version'] == second['database']['version']
+    assert (first['check']['cached'], second['check']['cached']) == (False, True)
+    assert second['check']['checked_at'] == first['check']['checked_at']
+    assert len(database) == 1
+
+    assert flask_health('?refresh=1')['check']['cached'] is False
+    assert len(database) == 2
+
+
+def test_flask_health_repeats_the_check_after_the_ttl(database, monkeypatch):
+    flask_health()
+    monkeypatch.setattr(vanna_server, 'HEALTH_CACHE_TTL', 0.0)
+    assert flask_health()['check']['cached'] is False
+    assert len(database) == 2
+
+
+def test_flask_health_caches_failures(database, monkeypatch):
+    def refuse(read_only=False):
+        database.append('refused')
+        raise RuntimeError('connection refused')
+
+    monkeypatch.setattr(vanna_server, 'get_connection', refuse)
+    first = flask_health()
+    second = flask_health()
+    assert first['status'] == 'unhealthy'
+    assert second['check']['cached'] is True
+    assert database == ['refused']
+
+
+def test_asgi_health_reuses_the_check_within_the_ttl(database):
+    pool = asgi_server.db_pool
+    first = asgi_health()
+    second = asgi_health()
+    assert first['database']['name'] == 'fake'
+    assert (first['check']['cached'], second['check']['cached']) == (False, True)
+    assert pool.opened == 1
+
+    assert asgi_health('?refresh=true')['check']['cached'] is False
+    assert pool.opened == 2
+
+
+def test_asgi_concurrent_health_checks_share_one_query(database):
+    pool = asgi_server.db_pool
+
+    async def burst():
+        return await asyncio.gather(*(asgi_server.database_health() for _ in range(10)))
+
+    results = asyncio.run(burst())
+    assert [cached for _, cached in results].count(False) == 1
+    assert pool.opened == 1
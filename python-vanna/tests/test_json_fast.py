@@ -0,0 +1,40 @@
+import datetime
+import decimal
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_fast import FastJSONProvider, column_converters, convert_rows
+
+ROW = {'total': decimal.Decimal('1.50'), 'fecha': datetime.datetime(2024, 1, 2, 3, 4, 5),
+       'dia': datetime.date(2024, 1, 2)}
+
+
+def encode(provider_class, decimal_mode='str'):
+    app = Flask(__name__)
+    app.json = provider_class(app)
+    app.json.decimal_mode = decimal_mode
+    with app.app_context():
+        return app.json.response(ROW).get_data(as_text=True).strip()
+
+
+def test_default_provider_keeps_flask_wire_format():
+    # Formato que consume el cliente Laravel: RFC 822, Decimal como texto y claves ordenadas
+    assert encode(DefaultJSONProvider) == (
+        '{"dia":"Tue, 02 Jan 2024 00:00:00 GMT","fecha":"Tue, 02 Jan 2024 03:04:05 GMT","total":"1.50"}'
+    )
+
+
+def test_fast_provider_uses_iso_dates_and_column_order():
+    assert encode(FastJSONProvider) == '{"total":"1.50","fecha":"2024-01-02T03:04:05","dia":"2024-01-02"}'
+
+
+def test_fast_provider_decimal_as_float():
+    assert encode(FastJSONProvider, 'float') == '{"total":1.5,"fecha":"2024-01-02T03:04:05","dia":"2024-01-02"}'
+
+
+@pytest.mark.parametrize('mode, expected', [('str', '1.50'), ('float', 1.5)])
+def test_numeric_column_converter(mode, expected):
+    converters = column_converters([1700, 23], mode)
+    assert convert_rows([(decimal.Decimal('1.50'), 7)], converters) == [(expected, 7)]
@@ -0,0 +1,98 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from listing import (TrainingDataSnapshot, decode_cursor, list_schema, list_training_data, page_etag,
+                     parse_page)
+from query_guard import InvalidCursor
+from schema_snapshot import SchemaSnapshot
+
+
+def training_records(count=5):
+    return [
+        {'id': f'{n}-sql' if n % 2 else f'{n}-ddl', 'question': f'pregunta {n}' if n % 2 else None,
+         'content': f'SELECT {n}' if n % 2 else f'CREATE TABLE t{n} (id int)',
+         'training_data_type': 'sql' if n % 2 else 'ddl'}
+        for n in range(count)
+    ]
+
+
+def load(records):
+    snapshot = TrainingDataSnapshot(lambda: records)
+    records, ids, _ = snapshot.get()
+    return records, ids
+
+
+def test_cursor_pages_cover_every_record_once():
+    records, ids = load(training_records(7))
+    seen, after = [], None
+    while True:
+        page, total, cursor = list_training_data(records, ids, limit=3, after=after)
+        seen.extend(record['id'] for record in page)
+        if cursor is None:
+            break
+        after = decode_cursor(cursor)
+    assert total == 7
+    assert seen == sorted(ids)
+
+
+def test_cursor_is_stable_when_earlier_records_are_removed():
+    records, ids = load(training_records(6))
+    page, _, cursor = list_training_data(records, ids, limit=2)
+    records, ids = load([record for record in training_records(6) if record['id'] != page[0]['id']])
+    next_page, _, _ = list_training_data(records, ids, limit=2, after=decode_cursor(cursor))
+    assert next_page[0]['id'] > page[-1]['id']
+
+
+def test_filters_offset_and_projection():
+    records, ids = load(training_records(6))
+    page, total, cursor = list_training_data(records, ids, data_type='question_sql', offset=1, limit=1,
+                                             fields=('question',))
+    assert total == 3
+    assert page == [{'id': '3-sql', 'question': 'pregunta 3'}]
+    assert cursor is not None
+    page, total, _ = list_training_data(records, ids, search='t4')
+    assert [record['id'] for record in page] == ['4-ddl'] and total == 1
+
+
+def test_schema_prefix_and_type_filters():
+    tables = {
+        name: {'schema': 'public', 'type': kind, 'columns': [{'name': 'id'}]}
+        for name, kind in (('pedidos', 'BASE TABLE'), ('productos', 'BASE TABLE'), ('productos_v', 'VIEW'),
+                           ('clientes', 'BASE TABLE'))
+    }
+    snapshot = SchemaSnapshot(tables, 'checksum', 1)
+    page, total, cursor = list_schema(snapshot, prefix='pro', limit=1)
+    assert list(page) == ['productos'] and total == 2
+    page, total, cursor = list_schema(snapshot, prefix='pro', limit=1, after=decode_cursor(cursor))
+    assert list(page) == ['productos_v'] and cursor is None
+    page, total, _ = list_schema(snapshot, types={'VIEW'}, fields=('type',))
+    assert page == {'productos_v': {'type': 'VIEW'}} and total == 1
+
+
+def test_parse_page_validates_and_clamps():
+    assert parse_page(MultiDict({'limit': '5000'}), 1000) == (1000, 0, None)
+    with pytest.raises(ValueError):
+        parse_page(MultiDict({'limit': '-1'}), 1000)
+    with pytest.raises(ValueError):
+        parse_page(MultiDict({'cursor': 'abc', 'offset': '2'}), 1000)
+    with pytest.raises(InvalidCursor):
+        parse_page(MultiDict({'cursor': 'not-a-cursor'}), 1000)
+
+
+def test_page_etag_depends_on_content_and_page_but_not_refresh():
+    args = MultiDict([('limit', '10'), ('type', 'ddl')])
+    etag = page_etag('v1', args)
+    assert etag == page_etag('v1', MultiDict([('type', 'ddl'), ('limit', '10'), ('refresh', 'true')]))
+    assert etag != page_etag('v2', args)
+    assert etag != page_etag('v1', MultiDict([('limit', '20'), ('type', 'ddl')]))
+
+
+def test_snapshot_reloads_only_after_invalidate():
+    calls = []
+    records = training_records(3)
+    snapshot = TrainingDataSnapshot(lambda: calls.append(1) or records)
+    _, _, tag = snapshot.get()
+    assert snapshot.get()[2] == tag and len(calls) == 1
+    records.append({'id': 'nuevo', 'content': 'x', 'training_data_type': 'documentation'})
+    snapshot.invalidate()
+    assert snapshot.get()[2] != tag and len(calls) == 2
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from llm_backends import CircuitOpen, LLMBusy, LLMClient, LLMError, LLMTimeout, MockLLM
+
+
+class FlakyLLM(MockLLM):
+    """MockLLM que falla las primeras `failures` llamadas"""
+
+    def __init__(self, failures, retryable=True, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.retryable = retryable
+        self.calls = 0
+
+    def complete(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise LLMError('backend unavailable', retryable=self.retryable)
+        return super().complete(prompt)
+
+
+def make_client(backend, **kwargs):
+    kwargs.setdefault('backoff', 0)
+    return LLMClient(backend, **kwargs)
+
+
+def test_mock_answers_from_responses():
+    client = make_client(MockLLM({'¿Cuántos productos hay?': 'SELECT count(*) FROM productos'}))
+    prompt = [{'role': 'system', 'content': 'sql'}, {'role': 'user', 'content': '¿cuántos  productos hay?'}]
+    assert client.submit_prompt(prompt) == 'SELECT count(*) FROM productos'
+    assert client.submit_prompt('otra') == 'SELECT 1 AS mock'
+
+
+def test_retryable_errors_are_retried():
+    backend = FlakyLLM(failures=2)
+    client = make_client(backend, retries=2, failure_threshold=5)
+    assert client.submit_prompt('pregunta') == 'SELECT 1 AS mock'
+    stats = client.stats()
+    assert backend.calls == 3
+    assert stats['retries'] == 2 and stats['failures'] == 2 and stats['completions'] == 1
+    assert stats['circuit']['state'] == 'closed'
+
+
+def test_non_retryable_errors_fail_at_once():
+    backend = FlakyLLM(failures=1, retryable=False)
+    client = make_client(backend, retries=3)
+    with pytest.raises(LLMError):
+        client.submit_prompt('pregunta')
+    assert backend.calls == 1
+
+
+def test_breaker_opens_and_recovers_after_reset_timeout():
+    backend = FlakyLLM(failures=2)
+    client = make_client(backend, retries=0, failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        with pytest.raises(LLMError):
+            client.submit_prompt('pregunta')
+    with pytest.raises(CircuitOpen):
+        client.submit_prompt('pregunta')
+    assert backend.calls == 2
+    assert client.stats()['rejected'] == 1
+    time.sleep(0.06)
+    # Llamada de prueba en half-open: si sale bien el circuito se cierra
+    assert client.submit_prompt('pregunta') == 'SELECT 1 AS mock'
+    assert client.stats()['circuit']['state'] == 'closed'
+
+
+def test_timeout_counts_as_failure_and_keeps_the_slot():
+    client = make_client(MockLLM(latency=0.2), timeout=0.05, retries=0, max_concurrency=1, queue_timeout=0.01)
+    with pytest.raises(LLMTimeout):
+        client.submit_prompt('lenta')
+    # La llamada sigue ocupando su hueco hasta terminar: la siguiente no entra y no abre el circuito
+    with pytest.raises(LLMBusy):
+        client.submit_prompt('otra')
+    stats = client.stats()
+    assert stats['timeouts'] == 1 and stats['busy'] == 1
+    assert stats['circuit']['consecutive_failures'] == 1
+
+
+def test_waiting_for_a_slot_is_not_counted_in_the_timeout():
+    client = make_client(MockLLM(latency=0.1), timeout=0.15, max_concurrency=1, queue_timeout=1.0)
+    results = []
+    threads = [threading.Thread(target=lambda n=n: results.append(client.submit_prompt(f'p{n}'))) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['SELECT 1 AS mock'] * 3
+    assert client.stats()['timeouts'] == 0
+
+
+def test_identical_concurrent_prompts_share_one_call():
+    backend = FlakyLLM(failures=0, latency=0.1)
+    client = make_client(backend)
+    threads = [threading.Thread(target=client.submit_prompt, args=('misma',)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.calls == 1
+    assert client.stats()['coalesced'] == 3
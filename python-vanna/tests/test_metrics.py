@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+import asgi_server
+import metrics
+import vanna_server
+from fake_db import FakeAsyncPool, FakeConnection, seed
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('t_seconds', 'Prueba', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'chat')
+    assert histogram.render()[2:] == [
+        't_seconds_bucket{endpoint="chat",le="0.1"} 1',
+        't_seconds_bucket{endpoint="chat",le="1.0"} 2',
+        't_seconds_bucket{endpoint="chat",le="+Inf"} 3',
+        't_seconds_sum{endpoint="chat"} 5.550000',
+        't_seconds_count{endpoint="chat"} 3',
+    ]
+
+
+def test_counter_escapes_label_values():
+    counter = metrics.Counter('t_total', 'Prueba', ('path',))
+    counter.inc('a"b\n')
+    counter.inc('a"b\n', amount=2)
+    assert counter.render()[2] == 't_total{path="a\\"b\\n"} 3'
+
+
+def test_server_timing_header():
+    assert metrics.server_timing_header({'execute': 0.0125, 'fetch': 0.001}, 0.02) == (
+        'execute;dur=12.50, fetch;dur=1.00, total;dur=20.00'
+    )
+
+
+def test_span_accumulates_into_the_asgi_request_state():
+    state = {'endpoint': 'chat', 'phase_timings': {}, 'request_sql': []}
+    token = metrics.asgi_request.set(state)
+    try:
+        with metrics.span('execute'):
+            pass
+        with metrics.span('execute'):
+            metrics.record_sql('SELECT 1')
+    finally:
+        metrics.asgi_request.reset(token)
+    assert list(state['phase_timings']) == ['execute']
+    assert state['request_sql'] == ['SELECT 1']
+    # Fuera de una petición solo se registra el histograma
+    with metrics.span('background_phase'):
+        metrics.record_sql('SELECT 2')
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = str(tmp_path / 'metrics.db')
+    seed(path)
+    # Por el registro de pools, para que get_connection mida pool_checkout
+    monkeypatch.setattr(vanna_server.db_registry, 'getconn', lambda database=None, read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server.db_registry, 'putconn', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server.prepared_statements, 'enabled', False)
+    monkeypatch.setattr(asgi_server, 'db_pool', FakeAsyncPool(path))
+    yield path
+    vanna_server.result_cache.clear()
+
+
+def phases(header):
+    return [part.split(';')[0] for part in header.split(', ')]
+
+
+def test_flask_request_gets_server_timing_and_metrics(database):
+    client = vanna_server.app.test_client()
+    response = client.post('/api/v0/run_sql', json={'sql': 'SELECT id FROM productos WHERE id = 1'})
+    assert {'pool_checkout', 'execute', 'fetch', 'serialize', 'json_encode', 'total'} <= set(
+        phases(response.headers['Server-Timing'])
+    )
+    assert phases(response.headers['Server-Timing'])[-1] == 'total'
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'vanna_requests_total{endpoint="run_sql",method="POST",status="200"}' in body
+    assert 'vanna_phase_duration_seconds_count{endpoint="run_sql",phase="execute"}' in body
+    assert '# TYPE vanna_pool_connections gauge' in body
+
+
+def test_slow_requests_are_counted_and_logged(database, monkeypatch, caplog):
+    monkeypatch.setattr(vanna_server, 'SLOW_REQUEST_MS', 0)
+    vanna_server.app.test_client().post('/api/v0/run_sql', json={'sql': 'SELECT 1 AS uno'})
+    assert 'vanna_slow_requests_total{endpoint="run_sql"}' in metrics.slow_requests_total.render()[2]
+    assert any('Slow request POST /api/v0/run_sql' in record.getMessage() and 'SELECT 1 AS uno' in record.getMessage()
+               for record in caplog.records)
+
+
+def test_server_timing_can_be_disabled(database, monkeypatch):
+    monkeypatch.setattr(vanna_server, 'SERVER_TIMING_ENABLED', False)
+    response = vanna_server.app.test_client().post('/api/v0/run_sql', json={'sql': 'SELECT 1 AS uno'})
+    assert 'Server-Timing' not in response.headers
+
+
+def test_asgi_route_gets_server_timing(database):
+    async def post():
+        transport = httpx.ASGITransport(app=asgi_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post('/api/v0/run_sql', json={'sql': 'SELECT id FROM productos WHERE id = 2'})
+
+    response = asyncio.run(post())
+    assert {'pool_checkout', 'execute', 'fetch', 'serialize', 'json_encode', 'total'} <= set(
+        phases(response.headers['server-timing'])
+    )
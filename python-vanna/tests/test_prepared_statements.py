@@ -0,0 +1,75 @@
+from decimal import Decimal
+
+from prepared_statements import PreparedStatements, parameterize
+
+
+def test_numeric_literal_keeps_its_own_type():
+    # Regresión: sin el tipo del literal, `int_col > 10.5` se preparaba con el tipo de la columna
+    # y EXECUTE convertía 10.5 en 11
+    template, params = parameterize('SELECT * FROM t WHERE int_col > 10.5')
+    assert template == 'SELECT * FROM t WHERE int_col > $1::numeric'
+    assert params == (Decimal('10.5'),)
+
+
+def test_integer_and_decimal_literals_use_different_templates():
+    integer_template, _ = parameterize('SELECT * FROM t WHERE int_col > 10')
+    decimal_template, _ = parameterize('SELECT * FROM t WHERE int_col > 10.5')
+    assert integer_template == 'SELECT * FROM t WHERE int_col > $1::integer'
+    assert integer_template != decimal_template
+
+
+def test_integer_literal_widens_like_postgres():
+    template, params = parameterize('SELECT * FROM t WHERE id = 3000000000 OR id = 99999999999999999999')
+    assert template == 'SELECT * FROM t WHERE id = $1::bigint OR id = $2::numeric'
+    assert params == (3000000000, 99999999999999999999)
+
+
+def test_string_literals_stay_untyped():
+    template, params = parameterize("SELECT * FROM t WHERE created = '2024-01-01' AND name LIKE 'a%'")
+    assert template == 'SELECT * FROM t WHERE created = $1 AND name LIKE $2'
+    assert params == ('2024-01-01', 'a%')
+
+
+def test_in_list_and_limit_are_parameterized():
+    template, params = parameterize('SELECT * FROM t WHERE c IN (1, 2.5, 7) LIMIT 10')
+    assert template == 'SELECT * FROM t WHERE c IN ($1::integer, $2::numeric, $3::integer) LIMIT $4::integer'
+    assert params == (1, Decimal('2.5'), 7, 10)
+
+
+def test_literals_outside_comparisons_are_kept_inline():
+    assert parameterize("SELECT 1, 'x' FROM t ORDER BY 1") is None
+    template, _ = parameterize("SELECT * FROM t WHERE d > DATE '2024-01-01' AND id = 5")
+    assert template == "SELECT * FROM t WHERE d > DATE '2024-01-01' AND id = $1::integer"
+
+
+class _Cursor:
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.log.append(sql)
+
+
+class _Connection:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return _Cursor(self.log)
+
+
+def test_prepare_after_threshold_and_reuse():
+    statements = PreparedStatements(threshold=2)
+    conn = _Connection()
+    assert statements.statement(conn, 'SELECT * FROM t WHERE a > 1.5', 100) is None
+    sql, params = statements.statement(conn, 'SELECT * FROM t WHERE a > 2.5', 100)
+    assert sql.startswith('EXECUTE vanna_') and params == (Decimal('2.5'), 100)
+    assert 'WHERE a > $1::numeric' in conn.log[-1]
+    statements.statement(conn, 'SELECT * FROM t WHERE a > 3.5', 100)
+    assert statements.stats()['prepared'] == 1 and statements.stats()['reused'] == 1
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from query_guard import InvalidCursor, QueryGuard, QueryRejected
+
+
+def guard(**kwargs):
+    kwargs.setdefault('enabled', True)
+    kwargs.setdefault('secret', 'compartido')
+    return QueryGuard(**kwargs)
+
+
+def test_unordered_query_pages_by_the_whole_row():
+    assert QueryGuard.paginate('SELECT a, b FROM t;', 20, 10) == (
+        'SELECT * FROM (SELECT a, b FROM t) AS _page ORDER BY _page::text LIMIT 10 OFFSET 20'
+    )
+
+
+def test_ordered_query_keeps_its_order():
+    assert QueryGuard.paginate('SELECT a FROM t ORDER BY a DESC', 0, 10) == (
+        'SELECT a FROM t ORDER BY a DESC LIMIT 10 OFFSET 0'
+    )
+    # Un ORDER BY dentro de una subconsulta no ordena el resultado final
+    assert 'ORDER BY _page::text' in QueryGuard.paginate('SELECT * FROM (SELECT a FROM t ORDER BY a) s', 0, 10)
+
+
+def test_over_rows_is_paginated():
+    sql, page_size = guard(max_rows=100).decide('SELECT a FROM t', {'cost': 10, 'rows': 1000})
+    assert page_size == 1000 and sql.endswith('ORDER BY _page::text LIMIT 1000 OFFSET 0')
+
+
+def test_over_cost_is_rejected_when_a_page_is_not_cheaper():
+    with pytest.raises(QueryRejected) as error:
+        guard(max_cost=100).decide('SELECT a FROM t', {'cost': 500, 'rows': 10}, lambda page: {'cost': 600})
+    assert error.value.estimate['page_cost'] == 600
+
+
+def test_over_cost_is_paginated_when_a_page_is_cheaper():
+    explained = []
+    sql, page_size = guard(max_cost=100).decide(
+        'SELECT a FROM t ORDER BY id', {'cost': 500, 'rows': 10}, lambda page: explained.append(page) or {'cost': 50}
+    )
+    assert explained == [sql] and sql == 'SELECT a FROM t ORDER BY id LIMIT 1000 OFFSET 0' and page_size == 1000
+
+
+def test_ordered_and_limited_result_is_rejected():
+    with pytest.raises(QueryRejected):
+        guard(max_rows=100, page_size=10).decide('SELECT a FROM t ORDER BY a LIMIT 500', {'cost': 1, 'rows': 500})
+
+
+def test_cursor_is_bound_to_database_and_shared_secret():
+    token = guard().encode_cursor('SELECT 1', 10, 10, 'pregunta', 'ventas')
+    # Otro proceso con el mismo secreto acepta el cursor
+    assert guard().decode_cursor(token, 'ventas')['offset'] == 10
+    with pytest.raises(InvalidCursor):
+        guard().decode_cursor(token, 'otra')
+    with pytest.raises(InvalidCursor):
+        guard(secret='otro').decode_cursor(token, 'ventas')
+
+
+def test_cursor_expires():
+    token = guard(cursor_ttl=-1).encode_cursor('SELECT 1', 10, 10, database='ventas')
+    with pytest.raises(InvalidCursor, match='expired'):
+        guard().decode_cursor(token, 'ventas')
+
+
+def test_page_info_only_links_full_pages():
+    info = guard().page_info('SELECT 1', 0, 10, 10, database='ventas')
+    assert info['has_more'] and guard().decode_cursor(info['next_cursor'], 'ventas')['offset'] == 10
+    assert guard().page_info('SELECT 1', 0, 10, 3)['next_cursor'] is None
+    assert guard(secret=None).ephemeral_secret and not guard().ephemeral_secret
+    assert time.time() < guard().decode_cursor(info['next_cursor'], 'ventas')['expires']
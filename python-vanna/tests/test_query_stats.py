@@ -0,0 +1,64 @@
+import pytest
+
+from query_stats import QueryStats, fingerprint
+
+
+def test_same_shape_shares_a_fingerprint():
+    assert fingerprint('SELECT * FROM t WHERE id = 1') == fingerprint('select *  from t where id = 42')
+    assert fingerprint('SELECT * FROM t WHERE id = 1') != fingerprint('SELECT * FROM u WHERE id = 1')
+
+
+def test_aggregates_per_fingerprint_and_database():
+    stats = QueryStats(max_questions=2)
+    key = stats.record('SELECT * FROM t WHERE id = 1', 'tienda', 0.2, 1, 'q1')
+    stats.record('SELECT * FROM t WHERE id = 2', 'tienda', 0.4, 3, 'q2')
+    stats.record('SELECT * FROM t WHERE id = 3', 'tienda', 0.1, 0, 'q3', error=True)
+    stats.record('SELECT * FROM t WHERE id = 3', 'ventas', 5.0)
+    stats.record_cache_hit('SELECT * FROM t WHERE id = 9', 'tienda')
+
+    [entry] = stats.top(database='tienda')
+    assert entry['fingerprint'] == key[1]
+    assert (entry['calls'], entry['errors'], entry['cache_hits'], entry['rows']) == (3, 1, 1, 4)
+    assert entry['total_time_ms'] == pytest.approx(700.0) and entry['max_time_ms'] == pytest.approx(400.0)
+    assert entry['questions'] == ['q2', 'q3']
+    assert stats.top(sort='total_time')[0]['database'] == 'ventas'
+
+
+def test_response_bytes_are_split_by_rows():
+    stats = QueryStats()
+    big = stats.record('SELECT * FROM a', 'tienda', 0.1, 9)
+    small = stats.record('SELECT * FROM b', 'tienda', 0.1, 0)
+    stats.add_response_bytes([(big, 9), (small, 0), (None, 5)], 1100)
+    assert {entry['sample']: entry['bytes'] for entry in stats.top()} == {'SELECT * FROM a': 1000, 'SELECT * FROM b': 100}
+
+
+def test_eviction_drops_the_cheapest_tenth():
+    stats = QueryStats(max_entries=20)
+    for n in range(20):
+        stats.record(f'SELECT * FROM t{n}', 'tienda', n + 1.0)
+    stats.record('SELECT * FROM nueva', 'tienda', 0.001)
+    queries = {entry['sample'] for entry in stats.top(limit=100)}
+    assert len(queries) == 19 and stats.stats()['evicted'] == 2
+    assert 'SELECT * FROM t0' not in queries and 'SELECT * FROM t1' not in queries
+    # La entrada recién insertada no es víctima aunque sea la más barata
+    assert 'SELECT * FROM nueva' in queries
+
+
+def test_sort_validation_and_reset():
+    stats = QueryStats()
+    stats.record('SELECT 1', 'tienda', 0.1)
+    with pytest.raises(ValueError):
+        stats.top(sort='nombre')
+    stats.reset()
+    assert stats.top() == []
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'query_stats.json')
+    stats = QueryStats(path=path)
+    stats.record('SELECT * FROM t WHERE id = 1', 'tienda', 0.25, 2, '¿Producto 1?')
+    assert stats.save() is True
+    assert stats.save() is False
+    restored = QueryStats(path=path)
+    assert restored.top() == stats.top()
+    assert QueryStats(path=path, enabled=False).top() == []
@@ -0,0 +1,101 @@
+import pytest
+
+import question_cache as question_cache_module
+import vanna_server
+from question_cache import QuestionSQLCache, normalize_question
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(question_cache_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_normalize_question():
+    assert normalize_question('  ¿Cuántas  VENTAS hubo?') == 'cuantas ventas hubo'
+
+
+def test_exact_hit_after_normalization():
+    cache = QuestionSQLCache()
+    cache.put('¿Cuántas ventas hubo?', 'SELECT count(*) FROM ventas')
+    assert cache.get('cuantas ventas hubo') == 'SELECT count(*) FROM ventas'
+    assert cache.get('otra pregunta') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QuestionSQLCache(ttl=60)
+    cache.put('ventas', 'SELECT 1')
+    clock.now += 59
+    assert cache.get('ventas') == 'SELECT 1'
+    clock.now += 2
+    assert cache.get('ventas') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = QuestionSQLCache(max_size=2)
+    cache.put('a', 'SELECT 1')
+    cache.put('b', 'SELECT 2')
+    cache.get('a')
+    cache.put('c', 'SELECT 3')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'SELECT 1'
+
+
+def test_sql_generated_before_a_training_change_is_not_stored():
+    cache = QuestionSQLCache()
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('ventas', 'SELECT viejo', generation=generation)
+    assert cache.get('ventas') is None
+    cache.put('ventas', 'SELECT nuevo', generation=cache.generation)
+    assert cache.get('ventas') == 'SELECT nuevo'
+
+
+def test_similar_question_hits_with_embeddings():
+    vectors = {'ventas del mes': [1.0, 0.0], 'ventas de este mes': [0.95, 0.05], 'clientes': [0.0, 1.0]}
+    cache = QuestionSQLCache(similarity_threshold=0.9, embed_fn=vectors.get)
+    cache.put('Ventas del mes', 'SELECT sum(total) FROM ventas')
+    assert cache.get('ventas de este mes') == 'SELECT sum(total) FROM ventas'
+    assert cache.get('clientes') is None
+    assert cache.stats()['semantic_hits'] == 1
+
+
+class TrainingDuringGeneration:
+    """Vanna falso: el entrenamiento cambia mientras el LLM genera el SQL"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_sql(self, question):
+        self.calls += 1
+        vanna_server.question_cache.invalidate()
+        return f'SELECT {self.calls}'
+
+
+def test_generate_sql_cached_discards_sql_from_old_training(monkeypatch):
+    stub = TrainingDuringGeneration()
+    monkeypatch.setattr(vanna_server, 'vn', stub)
+    monkeypatch.setattr(vanna_server, 'question_cache', QuestionSQLCache())
+    assert vanna_server.generate_sql_cached('¿Ventas?') == 'SELECT 1'
+    assert vanna_server.generate_sql_cached('¿Ventas?') == 'SELECT 2'
+    assert stub.calls == 2
+
+
+def test_generate_sql_cached_reuses_the_sql(monkeypatch):
+    calls = []
+    stub = type('Vanna', (), {'generate_sql': lambda self, question: calls.append(question) or 'SELECT 1'})()
+    monkeypatch.setattr(vanna_server, 'vn', stub)
+    monkeypatch.setattr(vanna_server, 'question_cache', QuestionSQLCache())
+    assert vanna_server.generate_sql_cached('¿Ventas?') == vanna_server.generate_sql_cached('ventas') == 'SELECT 1'
+    assert calls == ['¿Ventas?']
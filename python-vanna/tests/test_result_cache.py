@@ -0,0 +1,91 @@
+from result_cache import ALL_TABLES, LocalCacheBackend, ResultCache
+
+
+def make_cache(**kwargs):
+    return ResultCache(LocalCacheBackend(max_entries=kwargs.pop('max_entries', 16)), **kwargs)
+
+
+def test_backend_invalidates_only_dependent_keys():
+    backend = LocalCacheBackend()
+    backend.set('a', 1, {'productos'}, 0)
+    backend.set('b', 2, {'clientes'}, 0)
+    backend.set('c', 3, {'productos', 'clientes'}, 0)
+    assert backend.invalidate_tables({'productos'}) == 2
+    assert backend.get('a') is None and backend.get('c') is None
+    assert backend.get('b') == 2
+    # El índice por tabla no conserva claves ya expulsadas
+    assert backend.invalidate_tables({'productos'}) == 0
+    assert backend.invalidate_tables({'clientes'}) == 1
+
+
+def test_backend_lru_eviction_cleans_table_index():
+    backend = LocalCacheBackend(max_entries=2)
+    backend.set('a', 1, {'t'}, 0)
+    backend.set('b', 2, {'t'}, 0)
+    backend.get('a')
+    backend.set('c', 3, {'u'}, 0)
+    assert backend.get('b') is None
+    assert backend.size() == 2
+    assert backend.invalidate_tables({'t'}) == 1
+
+
+def test_backend_expires_entries():
+    backend = LocalCacheBackend()
+    backend.set('a', 1, {'t'}, -1)
+    backend.set('b', 2, {'t'}, 0.000001)
+    assert backend.get('a') == 1
+    import time
+    time.sleep(0.01)
+    assert backend.get('b') is None
+
+
+def test_write_invalidates_results_that_read_the_table():
+    cache = make_cache()
+    cache.store('SELECT * FROM productos', {'row_count': 1})
+    cache.store('SELECT * FROM clientes', {'row_count': 1})
+    assert cache.invalidate_for("UPDATE productos SET precio = 1") == 1
+    assert cache.lookup('SELECT * FROM productos') is None
+    assert cache.lookup('SELECT  *  FROM clientes') == {'row_count': 1}
+
+
+def test_reads_without_known_tables_are_invalidated_by_any_write():
+    cache = make_cache()
+    cache.store('SELECT 1', {'row_count': 1})
+    cache.store('SELECT * FROM clientes', {'row_count': 1})
+    assert cache.backend._by_table[ALL_TABLES]
+    assert cache.invalidate_for('DELETE FROM productos') == 1
+    assert cache.lookup('SELECT 1') is None
+    assert cache.lookup('SELECT * FROM clientes') is not None
+
+
+def test_write_without_tables_clears_everything():
+    cache = make_cache()
+    cache.store('SELECT * FROM productos', {'row_count': 1})
+    cache.store('SELECT * FROM clientes', {'row_count': 1})
+    assert cache.invalidate_for("DO $$ BEGIN PERFORM 1; END $$") == 2
+    assert cache.backend.size() == 0
+    assert cache.stats()['evictions'] == 2
+
+
+def test_reads_do_not_invalidate_and_namespaces_are_separate():
+    cache = make_cache()
+    cache.store('SELECT * FROM productos', {'row_count': 1}, namespace='a')
+    assert cache.invalidate_for('SELECT * FROM productos') == 0
+    assert cache.lookup('SELECT * FROM productos', namespace='b') is None
+    assert cache.lookup('SELECT * FROM productos', namespace='a') is not None
+
+
+def test_cached_result_cannot_be_modified_through_a_reference():
+    cache = make_cache()
+    result = {'columns': ['id'], 'data': [{'id': 1}], 'row_count': 1}
+    cache.store('SELECT id FROM productos', result)
+    # Quien guardó el resultado sigue usándolo (p. ej. añade campos de la respuesta)
+    result['data'].append({'id': 2})
+    result['cached'] = False
+
+    first = cache.lookup('SELECT id FROM productos')
+    first['data'][0]['id'] = 99
+    first['sql'] = 'otra'
+    second = cache.lookup('SELECT id FROM productos')
+    assert second == {'columns': ['id'], 'data': [{'id': 1}], 'row_count': 1}
+    assert second is not first
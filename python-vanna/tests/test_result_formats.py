@@ -0,0 +1,106 @@
+import datetime
+import decimal
+from collections import namedtuple
+
+import pytest
+
+import vanna_server
+from fake_db import FakeConnection, seed
+from result_formats import build_result, iter_arrow_ipc
+
+pa = pytest.importorskip('pyarrow')
+
+COLUMNS = ['id', 'nombre']
+BATCHES = [[(1, 'a'), (2, 'b')], [(3, 'c')]]
+
+# Igual que psycopg2: precision y scale como atributos de cada columna
+Column = namedtuple('Column', 'name type_code display_size internal_size precision scale null_ok')
+
+
+def column(name, type_code, precision=None, scale=None):
+    return Column(name, type_code, None, None, precision, scale, None)
+
+
+@pytest.mark.parametrize('fmt, data', [
+    ('records', [{'id': 1, 'nombre': 'a'}, {'id': 2, 'nombre': 'b'}, {'id': 3, 'nombre': 'c'}]),
+    ('columnar', [[1, 2, 3], ['a', 'b', 'c']]),
+    ('rows', [(1, 'a'), (2, 'b'), (3, 'c')]),
+])
+def test_build_result_shapes(fmt, data):
+    result = build_result(COLUMNS, BATCHES, fmt)
+    assert result['data'] == data
+    assert result['columns'] == COLUMNS and result['row_count'] == 3
+    assert result.get('format') == (None if fmt == 'records' else fmt)
+
+
+def test_empty_columnar_result_keeps_one_list_per_column():
+    assert build_result(COLUMNS, [], 'columnar')['data'] == [[], []]
+
+
+def read_arrow(chunks):
+    return pa.ipc.open_stream(b''.join(chunks)).read_all()
+
+
+def test_arrow_round_trip_keeps_types_and_nulls():
+    description = [
+        column('id', 23), column('total', 1700, 10, 2), column('ratio', 1700), column('dia', 1082),
+        column('creado', 1114), column('extra', 3802), column('activo', 16), column('otro', 0)
+    ]
+    rows = [
+        (1, decimal.Decimal('1.50'), decimal.Decimal('0.25'), datetime.date(2024, 1, 2),
+         datetime.datetime(2024, 1, 2, 3, 4, 5), {'a': 1}, True, 'x'),
+        (2, None, None, None, None, None, None, None),
+    ]
+    table = read_arrow(iter_arrow_ipc(description, [rows[:1], rows[1:]], {'sql': 'SELECT 1'}))
+
+    assert table.schema.field('total').type == pa.decimal128(10, 2)
+    assert table.schema.field('ratio').type == pa.float64()
+    assert table.schema.field('otro').type == pa.string()
+    assert table.schema.metadata == {b'sql': b'SELECT 1'}
+    assert table.to_pylist() == [
+        {'id': 1, 'total': decimal.Decimal('1.50'), 'ratio': 0.25, 'dia': datetime.date(2024, 1, 2),
+         'creado': datetime.datetime(2024, 1, 2, 3, 4, 5), 'extra': '{"a": 1}', 'activo': True, 'otro': 'x'},
+        {'id': 2, 'total': None, 'ratio': None, 'dia': None, 'creado': None, 'extra': None, 'activo': None,
+         'otro': None},
+    ]
+
+
+def test_arrow_stream_has_one_record_batch_per_cursor_batch():
+    chunks = list(iter_arrow_ipc([column('id', 23), column('nombre', 25)], BATCHES))
+    reader = pa.ipc.open_stream(b''.join(chunks))
+    assert [batch.num_rows for batch in reader] == [2, 1]
+    # Esquema, un mensaje por lote y el fin del stream: el cliente recibe cada lote por separado
+    assert len(chunks) == 4
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = str(tmp_path / 'formats.db')
+    seed(path)
+    monkeypatch.setattr(vanna_server, 'get_connection', lambda read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    monkeypatch.setattr(vanna_server.prepared_statements, 'enabled', False)
+    yield vanna_server.app.test_client()
+    vanna_server.result_cache.clear()
+
+
+def test_run_sql_in_each_format(client):
+    sql = 'SELECT id, nombre FROM productos WHERE id <= 2 ORDER BY id'
+    columnar = client.post('/api/v0/run_sql', json={'sql': sql, 'format': 'columnar'}).get_json()
+    rows = client.post('/api/v0/run_sql?format=rows', json={'sql': sql}).get_json()
+    assert columnar['data'] == [[1, 2], ['p1', 'p2']]
+    assert rows['data'] == [[1, 'p1'], [2, 'p2']] and rows['format'] == 'rows'
+
+
+def test_run_sql_arrow(client):
+    sql = 'SELECT id, nombre FROM productos WHERE id <= 2 ORDER BY id'
+    response = client.post('/api/v0/run_sql', json={'sql': sql, 'format': 'arrow'})
+    assert response.mimetype == 'application/vnd.apache.arrow.stream'
+    table = read_arrow([response.data])
+    assert table.to_pylist() == [{'id': '1', 'nombre': 'p1'}, {'id': '2', 'nombre': 'p2'}]
+    assert table.schema.metadata == {b'sql': sql.encode()}
+
+
+def test_arrow_rejects_writes(client):
+    response = client.post('/api/v0/run_sql', json={'sql': 'DELETE FROM productos', 'format': 'arrow'})
+    assert response.status_code == 400
@@ -0,0 +1,165 @@
+import copy
+
+import pytest
+
+from schema_snapshot import (
+    CATALOG_CHECKSUM_QUERY, COLUMN_STATS_QUERY, SCHEMA_QUERY, SchemaCache, approximate, distinct_estimate,
+    like_pattern, parse_schema_list, table_key
+)
+from schema_training import plan_schema_update
+
+
+def column(name, full_type='integer', nullable=False, indexed=False):
+    return {'name': name, 'type': full_type, 'full_type': full_type, 'nullable': nullable, 'default': None,
+            'indexed': indexed}
+
+
+# Filas de SCHEMA_QUERY: esquema, tabla, tipo, clave de partición, particiones, filas, columnas, pk, fks, índices
+PRODUCTOS = ('public', 'productos', 'BASE TABLE', None, None, 25000.0,
+             [column('id', indexed=True), column('nombre', 'text', nullable=True)], ['id'], [], [])
+VENTAS = ('ventas', 'pedidos', 'BASE TABLE', 'RANGE (fecha)', 12, 1.2e6,
+          [column('id'), column('producto_id'), column('fecha', 'date')], ['id'],
+          [{'name': 'pedidos_producto_fk', 'references': 'productos',
+            'definition': 'FOREIGN KEY (producto_id) REFERENCES productos(id)'}], [])
+STATS = [('public', 'productos', 'id', False, -1.0, 0.0), ('public', 'productos', 'nombre', False, 120.0, 0.1),
+         ('ventas', 'pedidos', 'producto_id', True, -0.02, 0.0)]
+
+
+class Catalog:
+    """Conexión falsa que responde las tres consultas de introspección"""
+
+    def __init__(self):
+        self.checksum = 'v1'
+        self.tables = [PRODUCTOS]
+        self.stats = STATS
+        self.queries = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.queries.append(sql)
+        self.params = params
+        self.last = sql
+
+    def fetchone(self):
+        return (self.checksum,)
+
+    def fetchall(self):
+        # Copias: _load añade las estadísticas a las columnas que recibe
+        return copy.deepcopy(self.tables if self.last == SCHEMA_QUERY else self.stats)
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def catalog():
+    return Catalog()
+
+
+def snapshot_of(cache, catalog, force=False):
+    return cache.get(lambda: catalog, lambda conn: None, force=force)
+
+
+def test_helpers():
+    assert parse_schema_list('public, ventas_*,') == ['public', 'ventas_*']
+    assert parse_schema_list(None, ['public']) == ['public']
+    assert like_pattern('ventas_*') == 'ventas\\_%'
+    assert table_key('public', 'productos') == 'productos'
+    assert table_key('ventas', 'pedidos') == 'ventas.pedidos'
+    assert [approximate(v) for v in (None, 0.5, 7, 25000, 1.2e6, 3e9)] == [None, None, '~7', '~20K', '~1M', '~3B']
+    assert distinct_estimate({'n_distinct': -1}, 100) == 'unique'
+    assert distinct_estimate({'n_distinct': -0.5}, 1000) == '~500 distinct'
+
+
+def test_snapshot_is_reused_until_the_catalog_changes(catalog):
+    cache = SchemaCache(check_interval=0)
+    first = snapshot_of(cache, catalog)
+    assert snapshot_of(cache, catalog) is first
+    assert cache.loads == 1 and cache.checks == 2
+
+    catalog.checksum = 'v2'
+    catalog.tables = [PRODUCTOS, VENTAS]
+    second = snapshot_of(cache, catalog)
+    assert second.version == first.version + 1
+    assert second.table_names == ['productos', 'ventas.pedidos']
+
+
+def test_check_interval_and_invalidate(catalog):
+    cache = SchemaCache(check_interval=3600)
+    snapshot_of(cache, catalog)
+    snapshot_of(cache, catalog)
+    assert cache.checks == 1
+    cache.invalidate()
+    snapshot_of(cache, catalog)
+    assert cache.checks == 2
+
+
+def test_schema_filters_are_passed_as_like_patterns(catalog):
+    cache = SchemaCache(include=['public', 'ventas_*'], exclude=['ventas_old'], include_views=False)
+    snapshot_of(cache, catalog)
+    assert catalog.params['include'] == ['public', 'ventas\\_%']
+    assert catalog.params['exclude'][0] == 'ventas\\_old' and 'pg_catalog' in catalog.params['exclude']
+    assert catalog.params['relkinds'] == ['r', 'p', 'f', 'm']
+
+
+def test_column_stats_are_optional(catalog):
+    snapshot_of(SchemaCache(column_stats=False), catalog)
+    assert COLUMN_STATS_QUERY not in catalog.queries
+    assert catalog.queries == [CATALOG_CHECKSUM_QUERY, SCHEMA_QUERY]
+
+
+def test_table_ddl(catalog):
+    catalog.tables = [PRODUCTOS, VENTAS]
+    snapshot = snapshot_of(SchemaCache(), catalog)
+    assert snapshot.table_ddl('productos') == (
+        '-- ~20K rows\n'
+        'CREATE TABLE productos (\n'
+        '    id integer NOT NULL, -- indexed, unique\n'
+        '    nombre text NULL, -- ~100 distinct\n'
+        '    PRIMARY KEY (id)\n'
+        ');'
+    )
+    ddl = snapshot.table_ddl('ventas.pedidos')
+    assert ddl.startswith('-- 12 partitions\n-- ~1M rows\nCREATE TABLE ventas.pedidos (')
+    assert 'producto_id integer NOT NULL, -- ~20K distinct' in ddl
+    assert 'CONSTRAINT pedidos_producto_fk FOREIGN KEY (producto_id) REFERENCES productos(id)' in ddl
+    assert ddl.endswith(') PARTITION BY RANGE (fecha);')
+
+
+def test_analyze_does_not_change_the_fingerprint_or_the_training_plan(catalog):
+    catalog.tables = [PRODUCTOS, VENTAS]
+    cache = SchemaCache(check_interval=0)
+    first = snapshot_of(cache, catalog)
+    plan, ddls = plan_schema_update(first, {})
+    trained = {table: {'hash': digest, 'id': table} for table, (_, digest) in ddls.items()}
+
+    # ANALYZE: cambian el checksum, las filas estimadas y n_distinct, pero no la estructura
+    catalog.checksum = 'v2'
+    catalog.tables = [PRODUCTOS[:5] + (90000.0,) + PRODUCTOS[6:], VENTAS[:5] + (5e6,) + VENTAS[6:]]
+    catalog.stats = [row[:4] + (-0.9 if row[4] == -1.0 else row[4] * 40,) + row[5:] for row in STATS]
+    second = snapshot_of(cache, catalog)
+    assert cache.loads == 2
+    assert second.table_ddl('productos') != first.table_ddl('productos')
+    assert (second.fingerprint, second.version) == (first.fingerprint, first.version)
+    assert second.content_hash != first.content_hash
+    plan, _ = plan_schema_update(second, trained)
+    assert plan['unchanged'] == ['productos', 'ventas.pedidos'] and not plan['changed']
+
+
+def test_new_partition_changes_the_version(catalog):
+    catalog.tables = [VENTAS]
+    cache = SchemaCache(check_interval=0)
+    first = snapshot_of(cache, catalog)
+    assert catalog.params['collapse_partitions'] is True
+    assert first.table_names == ['ventas.pedidos']
+
+    catalog.checksum = 'v2'
+    catalog.tables = [VENTAS[:4] + (13,) + VENTAS[5:]]
+    second = snapshot_of(cache, catalog)
+    assert second.version == first.version + 1
+    assert second.table_ddl('ventas.pedidos', stats=False).startswith('-- 13 partitions\nCREATE TABLE')
@@ -0,0 +1,114 @@
+
+from schema_snapshot import SchemaSnapshot
+from schema_training import (
+    SchemaTrainingState, apply_schema_update, ddl_hash, existing_ddl_ids, plan_schema_update
+)
+
+
+def table(name, *columns):
+    return {'schema': 'public', 'name': name, 'type': 'BASE TABLE', 'primary_key': [], 'foreign_keys': [],
+            'indexes': [], 'columns': [{'name': column, 'type': 'integer', 'full_type': 'integer',
+                                        'nullable': True, 'default': None, 'indexed': False}
+                                       for column in columns]}
+
+
+def snapshot(*tables):
+    return SchemaSnapshot({t['name']: t for t in tables}, 'checksum', 1)
+
+
+class Store:
+    """Vanna falso: entrena con ids correlativos y puede fallar al eliminar"""
+
+    def __init__(self, fail_remove=(), fail_train=()):
+        self.fail_remove = set(fail_remove)
+        self.fail_train = set(fail_train)
+        self.ddls = {}
+        self.next_id = 0
+
+    def train(self, ddl):
+        if any(f'TABLE {name} (' in ddl for name in self.fail_train):
+            raise RuntimeError('embedding service unavailable')
+        self.next_id += 1
+        self.ddls[f'id-{self.next_id}'] = ddl
+        return f'id-{self.next_id}'
+
+    def remove_training_data(self, id):
+        if id in self.fail_remove:
+            raise RuntimeError('remove failed')
+        return self.ddls.pop(id, None) is not None
+
+
+def train_all(store, schema):
+    plan, ddls = plan_schema_update(schema, {})
+    state, errors = apply_schema_update(store, plan, ddls, {})
+    assert not errors
+    return state
+
+
+def test_plan_diff():
+    store = Store()
+    trained = train_all(store, snapshot(table('a', 'id'), table('b', 'id'), table('c', 'id')))
+    plan, _ = plan_schema_update(snapshot(table('a', 'id'), table('b', 'id', 'total'), table('d', 'id')), trained)
+    assert plan == {'added': ['d'], 'changed': ['b'], 'removed': ['c'], 'unchanged': ['a'], 'adopted': []}
+
+    full, _ = plan_schema_update(snapshot(table('a', 'id')), trained, mode='full')
+    assert full['changed'] == ['a'] and full['removed'] == ['b', 'c']
+
+
+def test_untracked_ddl_already_in_the_store_is_adopted():
+    # Con estadísticas: el almacén guarda el DDL completo y se adopta por el hash de ese texto
+    schema = snapshot(dict(table('a', 'id'), row_estimate=5000), table('b', 'id'))
+    existing = existing_ddl_ids([
+        {'training_data_type': 'ddl', 'content': schema.table_ddl('a'), 'id': 'viejo'},
+        {'training_data_type': 'sql', 'content': 'SELECT 1', 'id': 'x'},
+    ])
+    plan, ddls = plan_schema_update(schema, {}, existing)
+    assert plan['adopted'] == ['a'] and plan['added'] == ['b']
+    state, _ = apply_schema_update(Store(), plan, ddls, {}, existing)
+    assert state['a'] == {'hash': ddl_hash(schema.table_ddl('a', stats=False)), 'id': 'viejo'}
+
+
+def test_apply_replaces_changed_and_removes_dropped_tables():
+    store = Store()
+    trained = train_all(store, snapshot(table('a', 'id'), table('b', 'id')))
+    plan, ddls = plan_schema_update(snapshot(table('a', 'id', 'total')), trained)
+    state, errors = apply_schema_update(store, plan, ddls, trained)
+    assert not errors
+    assert set(state) == {'a'}
+    assert list(store.ddls.values()) == [ddls['a'][0]]
+    assert state['a'] == {'hash': ddls['a'][1], 'id': 'id-3'}
+
+
+def test_failed_removal_keeps_the_old_ddl_and_skips_training():
+    store = Store()
+    trained = train_all(store, snapshot(table('a', 'id'), table('b', 'id')))
+    store.fail_remove = {trained['a']['id']}
+    plan, ddls = plan_schema_update(snapshot(table('a', 'id', 'total'), table('b', 'id', 'total')), trained)
+    state, errors = apply_schema_update(store, plan, ddls, trained)
+
+    assert errors == [{'table': 'a', 'action': 'remove', 'error': 'remove failed'}]
+    assert state['a'] == trained['a']
+    # Solo una versión de cada tabla en el almacén
+    assert sorted(store.ddls) == ['id-1', 'id-3']
+    store.fail_remove = set()
+    plan, _ = plan_schema_update(snapshot(table('a', 'id', 'total'), table('b', 'id', 'total')), state)
+    assert plan['changed'] == ['a'] and plan['unchanged'] == ['b']
+
+
+def test_failed_training_of_a_changed_table_is_retried_as_new():
+    store = Store()
+    trained = train_all(store, snapshot(table('a', 'id')))
+    store.fail_train = {'a'}
+    plan, ddls = plan_schema_update(snapshot(table('a', 'id', 'total')), trained)
+    state, errors = apply_schema_update(store, plan, ddls, trained)
+    assert errors[0]['action'] == 'train' and 'a' not in state
+    assert plan_schema_update(snapshot(table('a', 'id', 'total')), state)[0]['added'] == ['a']
+
+
+def test_training_state_is_kept_per_database(tmp_path):
+    path = str(tmp_path / 'schema_training.json')
+    tienda, ventas = SchemaTrainingState(path, 'tienda'), SchemaTrainingState(path, 'ventas')
+    tienda.save({'a': {'hash': ddl_hash('x'), 'id': '1'}})
+    ventas.save({})
+    assert tienda.load() == {'a': {'hash': ddl_hash('x'), 'id': '1'}}
+    assert ventas.load() == {}
@@ -0,0 +1,43 @@
+from sql_utils import extract_tables, is_cacheable, is_multi_statement, is_read_only, normalize_sql, query_shape
+
+
+def test_extract_tables_ignores_literals_and_comments():
+    sql = ("SELECT * FROM public.productos p JOIN \"Ventas\" v ON v.id = p.id -- FROM comentario\n"
+           " WHERE x = 'FROM otra'")
+    assert extract_tables(sql) == {'productos', 'Ventas'}
+
+
+def test_extract_tables_with_comma_separated_list():
+    assert extract_tables('select a from t1, t2 as b where c in (1, 2, 3)') == {'t1', 't2'}
+
+
+def test_read_only_detects_writes_inside_ctes_and_locks():
+    assert is_read_only('SELECT * FROM t')
+    assert is_read_only('SELECT $$DROP TABLE t$$ FROM t')
+    assert not is_read_only('WITH x AS (DELETE FROM t RETURNING *) SELECT * FROM x')
+    assert not is_read_only('SELECT * FROM t FOR UPDATE')
+    assert not is_read_only('UPDATE t SET a = 1')
+
+
+def test_volatile_and_explain_are_not_cacheable():
+    assert is_cacheable('SELECT count(*) FROM t')
+    assert not is_cacheable('SELECT now() FROM t')
+    assert not is_cacheable('EXPLAIN SELECT 1')
+
+
+def test_normalize_sql_strips_comments_spacing_and_semicolon():
+    assert normalize_sql('SELECT  *  FROM t -- c\n ;') == 'SELECT * FROM t'
+    # Los literales se conservan tal cual
+    assert normalize_sql("SELECT 'a  b'  FROM t") == "SELECT 'a  b' FROM t"
+
+
+def test_query_shape_collapses_literals_and_value_lists():
+    assert query_shape('SELECT * FROM t WHERE id IN (1, 2, 3)') == query_shape('select * from t where id in (7)')
+    assert query_shape("SELECT E'it\\'s' FROM t WHERE a=1") == 'select ? from t where a = ?'
+    assert query_shape('SELECT "Col" FROM t') == 'select "Col" from t'
+
+
+def test_multi_statement_ignores_trailing_semicolon_and_literals():
+    assert not is_multi_statement('SELECT 1;')
+    assert not is_multi_statement("SELECT ';' -- a; b")
+    assert is_multi_statement('UPDATE t SET a = 1; SELECT a FROM t')
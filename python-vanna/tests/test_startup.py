@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import vanna_server
+
+
+class StubVanna:
+    pass
+
+
+@pytest.fixture
+def startup(monkeypatch):
+    """Estado de arranque limpio, Vanna de prueba y un paso de base de datos que espera una señal"""
+    created = []
+    database_ready = threading.Event()
+    failures = []
+
+    def create_vanna():
+        created.append(StubVanna())
+        return created[-1]
+
+    def probe_database():
+        if failures:
+            raise RuntimeError(failures.pop())
+        database_ready.wait(5)
+        return {'name': 'fake'}
+
+    monkeypatch.setattr(vanna_server, '_vanna', None)
+    monkeypatch.setattr(vanna_server, 'create_vanna', create_vanna)
+    monkeypatch.setattr(vanna_server, 'startup_state',
+                        {'status': 'pending', 'started_at': None, 'ready_at': None, 'steps': {}})
+    monkeypatch.setattr(vanna_server, 'WARM_UP_RETRY_INTERVAL', 0.01)
+    monkeypatch.setattr(vanna_server, 'WARM_UP_STEPS', (
+        ('vanna', lambda: {'class': type(vanna_server.get_vanna()).__name__}),
+        ('database', probe_database),
+    ))
+    yield created, database_ready, failures
+    database_ready.set()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_import_does_not_build_vanna():
+    code = 'import vanna_server, sys; sys.exit(vanna_server.vanna_ready() or vanna_server.startup_state["status"] != "pending")'
+    result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(vanna_server.__file__))
+    assert result.returncode == 0
+
+
+def test_lazy_vanna_builds_once_on_first_access(startup):
+    created, _, _ = startup
+    assert not vanna_server.vanna_ready()
+    vanna_server.vn.run_sql
+    vanna_server.vn.submit_prompt
+    assert len(created) == 1
+    assert vanna_server.vanna_ready()
+    assert created[0].run_sql is vanna_server.execute_sql
+
+
+def test_ready_is_503_until_warm_up_finishes(startup):
+    created, database_ready, _ = startup
+    client = vanna_server.app.test_client()
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'starting'
+
+    # /health responde mientras el calentamiento sigue en curso
+    assert client.get('/health').status_code == 200
+    wait_for(lambda: vanna_server.startup_state['steps'].get('vanna', {}).get('ok'))
+    assert client.get('/ready').status_code == 503
+
+    database_ready.set()
+    wait_for(lambda: vanna_server.startup_state['status'] == 'ready')
+    response = client.get('/ready')
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['steps']['vanna']['detail'] == {'class': 'StubVanna'}
+    assert body['startup_seconds'] >= 0
+    assert len(created) == 1
+
+
+def test_failed_step_is_retried(startup):
+    _, database_ready, failures = startup
+    failures.append('connection refused')
+    database_ready.set()
+    assert vanna_server.start_warm_up()
+    assert not vanna_server.start_warm_up()
+    wait_for(lambda: vanna_server.startup_state['status'] == 'ready')
+    steps = vanna_server.startup_state['steps']
+    assert steps['database']['attempts'] == 2
+    assert steps['vanna']['attempts'] == 1
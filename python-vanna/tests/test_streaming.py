@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import vanna_server
+from fake_db import FakeConnection, seed
+from streaming import CursorBatches, iter_json_array, iter_ndjson, iter_stream
+
+COLUMNS = ['id', 'nombre']
+BATCHES = [[(1, 'a'), (2, 'b')], [(3, 'c')]]
+
+
+def failing_batches():
+    yield BATCHES[0]
+    raise RuntimeError('canceling statement due to statement timeout')
+
+
+def test_ndjson_header_rows_and_footer():
+    lines = ''.join(iter_ndjson(COLUMNS, BATCHES, json.dumps, {'sql': 'SELECT 1'})).splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'columns': COLUMNS, 'sql': 'SELECT 1'}, [1, 'a'], [2, 'b'], [3, 'c'], {'row_count': 3}
+    ]
+
+
+def test_ndjson_reports_errors_in_the_footer():
+    lines = ''.join(iter_ndjson(COLUMNS, failing_batches(), json.dumps)).splitlines()
+    assert json.loads(lines[-1]) == {'error': 'canceling statement due to statement timeout', 'row_count': 2}
+
+
+@pytest.mark.parametrize('batches', [BATCHES, [], [[]]])
+def test_json_array_is_a_single_valid_document(batches):
+    rows = [list(row) for batch in batches for row in batch]
+    body = json.loads(''.join(iter_json_array(COLUMNS, batches, json.dumps, {'sql': 'SELECT 1'})))
+    assert body == {'columns': COLUMNS, 'sql': 'SELECT 1', 'data': rows, 'row_count': len(rows)}
+
+
+def test_json_array_keeps_valid_json_on_error():
+    body = json.loads(''.join(iter_stream('json', COLUMNS, failing_batches(), json.dumps)))
+    assert body['data'] == [[1, 'a'], [2, 'b']]
+    assert body['error'] == 'canceling statement due to statement timeout'
+
+
+def test_cursor_batches_release_the_connection_once():
+    class Cursor:
+        rows = [[(3, 'c')], []]
+
+        def fetchmany(self, size):
+            return self.rows.pop(0)
+
+    closed = []
+    batches = CursorBatches(Cursor(), 2, BATCHES[0], closed.append)
+    assert list(batches) == BATCHES
+    batches.close()
+    assert closed == [True]
+
+    abandoned = CursorBatches(Cursor(), 2, BATCHES[0], closed.append)
+    next(iter(abandoned))
+    abandoned.close()
+    assert closed == [True, False]
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    path = str(tmp_path / 'stream.db')
+    seed(path)
+    monkeypatch.setattr(vanna_server, 'get_connection', lambda read_only=False: FakeConnection(path))
+    monkeypatch.setattr(vanna_server, 'return_connection', lambda conn, close=False: conn.close())
+    return vanna_server.app.test_client()
+
+
+def test_run_sql_streams_ndjson(client):
+    response = client.post('/api/v0/run_sql', json={'sql': 'SELECT id, nombre FROM productos ORDER BY id', 'stream': 'ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['columns'] == COLUMNS
+    assert lines[1] == [1, 'p1'] and len(lines) == 22
+    assert lines[-1] == {'row_count': 20}
+
+
+def test_run_sql_streams_a_json_array(client):
+    response = client.post('/api/v0/run_sql?stream=json', json={'sql': 'SELECT id FROM productos WHERE id <= 3 ORDER BY id'})
+    assert response.get_json() == {'columns': ['id'], 'data': [[1], [2], [3]], 'row_count': 3}
+
+
+def test_unknown_stream_format_is_rejected(client):
+    response = client.post('/api/v0/run_sql', json={'sql': 'SELECT 1', 'stream': 'xml'})
+    assert response.status_code == 400
@@ -0,0 +1,88 @@
+import pytest
+
+from training_jobs import TrainingJobManager, parse_training_items
+
+ITEMS = [
+    {'question': 'Total de ventas', 'sql': 'SELECT sum(total) FROM ventas'},
+    {'ddl': 'CREATE TABLE ventas (id int, total numeric)'},
+    {'documentation': 'Las ventas se registran en pesos'},
+    {'question': 'Total de ventas ', 'sql': ' SELECT sum(total) FROM ventas'},
+    {'ddl': 'CREATE TABLE rota ('},
+    {'sql': 'SELECT 1'},
+    {'documentation': 'Los clientes tienen un RUT'},
+]
+
+
+class PerItemStore:
+    """Almacén sin add_training_batch (como el remoto de Vanna): una llamada a train por entrada"""
+
+    def __init__(self):
+        self.trained = []
+
+    def train(self, **content):
+        if content.get('ddl', '').endswith('('):
+            raise ValueError('syntax error')
+        self.trained.append(content)
+
+
+class BatchStore(PerItemStore):
+    """Almacén con inserción por lotes (como el local); un lote con una entrada mala falla completo"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+
+    def add_training_batch(self, entries):
+        for _, content in entries:
+            if content.get('ddl', '').endswith('('):
+                raise ValueError('syntax error')
+        self.batches += 1
+        self.trained.extend(content for _, content in entries)
+
+
+def run_job(store, items=ITEMS):
+    batches_done = []
+    manager = TrainingJobManager(store, batch_size=2, on_batch_done=lambda: batches_done.append(1))
+    job = manager.submit(items)
+    manager._executor.shutdown(wait=True)
+    return job.to_dict(), len(batches_done)
+
+
+def progress(summary):
+    keys = ('status', 'received', 'total', 'duplicates', 'invalid_count', 'processed', 'succeeded', 'failed_count', 'progress')
+    return {key: summary[key] for key in keys}
+
+
+def test_batched_and_per_item_paths_report_the_same_progress():
+    batch_store, item_store = BatchStore(), PerItemStore()
+    batched, batched_calls = run_job(batch_store)
+    per_item, per_item_calls = run_job(item_store)
+
+    assert progress(batched) == progress(per_item) == {
+        'status': 'completed_with_errors', 'received': 7, 'total': 5, 'duplicates': 1, 'invalid_count': 1,
+        'processed': 5, 'succeeded': 4, 'failed_count': 1, 'progress': 1.0
+    }
+    assert batched['failed'] == per_item['failed'] == [{'index': 4, 'type': 'ddl', 'error': 'syntax error'}]
+    assert batched_calls == per_item_calls == 3
+    assert sorted(map(str, batch_store.trained)) == sorted(map(str, item_store.trained))
+
+
+def test_job_reports_whether_the_store_is_batched():
+    assert run_job(BatchStore())[0]['batched'] is True
+    assert run_job(PerItemStore())[0]['batched'] is False
+
+
+def test_batch_store_inserts_whole_batches():
+    store = BatchStore()
+    run_job(store, ITEMS[:3])
+    assert store.batches == 2
+
+
+@pytest.mark.parametrize('payload', ['{"ddl": "a"}\n\n{"documentation": "b"}\n', b'{"ddl": "a"}\n{"documentation": "b"}'])
+def test_parse_jsonl(payload):
+    assert parse_training_items(payload) == [{'ddl': 'a'}, {'documentation': 'b'}]
+
+
+def test_parse_reports_the_bad_line():
+    with pytest.raises(ValueError, match='line 2'):
+        parse_training_items('{"ddl": "a"}\n{nope')
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+import pytest
+
+from vector_store import HashingEmbedder, LocalVectorStore, _normalize, deterministic_id
+
+DIM = 32
+
+
+def clustered(count, clusters=40, noise=0.35, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIM))
+    labels = rng.integers(0, clusters, size=count)
+    return _normalize((centers[labels] + noise * rng.normal(size=(count, DIM))).astype(np.float32))
+
+
+class TableEmbedder:
+    """Embeddings precalculados: 'doc-<n>' es la fila n de la tabla y 'q-<n>' la consulta n"""
+
+    name = 'table-32'
+    dim = DIM
+
+    def __init__(self, documents, queries):
+        self.documents = documents
+        self.queries = queries
+
+    def __call__(self, texts):
+        table = {'doc': self.documents, 'q': self.queries}
+        return np.stack([table[text.split('-')[0]][int(text.split('-')[1])] for text in texts])
+
+
+def wait_for_index(store, kind='documentation'):
+    collection = store._collections[kind]
+    deadline = time.monotonic() + 30
+    while (collection.building or collection.index is None) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert collection.index is not None
+
+
+def test_ivf_recall_against_exhaustive_search(tmp_path):
+    documents, queries = clustered(4000), clustered(50, seed=2)
+    store = LocalVectorStore(str(tmp_path), TableEmbedder(documents, queries), n_results_documentation=10,
+                             nprobe=8, ivf_min_size=1000)
+    store.add_training_batch([('documentation', {'documentation': f'doc-{i}'}) for i in range(len(documents))])
+    wait_for_index(store)
+
+    recalls = []
+    for n, query in enumerate(queries):
+        exact = {f'doc-{i}' for i in np.argsort(-(documents @ query))[:10]}
+        found = set(store.get_related_documentation(f'q-{n}'))
+        recalls.append(len(found & exact) / 10)
+    assert np.mean(recalls) >= 0.9
+    assert store.vector_store_stats()['documentation']['lists'] > 16
+
+
+def test_rows_added_after_the_index_are_searchable(tmp_path):
+    documents, queries = clustered(1200), clustered(1, seed=3)
+    # La consulta es exactamente el último documento, añadido después de construir el índice
+    queries[0] = documents[-1]
+    store = LocalVectorStore(str(tmp_path), TableEmbedder(documents, queries), n_results_documentation=1,
+                             ivf_min_size=1000)
+    store.add_training_batch([('documentation', {'documentation': f'doc-{i}'}) for i in range(1100)])
+    wait_for_index(store)
+    store.add_training_batch([('documentation', {'documentation': f'doc-{i}'}) for i in range(1100, 1200)])
+    assert store.vector_store_stats()['documentation']['indexed'] == 1100
+    assert store.get_related_documentation('q-0') == ['doc-1199']
+
+
+def test_entries_persist_deduplicate_and_can_be_removed(tmp_path):
+    store = LocalVectorStore(str(tmp_path), HashingEmbedder(64))
+    first = store.add_question_sql('¿Total de ventas?', 'SELECT sum(total) FROM ventas')
+    assert store.add_question_sql('¿Total de ventas?', 'SELECT sum(total) FROM ventas') == first
+    assert first == deterministic_id('sql', '¿Total de ventas?', 'SELECT sum(total) FROM ventas')
+    ddl = store.add_ddl('CREATE TABLE ventas (id int, total numeric)')
+    store.add_documentation('Las ventas se registran en pesos')
+
+    reopened = LocalVectorStore(str(tmp_path), HashingEmbedder(64))
+    assert reopened.count_training_data() == 3
+    assert reopened.get_similar_question_sql('total ventas') == [
+        {'question': '¿Total de ventas?', 'sql': 'SELECT sum(total) FROM ventas'}
+    ]
+    assert reopened.remove_training_data(ddl) is True
+    assert reopened.remove_training_data(ddl) is False
+    assert reopened.get_related_ddl('ventas') == []
+    assert list(reopened.get_training_data(training_data_type='ddl')['id']) == []
+
+
+def test_store_refuses_a_different_embedder(tmp_path):
+    LocalVectorStore(str(tmp_path), HashingEmbedder(64))
+    with pytest.raises(ValueError):
+        LocalVectorStore(str(tmp_path), HashingEmbedder(128))
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+TRAINING_KINDS = ('ddl', 'documentation', 'question_sql')
+
+
+def parse_training_items(payload):
+    """Convierte un arreglo JSON o texto JSONL en una lista de entradas de entrenamiento"""
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8')
+    if isinstance(payload, str):
+        items = []
+        for line_number, line in enumerate(payload.splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f'Invalid JSON on line {line_number}: {e}')
+        return items
+    if isinstance(payload, dict):
+        payload = payload.get('items', [])
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON array, an object with "items" or JSONL text')
+    return payload
+
+
+def classify_item(item):
+    """Tipo y contenido normalizado de una entrada, con las mismas claves que /api/v0/train"""
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be a JSON object')
+    if item.get('question') and item.get('sql'):
+        return 'question_sql', {'question': item['question'].strip(), 'sql': item['sql'].strip()}
+    if item.get('ddl') or item.get('training_data'):
+        return 'ddl', {'ddl': (item.get('ddl') or item.get('training_data')).strip()}
+    if item.get('documentation'):
+        return 'documentation', {'documentation': item['documentation'].strip()}
+    raise ValueError('Item requires question+sql, ddl or documentation')
+
+
+def item_key(kind, content):
+    canonical = json.dumps([kind, content], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class TrainingJob:
+    """Trabajo de entrenamiento masivo con progreso y errores parciales"""
+
+    def __init__(self, total_received, batched=False):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.total_received = total_received
+        # Si el almacén inserta cada lote con una sola llamada (add_training_batch) o entrada por entrada
+        self.batched = batched
+        self.entries = []
+        self.duplicates = 0
+        self.invalid = []
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        with self.lock:
+            total = len(self.entries)
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'received': self.total_received,
+                'batched': self.batched,
+                'total': total,
+                'duplicates': self.duplicates,
+                'invalid': self.invalid[:100],
+                'invalid_count': len(self.invalid),
+                'processed': self.processed,
+                'succeeded': self.succeeded,
+                'failed': self.failed[:100],
+                'failed_count': len(self.failed),
+                'progress': round(self.processed / total, 4) if total else 1.0,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class TrainingJobManager:
+    """Ejecuta trabajos de entrenamiento en segundo plano, en lotes y sin bloquear al worker HTTP
+
+    Solo los almacenes con add_training_batch (el almacén vectorial local) insertan un lote con una
+    sola llamada; con el almacén remoto de Vanna los embeddings se calculan en el servicio y cada
+    entrada es una llamada a vn.train, aunque el progreso se siga informando por lotes.
+    """
+
+    def __init__(self, vn, batch_size=50, max_workers=2, on_batch_done=None, max_jobs=100):
+        self.vn = vn
+        self.batch_size = batch_size
+        self.on_batch_done = on_batch_done
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='training')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, items):
+        """Valida y deduplica las entradas y encola el trabajo; retorna el TrainingJob"""
+        job = TrainingJob(len(items), batched=self.supports_batches())
+        seen = set()
+        for index, item in enumerate(items):
+            try:
+                kind, content = classify_item(item)
+            except (ValueError, AttributeError) as e:
+                job.invalid.append({'index': index, 'error': str(e)})
+                continue
+            key = item_key(kind, content)
+            if key in seen:
+                job.duplicates += 1
+                continue
+            seen.add(key)
+            job.entries.append((index, kind, content))
+
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.finished_at]
+            for old in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old.id]
+        self._executor.submit(self._run, job)
+        return job
+
+    def supports_batches(self):
+        return getattr(self.vn, 'add_training_batch', None) is not None
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def _run(self, job):
+        with job.lock:
+            job.status = 'running'
+            job.started_at = time.time()
+        try:
+            for start in range(0, len(job.entries), self.batch_size):
+                batch = job.entries[start:start + self.batch_size]
+                self._train_batch(job, batch)
+                if self.on_batch_done:
+                    self.on_batch_done()
+            with job.lock:
+                job.status = 'completed_with_errors' if job.failed else 'completed'
+        except Exception as e:
+            with job.lock:
+                job.status = 'failed'
+                job.failed.append({'index': None, 'error': str(e)})
+        finally:
+            with job.lock:
+                job.finished_at = time.time()
+
+    def _train_batch(self, job, batch):
+        """Entrena un lote; si el backend admite inserción por lotes se usa una sola llamada"""
+        add_batch = getattr(self.vn, 'add_training_batch', None)
+        if add_batch is not None:
+            try:
+                add_batch([(kind, content) for _, kind, content in batch])
+                with job.lock:
+                    job.processed += len(batch)
+                    job.succeeded += len(batch)
+                return
+            except Exception:
+                # Si falla el lote completo, se reintenta entrada por entrada para aislar los errores
+                pass
+
+        for index, kind, content in batch:
+            try:
+                self.vn.train(**content)
+                ok = True
+            except Exception as e:
+                ok = False
+                error = str(e)
+            with job.lock:
+                job.processed += 1
+                if ok:
+                    job.succeeded += 1
+                else:
+                    job.failed.append({'index': index, 'type': kind, 'error': error})
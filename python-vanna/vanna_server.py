@@ -1,11 +1,46 @@
+import atexit
+import json
 import os
+import threading
+import time
+import uuid
+
+import psycopg2
 from dotenv import load_dotenv
-from vanna import VannaDefault
-from flask import Flask, request, jsonify
+from flask import (
+    Flask, Response, copy_current_request_context, g, has_app_context, has_request_context, jsonify, request
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import psycopg2
-from psycopg2 import pool
-import json
+
+import metrics
+from answer_store import AnswerStore
+from compression import CompressionMiddleware, ResponseCompressor
+from db_router import PoolRegistry, UnknownDatabase, parse_databases, parse_hosts
+from execution_budget import DisconnectWatcher, client_socket, fetch_within_budget, load_budgets, widest_budget
+from fan_out import FanOutExecutor, FanOutTimeout
+from json_fast import DECIMAL_MODES, FastJSONProvider, column_converters, convert_batches
+from listing import (
+    SCHEMA_FIELDS, TRAINING_FIELDS, TrainingDataSnapshot, list_schema, list_training_data, page_etag,
+    parse_fields, parse_page, parse_schema_types
+)
+from llm_backends import LLM_BACKENDS, LLMClient, LLMUnavailable, SingleFlight, create_llm_backend
+from metrics import record_sql, span
+from prepared_statements import PreparedStatements
+from query_guard import InvalidCursor, QueryGuard, QueryRejected
+from query_stats import QUERY_STATS_SORTS, QueryStats
+from question_cache import QuestionSQLCache, normalize_question
+from result_cache import create_result_cache
+from result_formats import (
+    ARROW_MIMETYPE, BINARY_FORMATS, RESULT_FORMATS, arrow_available, build_result, iter_arrow_ipc
+)
+from schema_snapshot import SchemaCache, parse_schema_list
+from schema_training import (
+    UPDATE_MODES, SchemaTrainingState, apply_schema_update, existing_ddl_ids, plan_schema_update
+)
+from sql_utils import first_keyword, is_read_only
+from streaming import STREAM_FORMATS, CursorBatches, iter_stream
+from training_jobs import TrainingJobManager, parse_training_items
 
 # Cargar variables de entorno
 load_dotenv()
@@ -21,74 +56,732 @@ DB_CONFIG = {
 
 # Configuración de Vanna
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'vanna').lower()
+LLM_MODEL = os.getenv('LLM_MODEL', 'gemini/gemini-1.5-flash')
+
+# Serialización JSON: default = proveedor estándar de Flask (el formato que consume el cliente Laravel);
+# fast = orjson (si está instalado) y conversión por columna según el OID. fast es opcional porque cambia
+# el formato: fechas ISO 8601 en lugar de RFC 822, claves en el orden de las columnas en lugar de
+# ordenadas, NUMERIC según JSON_DECIMAL_MODE y cuerpos de petición leídos con orjson
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'default').lower()
+if JSON_PROVIDER not in ('default', 'fast'):
+    raise ValueError(f'Unsupported JSON_PROVIDER: {JSON_PROVIDER}')
+JSON_DECIMAL_MODE = os.getenv('JSON_DECIMAL_MODE', 'str').lower()
+if JSON_DECIMAL_MODE not in DECIMAL_MODES:
+    raise ValueError(f'Unsupported JSON_DECIMAL_MODE: {JSON_DECIMAL_MODE}')
+
+class TimedJSONProvider(FastJSONProvider if JSON_PROVIDER == 'fast' else DefaultJSONProvider):
+    """Proveedor JSON de Flask que mide la codificación de las respuestas"""
+
+    decimal_mode = JSON_DECIMAL_MODE
+
+    def response(self, *args, **kwargs):
+        with span('json_encode'):
+            return super().response(*args, **kwargs)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
-# Inicializar Vanna con Gemini
-vn = VannaDefault(model='gemini/gemini-1.5-flash', api_key=GEMINI_API_KEY)
-
-# Pool de conexiones
-connection_pool = None
-
-def get_connection():
-    """Obtiene una conexión del pool"""
-    global connection_pool
-    if connection_pool is None:
-        connection_pool = pool.SimpleConnectionPool(
-            1, 10,
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database=DB_CONFIG['database'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
+# Instrumentación: umbral del log de peticiones lentas y cabecera Server-Timing
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '2000'))
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+
+# Compresión negociada por Accept-Encoding (zstd y br solo si están instalados) a partir de COMPRESSION_MIN_BYTES.
+# Va por fuera de Flask: after_request y las estadísticas de consultas siguen viendo los bytes sin comprimir
+response_compressor = ResponseCompressor(
+    enabled=os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true',
+    encodings=[e.strip() for e in os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if e.strip()],
+    min_size=int(os.getenv('COMPRESSION_MIN_BYTES', '1024')),
+    levels={
+        'gzip': int(os.getenv('COMPRESSION_LEVEL_GZIP', '5')),
+        'br': int(os.getenv('COMPRESSION_LEVEL_BR', '4')),
+        'zstd': int(os.getenv('COMPRESSION_LEVEL_ZSTD', '3'))
+    }
+)
+app.wsgi_app = CompressionMiddleware(app.wsgi_app, response_compressor)
+
+def create_vanna():
+    """Instancia de Vanna según VECTOR_STORE (remote = almacén de Vanna, local = en disco)
+
+    vanna, pandas y el almacén local se importan aquí y no al importar el módulo: un worker nuevo
+    arranca sin pagar esa importación.
+    """
+    from vanna import VannaDefault
+    if os.getenv('VECTOR_STORE', 'remote').lower() != 'local':
+        return VannaDefault(model=LLM_MODEL, api_key=GEMINI_API_KEY)
+    from vector_store import HashingEmbedder, LocalVectorStore, SentenceTransformerEmbedder
+    
+    class LocalVanna(LocalVectorStore, VannaDefault):
+        """Vanna con los datos de entrenamiento en el almacén vectorial local (sin ida y vuelta remota)"""
+        
+        def __init__(self, model, api_key, store_path, **store_options):
+            VannaDefault.__init__(self, model=model, api_key=api_key)
+            LocalVectorStore.__init__(self, store_path, **store_options)
+    
+    embedding_model = os.getenv('VECTOR_EMBEDDING_MODEL')
+    top_k = int(os.getenv('VECTOR_TOP_K', '10'))
+    return LocalVanna(
+        model=LLM_MODEL,
+        api_key=GEMINI_API_KEY,
+        store_path=os.getenv('VECTOR_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_data')),
+        embedder=SentenceTransformerEmbedder(embedding_model) if embedding_model else HashingEmbedder(),
+        n_results_sql=int(os.getenv('VECTOR_TOP_K_SQL', str(top_k))),
+        n_results_ddl=int(os.getenv('VECTOR_TOP_K_DDL', str(top_k))),
+        n_results_documentation=int(os.getenv('VECTOR_TOP_K_DOCUMENTATION', str(top_k))),
+        nprobe=int(os.getenv('VECTOR_NPROBE', '8')),
+        ivf_min_size=int(os.getenv('VECTOR_IVF_MIN_SIZE', '5000'))
+    )
+
+_vanna = None
+_vanna_lock = threading.Lock()
+
+def get_vanna():
+    """Instancia de Vanna, construida en el primer uso o por el calentamiento en segundo plano"""
+    global _vanna
+    if _vanna is None:
+        with _vanna_lock:
+            if _vanna is None:
+                instance = create_vanna()
+                instance.submit_prompt = llm_client.submit_prompt
+                # Configurar Vanna para usar nuestra función
+                instance.run_sql = execute_sql
+                instance.run_sql_is_set = True
+                _vanna = instance
+    return _vanna
+
+def vanna_ready():
+    return _vanna is not None
+
+class LazyVanna:
+    """`vn` diferido: el resto del código usa vn.* y la instancia se crea en el primer acceso"""
+
+    def __getattr__(self, name):
+        return getattr(get_vanna(), name)
+
+def vanna_submit_prompt(prompt, **kwargs):
+    """submit_prompt original de VannaDefault (LLM_BACKEND=vanna); la instancia tiene el de llm_client"""
+    instance = get_vanna()
+    return type(instance).submit_prompt(instance, prompt, **kwargs)
+
+# Inicializar Vanna con Gemini (de forma diferida)
+vn = LazyVanna()
+
+# Capa de LLM (LLM_BACKEND=vanna|gemini|openai|mock) con coalescencia, timeout, reintentos y circuit breaker
+if LLM_BACKEND not in LLM_BACKENDS:
+    raise ValueError(f'Unsupported LLM_BACKEND: {LLM_BACKEND}')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+# Llamadas simultáneas al LLM; asgi_server dimensiona su executor con el mismo valor
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', '32'))
+llm_client = LLMClient(
+    create_llm_backend(
+        LLM_BACKEND,
+        model=LLM_MODEL,
+        api_key=os.getenv('LLM_API_KEY') or GEMINI_API_KEY,
+        vanna_submit_prompt=vanna_submit_prompt,
+        base_url=os.getenv('LLM_BASE_URL'),
+        timeout=LLM_TIMEOUT,
+        mock_responses_path=os.getenv('LLM_MOCK_RESPONSES'),
+        mock_sql=os.getenv('LLM_MOCK_SQL', 'SELECT 1 AS mock'),
+        mock_latency=float(os.getenv('LLM_MOCK_LATENCY_MS', '0')) / 1000
+    ),
+    timeout=LLM_TIMEOUT,
+    retries=int(os.getenv('LLM_RETRIES', '2')),
+    backoff=float(os.getenv('LLM_BACKOFF', '0.5')),
+    failure_threshold=int(os.getenv('LLM_CIRCUIT_FAILURES', '5')),
+    reset_timeout=float(os.getenv('LLM_CIRCUIT_RESET', '30')),
+    max_concurrency=LLM_CONCURRENCY,
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '10'))
+)
+
+# Preguntas idénticas simultáneas comparten una sola generación de SQL
+question_flight = SingleFlight()
+
+# Caché pregunta→SQL (QUESTION_CACHE_SIMILARITY > 0 activa la búsqueda por embeddings)
+question_cache = QuestionSQLCache(
+    max_size=int(os.getenv('QUESTION_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('QUESTION_CACHE_TTL', '3600')),
+    similarity_threshold=float(os.getenv('QUESTION_CACHE_SIMILARITY', '0')),
+    embed_fn=lambda text: vn.generate_embedding(text)
+)
+
+# Caché de resultados de execute_sql (RESULT_CACHE_BACKEND=local|redis)
+result_cache = create_result_cache(
+    backend_name=os.getenv('RESULT_CACHE_BACKEND', 'local'),
+    redis_url=os.getenv('REDIS_URL'),
+    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('RESULT_CACHE_TTL', '60')),
+    max_rows=int(os.getenv('RESULT_CACHE_MAX_ROWS', '5000')),
+    enabled=os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+)
+
+# Foto del esquema en memoria; el checksum del catálogo se verifica cada SCHEMA_CHECK_INTERVAL s.
+# SCHEMA_INCLUDE/SCHEMA_EXCLUDE eligen los esquemas (con * como comodín); las particiones se
+# pliegan en su tabla padre y pg_stats aporta filas estimadas y valores distintos por columna
+SCHEMA_CHECK_INTERVAL = float(os.getenv('SCHEMA_CHECK_INTERVAL', '30'))
+SCHEMA_OPTIONS = {
+    'include': parse_schema_list(os.getenv('SCHEMA_INCLUDE'), default=['public']),
+    'exclude': parse_schema_list(os.getenv('SCHEMA_EXCLUDE')),
+    'collapse_partitions': os.getenv('SCHEMA_COLLAPSE_PARTITIONS', 'true').lower() == 'true',
+    'include_views': os.getenv('SCHEMA_INCLUDE_VIEWS', 'true').lower() == 'true',
+    'include_materialized_views': os.getenv('SCHEMA_INCLUDE_MATVIEWS', 'true').lower() == 'true',
+    'column_stats': os.getenv('SCHEMA_COLUMN_STATS', 'true').lower() == 'true'
+}
+schema_cache = SchemaCache(check_interval=SCHEMA_CHECK_INTERVAL, **SCHEMA_OPTIONS)
+schema_caches = {DB_CONFIG['database']: schema_cache}
+
+def get_schema_cache(database=None):
+    """Foto del esquema de la base indicada (una por base de datos)"""
+    database = database or current_database()
+    cache = schema_caches.get(database)
+    if cache is None:
+        cache = schema_caches.setdefault(
+            database, SchemaCache(check_interval=SCHEMA_CHECK_INTERVAL, **SCHEMA_OPTIONS)
         )
-    return connection_pool.getconn()
+    return cache
+
+# Registro de los DDL ya entrenados para que update_schema solo entrene las diferencias
+SCHEMA_TRAINING_STATE_PATH = os.getenv(
+    'SCHEMA_TRAINING_STATE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema_training_state.json')
+)
 
-def return_connection(conn):
+def get_schema_training_state(database=None):
+    """Registro de entrenamiento de la base indicada"""
+    database = database or current_database()
+    return SchemaTrainingState(
+        path=SCHEMA_TRAINING_STATE_PATH,
+        key=f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{database}/{schema_cache.schema}"
+    )
+
+# Presupuestos de ejecución por endpoint: statement_timeout, máximo de filas y de bytes
+EXECUTION_BUDGETS = load_budgets()
+# Las respuestas materializadas se sirven en chat y ask: se calculan con el más amplio y cada uno recorta al suyo
+MATERIALIZED_BUDGET = widest_budget((EXECUTION_BUDGETS['chat'], EXECUTION_BUDGETS['ask']), 'materialized')
+
+# Verificación previa con EXPLAIN del SQL generado en chat/ask (QUERY_GUARD_ACTION=reject|rewrite)
+query_guard = QueryGuard(
+    enabled=os.getenv('QUERY_GUARD_ENABLED', 'false').lower() == 'true',
+    max_cost=float(os.getenv('QUERY_GUARD_MAX_COST', '100000')),
+    max_rows=int(os.getenv('QUERY_GUARD_MAX_ROWS', '10000')),
+    action=os.getenv('QUERY_GUARD_ACTION', 'rewrite'),
+    page_size=int(os.getenv('QUERY_PAGE_SIZE', '1000')),
+    secret=os.getenv('QUERY_CURSOR_SECRET'),
+    cursor_ttl=int(os.getenv('QUERY_CURSOR_TTL', '3600'))
+)
+# Procesos que atienden peticiones (gunicorn usa WEB_CONCURRENCY): con más de uno los cursores
+# tienen que firmarse con un QUERY_CURSOR_SECRET común
+SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+def check_cursor_secret(workers):
+    """Falla con varios workers y sin secreto compartido; con uno solo, avisa"""
+    if not query_guard.enabled or not query_guard.ephemeral_secret:
+        return
+    if workers > 1:
+        raise RuntimeError(
+            f'QUERY_CURSOR_SECRET must be set when serving with {workers} workers: '
+            'pagination cursors signed by one worker are rejected by the others'
+        )
+    app.logger.warning('QUERY_CURSOR_SECRET is not set: pagination cursors are only valid in this process '
+                       'and stop working after a restart')
+
+# Consultas repetidas que solo cambian en sus literales: PREPARE una vez por conexión y EXECUTE
+prepared_statements = PreparedStatements(
+    enabled=os.getenv('PREPARED_STATEMENTS_ENABLED', 'true').lower() == 'true',
+    threshold=int(os.getenv('PREPARED_STATEMENTS_THRESHOLD', '2')),
+    max_per_connection=int(os.getenv('PREPARED_STATEMENTS_PER_CONNECTION', '100'))
+)
+
+# Estadísticas por huella de consulta: qué SQL generado cuesta más a la base de datos
+query_stats = QueryStats(
+    path=os.getenv(
+        'QUERY_STATS_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_stats.json')
+    ) or None,
+    max_entries=int(os.getenv('QUERY_STATS_MAX_ENTRIES', '1000')),
+    snapshot_interval=float(os.getenv('QUERY_STATS_SNAPSHOT_INTERVAL', '300')),
+    enabled=os.getenv('QUERY_STATS_ENABLED', 'true').lower() == 'true'
+)
+atexit.register(query_stats.stop)
+
+# Respuestas materializadas: preguntas fijadas o frecuentes servidas desde un resultado precalculado
+answer_store = AnswerStore(
+    execute=lambda sql, database, question: execute_materialized(sql, database, question),
+    refresh_interval=float(os.getenv('ANSWER_REFRESH_INTERVAL', '300')),
+    max_staleness=float(os.getenv('ANSWER_MAX_STALENESS', '3600')),
+    promote_threshold=int(os.getenv('ANSWER_PROMOTE_THRESHOLD', '10')),
+    promote_window=float(os.getenv('ANSWER_PROMOTE_WINDOW', '600')),
+    idle_timeout=float(os.getenv('ANSWER_IDLE_TIMEOUT', '3600')),
+    max_entries=int(os.getenv('ANSWER_STORE_MAX', '100')),
+    refresh_workers=int(os.getenv('ANSWER_REFRESH_WORKERS', '2')),
+    pins_path=os.getenv(
+        'ANSWER_PINS_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'answer_pins.json')
+    ) or None,
+    enabled=os.getenv('ANSWER_STORE_ENABLED', 'true').lower() == 'true'
+)
+atexit.register(answer_store.stop)
+
+class QueryCancelled(Exception):
+    """La consulta se canceló porque el cliente cerró la conexión"""
+
+# Tamaño de lote para respuestas en streaming
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '2000'))
+SERVER_CURSOR_KEYWORDS = ('SELECT', 'WITH', 'VALUES', 'TABLE')
+DDL_KEYWORDS = ('CREATE', 'ALTER', 'DROP', 'COMMENT')
+
+# Pool de conexiones (thread-safe, con espera acotada y métricas)
+POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN', '1')),
+    'max_size': int(os.getenv('DB_POOL_MAX', '10')),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+    'health_check_interval': float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+}
+
+# Registro de pools por base de datos y rol: DB_REPLICAS=host[:puerto],... recibe las lecturas
+# y DB_DATABASES=a,b (o '*') lista las bases que se pueden pedir con database / X-Database
+db_registry = PoolRegistry(
+    DB_CONFIG,
+    POOL_CONFIG,
+    replicas=parse_hosts(os.getenv('DB_REPLICAS'), DB_CONFIG['port']),
+    allowed_databases=parse_databases(os.getenv('DB_DATABASES')),
+    max_replica_lag=float(os.getenv('DB_REPLICA_MAX_LAG', '5')),
+    lag_check_interval=float(os.getenv('DB_REPLICA_LAG_CHECK_INTERVAL', '5')),
+    tenant_min_size=int(os.getenv('DB_TENANT_POOL_MIN', '0')),
+    max_pools=int(os.getenv('DB_MAX_POOLS', '32'))
+)
+connection_pool = db_registry.pool()
+
+def current_database():
+    """Base de datos elegida para la petición actual (o la de DB_NAME)"""
+    if has_app_context():
+        return g.get('database') or db_registry.default_database
+    return db_registry.default_database
+
+def get_connection(read_only=False):
+    """Obtiene una conexión del pool (las lecturas pueden ir a una réplica)"""
+    with span('pool_checkout'):
+        conn = db_registry.getconn(current_database(), read_only=read_only)
+    if has_request_context():
+        g.db_route = db_registry.route_of(conn)
+    return conn
+
+def return_connection(conn, close=False):
     """Devuelve una conexión al pool"""
-    connection_pool.putconn(conn)
+    db_registry.putconn(conn, close=close)
 
-def execute_sql(sql: str):
+def apply_statement_timeout(conn, budget):
+    """Fija statement_timeout solo para la transacción actual"""
+    if budget.get('statement_timeout_ms'):
+        with conn.cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = %s', (int(budget['statement_timeout_ms']),))
+
+def watch_disconnect(conn):
+    """Cancela la consulta en curso si el cliente HTTP se desconecta"""
+    if not has_request_context():
+        return None
+    sock = client_socket(request.environ)
+    if sock is None:
+        return None
+    return DisconnectWatcher(sock, conn.cancel).start()
+
+def invalidate_after_write(sql: str, database: str):
+    """Invalida los resultados en caché, las respuestas materializadas y (con DDL) el esquema que dependen de la sentencia"""
+    result_cache.invalidate_for(sql)
+    answer_store.invalidate_for(sql, database)
+    if first_keyword(sql) in DDL_KEYWORDS:
+        get_schema_cache(database).invalidate()
+
+def execute_sql(sql: str, fmt: str = 'records', budget=None, question=None, use_cache=True):
     """Ejecuta SQL en PostgreSQL y retorna los resultados"""
+    budget = budget or EXECUTION_BUDGETS['default']
+    record_sql(sql)
+    namespace = f"{current_database()}:{fmt}:{budget['max_rows']}:{budget['max_response_bytes']}"
+    cached = result_cache.lookup(sql, namespace=namespace) if use_cache else None
+    if cached is not None:
+        query_stats.record_cache_hit(sql, current_database())
+        return cached
+    
     conn = None
     cursor = None
+    watcher = None
+    started = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(sql)
+        conn = get_connection(read_only=supports_server_cursor(sql))
+        watcher = watch_disconnect(conn)
+        apply_statement_timeout(conn, budget)
+        
+        # Las lecturas usan un cursor de servidor para no traer más filas que el límite; si la
+        # consulta ya se repitió con otros literales, una sentencia preparada con LIMIT hace lo mismo
+        prepared = None
+        if supports_server_cursor(sql):
+            max_rows = budget['max_rows']
+            prepared = prepared_statements.statement(conn, sql, max_rows + 1 if max_rows else None)
+        if prepared:
+            cursor = conn.cursor()
+        elif supports_server_cursor(sql):
+            cursor = conn.cursor(name=f'query_{uuid.uuid4().hex}')
+        else:
+            cursor = conn.cursor()
+        started = time.perf_counter()
+        with span('execute'):
+            if prepared:
+                cursor.execute(*prepared)
+            else:
+                cursor.execute(sql)
+        
+        # Leer los lotes del cursor dentro del presupuesto de filas y bytes
+        with span('fetch'):
+            if cursor.name or cursor.description:
+                batches, truncation = fetch_within_budget(cursor, budget, STREAM_BATCH_SIZE)
+            else:
+                batches, truncation = [], None
+        elapsed = time.perf_counter() - started
         
         # Obtener columnas
         columns = [desc[0] for desc in cursor.description] if cursor.description else []
         
-        # Obtener resultados
-        results = cursor.fetchall() if cursor.description else []
+        # Construir el resultado en el formato pedido
+        with span('serialize'):
+            converters = result_converters(cursor.description)
+            if converters:
+                batches = list(convert_batches(batches, converters))
+            result = build_result(columns, batches, fmt)
+        result['truncated'] = truncation is not None
+        if truncation:
+            result['truncation_reason'] = truncation
+            result['limits'] = {'max_rows': budget['max_rows'], 'max_response_bytes': budget['max_response_bytes']}
         
+        cursor.close()
+        cursor = None
         conn.commit()
+        record_query_stat(sql, elapsed, result['row_count'], question)
         
-        # Formatear resultados
-        data = []
-        for row in results:
-            data.append(dict(zip(columns, row)))
-        
-        return {
-            'data': data,
-            'columns': columns,
-            'row_count': len(data)
-        }
+        invalidate_after_write(sql, current_database())
+        result_cache.store(sql, result, namespace=namespace)
+        return result
     except Exception as e:
         if conn:
             conn.rollback()
+            prepared_statements.forget(conn, e)
+        if started is not None:
+            record_query_stat(sql, time.perf_counter() - started, 0, question, error=True)
+        if watcher and watcher.disconnected:
+            raise QueryCancelled('Query cancelled: client disconnected') from e
         raise e
     finally:
+        if watcher:
+            watcher.stop()
         if cursor:
             cursor.close()
         if conn:
             return_connection(conn)
 
-# Configurar la función de ejecución SQL para Vanna
-vn.run_sql = execute_sql
-vn.run_sql_is_set = True
+def record_query_stat(sql, elapsed, rows, question=None, error=False):
+    """Agrega la ejecución a su huella y la anota en la petición para atribuirle los bytes de la respuesta"""
+    key = query_stats.record(sql, current_database(), elapsed, rows, question, error)
+    if key is not None and has_request_context():
+        g.setdefault('query_stat_keys', []).append((key, rows))
+
+def execute_materialized(sql, database, question):
+    """Ejecuta el SQL de una respuesta materializada en su base de datos, sin pasar por la caché de resultados"""
+    with app.app_context():
+        g.database = database
+        return execute_sql(sql, 'rows', MATERIALIZED_BUDGET, question, use_cache=False)
+
+def materialized_answer(question: str, fmt: str, budget: dict):
+    """Respuesta precalculada de una pregunta fijada o promovida, recortada al presupuesto del endpoint
+
+    Retorna (sql, resultados, extra) o None.
+    """
+    if fmt not in RESULT_FORMATS:
+        return None
+    return answer_store.lookup(question, current_database(), fmt, budget)
+
+def observe_answer(question: str, sql: str, extra: dict):
+    """Cuenta la pregunta para la promoción automática (las respuestas paginadas no se materializan)"""
+    if 'page' not in extra:
+        answer_store.observe(question, current_database(), sql)
+
+def result_converters(description):
+    """Conversores a JSON nativo por columna según los OIDs del cursor (solo con JSON_PROVIDER=fast)"""
+    if JSON_PROVIDER != 'fast' or not description:
+        return None
+    converters = column_converters([desc[1] for desc in description], JSON_DECIMAL_MODE)
+    return converters if any(converters) else None
+
+def run_generated_sql(sql, fmt, budget, question=None, cursor_token=None):
+    """Ejecuta SQL generado con la verificación EXPLAIN y la paginación automática
+
+    Retorna (sql original, resultados, datos extra para la respuesta: plan y/o page).
+    """
+    extra = {}
+    if cursor_token:
+        state = query_guard.decode_cursor(cursor_token, current_database())
+        sql, offset, page_size = state['sql'], state['offset'], state['page_size']
+        results = execute_sql(query_guard.paginate(sql, offset, page_size), fmt, budget, state.get('question'))
+        extra['page'] = query_guard.page_info(
+            sql, offset, page_size, results['row_count'], state.get('question'), current_database()
+        )
+        extra['question'] = state.get('question')
+        return sql, results, extra
+    
+    if not query_guard.enabled or not supports_server_cursor(sql):
+        return sql, execute_sql(sql, fmt, budget, question), extra
+    
+    # Verificación previa: costo y filas estimadas por el planificador
+    conn = get_connection(read_only=True)
+    try:
+        apply_statement_timeout(conn, budget)
+        with span('explain'):
+            estimate = query_guard.estimate(conn, sql)
+            extra['plan'] = estimate
+            executed_sql, page_size = query_guard.decide(sql, estimate, lambda page: query_guard.estimate(conn, page))
+        conn.commit()
+    finally:
+        return_connection(conn)
+    
+    results = execute_sql(executed_sql, fmt, budget, question)
+    if page_size:
+        extra['page'] = query_guard.page_info(sql, 0, page_size, results['row_count'], question, current_database())
+    return sql, results, extra
+
+def iter_sql_batches(sql: str, batch_size: int = STREAM_BATCH_SIZE):
+    """Ejecuta una lectura con un cursor de servidor y retorna (descripción, iterador de lotes)"""
+    conn = get_connection(read_only=True)
+    cursor = None
+    
+    def release(success):
+        try:
+            if cursor:
+                cursor.close()
+            if success:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            return_connection(conn)
+    
+    try:
+        apply_statement_timeout(conn, EXECUTION_BUDGETS['stream'])
+        cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+        cursor.itersize = batch_size
+        cursor.execute(sql)
+        # El cursor con nombre solo conoce la descripción después del primer fetch
+        first = cursor.fetchmany(batch_size)
+        description = cursor.description or []
+    except Exception:
+        release(False)
+        raise
+    
+    return description, CursorBatches(cursor, batch_size, first, release)
+
+def supports_server_cursor(sql: str):
+    """Indica si la sentencia puede leerse con un cursor de servidor"""
+    return first_keyword(sql) in SERVER_CURSOR_KEYWORDS and is_read_only(sql)
+
+def stream_sql(sql: str, fmt: str, extra=None):
+    """Respuesta Flask en streaming (NDJSON o arreglo JSON por partes) para una consulta"""
+    record_sql(sql)
+    if supports_server_cursor(sql):
+        description, batches = iter_sql_batches(sql)
+        columns = [desc[0] for desc in description]
+        converters = result_converters(description)
+    else:
+        # Los cursores de servidor solo admiten lecturas; las escrituras usan la ruta normal
+        results = execute_sql(sql, 'rows')
+        columns = results['columns']
+        batches = iter([results['data']])
+        converters = None
+    body = iter_stream(fmt, columns, convert_batches(batches, converters) if converters else batches, app.json.dumps, extra)
+    response = Response(body, mimetype=STREAM_FORMATS[fmt])
+    if isinstance(batches, CursorBatches):
+        # Si el cliente se desconecta antes de empezar, la conexión vuelve igualmente al pool
+        response.call_on_close(batches.close)
+    return response
+
+def arrow_response(sql: str, metadata=None):
+    """Respuesta binaria Arrow IPC construida lote a lote desde el cursor"""
+    record_sql(sql)
+    description, batches = iter_sql_batches(sql)
+    body = iter_arrow_ipc(description, batches, metadata)
+    response = Response(body, mimetype=ARROW_MIMETYPE)
+    response.call_on_close(batches.close)
+    return response
+
+def requested_result_format(data):
+    """Formato de resultados pedido en el cuerpo (format) o en la URL (?format=)"""
+    return (data or {}).get('format') or request.args.get('format') or 'records'
+
+def result_format_error(fmt: str, sql: str = None):
+    """Mensaje de error si el formato pedido no es válido para la consulta, o None"""
+    if fmt not in RESULT_FORMATS + BINARY_FORMATS:
+        return f'Unsupported result format: {fmt}'
+    if fmt == 'arrow' and not arrow_available():
+        return 'format=arrow requires the pyarrow package'
+    if fmt == 'arrow' and sql is not None and not supports_server_cursor(sql):
+        return 'format=arrow is only supported for read-only queries'
+    return None
+
+def requested_stream_format(data):
+    """Formato de streaming pedido en el cuerpo (stream) o en la URL (?stream=)"""
+    fmt = (data or {}).get('stream') or request.args.get('stream')
+    if fmt is True:
+        fmt = 'ndjson'
+    return fmt or None
+
+# Varias preguntas por petición: generación y ejecución en paralelo con límite por lote
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '20'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', '120'))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '16'))
+batch_executor = FanOutExecutor(max_workers=BATCH_WORKERS)
+
+def batch_concurrency(value):
+    """Concurrencia pedida para un lote, acotada a [1, BATCH_WORKERS]; None si no es un entero"""
+    if value is None:
+        return min(BATCH_CONCURRENCY, BATCH_WORKERS)
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return max(1, min(value, BATCH_WORKERS))
+
+# Copia en memoria de los datos de entrenamiento para get_training_data (paginado, filtros, ETag)
+LISTING_MAX_PAGE_SIZE = int(os.getenv('LISTING_MAX_PAGE_SIZE', '1000'))
+training_snapshot = TrainingDataSnapshot(lambda: vn.get_training_data())
+
+def training_data_changed():
+    """Invalida lo que depende de los datos de entrenamiento"""
+    question_cache.invalidate()
+    training_snapshot.invalidate()
+    answer_store.invalidate_generated()
+
+# Entrenamiento masivo en segundo plano; cada lote completado invalida la caché pregunta→SQL
+training_jobs = TrainingJobManager(
+    vn,
+    batch_size=int(os.getenv('TRAINING_BATCH_SIZE', '50')),
+    max_workers=int(os.getenv('TRAINING_WORKERS', '2')),
+    on_batch_done=training_data_changed
+)
+
+def listing_response(body, etag):
+    """Respuesta con ETag; 304 sin cuerpo si el cliente ya tiene esta página"""
+    # Comparación débil: la representación comprimida se envía con el ETag como W/"..."
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def generate_sql_cached(question: str):
+    """Genera SQL para una pregunta usando la caché pregunta→SQL"""
+    sql = question_cache.get(question)
+    if sql is not None:
+        return sql
+    generation = question_cache.generation
+    
+    def generate():
+        sql = vn.generate_sql(question=question)
+        question_cache.put(question, sql, generation=generation)
+        return sql
+    
+    with span('generate_sql'):
+        return question_flight.do((normalize_question(question), generation), generate)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def select_database():
+    """Base de datos de la petición: campo database, ?database= o cabecera X-Database"""
+    data = request.get_json(silent=True) if request.is_json else None
+    name = (
+        (data.get('database') if isinstance(data, dict) else None)
+        or request.args.get('database')
+        or request.headers.get('X-Database')
+    )
+    try:
+        g.database = db_registry.resolve_database(name)
+    except UnknownDatabase as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.after_request
+def record_request_metrics(response):
+    """Registra la duración de la petición, la cabecera Server-Timing y el log de lentas"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unknown'
+    status = str(response.status_code)
+    metrics.request_duration.observe(elapsed, endpoint, request.method, status)
+    metrics.requests_total.inc(endpoint, request.method, status)
+    
+    timings = g.get('phase_timings', {})
+    if SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings, elapsed)
+    route = g.get('db_route')
+    if route:
+        response.headers['X-Database-Route'] = f'{route[0]}@{route[1]}'
+    executed = g.get('query_stat_keys')
+    if executed and not response.is_streamed:
+        query_stats.add_response_bytes(executed, response.content_length)
+    
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        metrics.slow_requests_total.inc(endpoint)
+        app.logger.warning(
+            'Slow request %s %s: %.1f ms phases=%s sql=%s',
+            request.method, request.path, elapsed * 1000,
+            {phase: round(value * 1000, 1) for phase, value in timings.items()},
+            g.get('request_sql', [])
+        )
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    registry_stats = db_registry.stats()
+    question_stats = question_cache.stats()
+    result_stats = result_cache.stats()
+    extra = []
+    connections = {}
+    events = {}
+    for pool_name, pool_stats in registry_stats['pools'].items():
+        for state in ('in_use', 'idle', 'waiting'):
+            connections[(('pool', pool_name), ('state', state))] = pool_stats[state]
+        for event, key in (('checkouts', 'checkouts'), ('checkout_failures', 'checkout_failures'),
+                           ('timeouts', 'timeouts'), ('wait_time_seconds_total', 'wait_time_total')):
+            events[(('pool', pool_name), ('event', event))] = pool_stats[key]
+    extra += metrics.render_gauges('vanna_pool_connections', 'Conexiones del pool por estado', connections)
+    extra += metrics.render_gauges('vanna_pool_events', 'Eventos acumulados del pool', events)
+    extra += metrics.render_gauges('vanna_replica_lag_seconds', 'Retraso medido de cada réplica', {
+        (('replica', f"{replica['host']}:{replica['port']}"),): replica['lag_seconds']
+        for replica in registry_stats['replicas'] if replica['lag_seconds'] is not None
+    })
+    extra += metrics.render_gauges('vanna_db_routed', 'Conexiones entregadas por destino', {
+        (('route', route),): count for route, count in registry_stats['routed'].items()
+    })
+    extra += metrics.render_gauges('vanna_cache_lookups', 'Consultas a las cachés por resultado', {
+        (('cache', 'question'), ('result', 'hit')): question_stats['hits'] + question_stats['semantic_hits'],
+        (('cache', 'question'), ('result', 'miss')): question_stats['misses'],
+        (('cache', 'result'), ('result', 'hit')): result_stats['hits'],
+        (('cache', 'result'), ('result', 'miss')): result_stats['misses']
+    })
+    llm_stats = llm_client.stats()
+    extra += metrics.render_gauges('vanna_llm_events', 'Llamadas al LLM por resultado', {
+        (('event', event),): llm_stats[event]
+        for event in ('calls', 'completions', 'failures', 'retries', 'timeouts', 'rejected', 'busy', 'coalesced')
+    })
+    extra += metrics.render_gauges('vanna_llm_circuit_open', 'Circuito del LLM abierto (1) o cerrado (0)', {
+        (): int(llm_stats['circuit']['state'] != 'closed')
+    })
+    return Response(metrics.render_all(extra), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/v0/generate_sql', methods=['GET'])
 def generate_sql():
@@ -98,8 +791,10 @@ def generate_sql():
         if not question:
             return jsonify({'error': 'Question parameter is required'}), 400
         
-        sql = vn.generate_sql(question=question)
+        sql = generate_sql_cached(question)
         return jsonify({'sql': sql})
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -113,7 +808,20 @@ def run_sql():
         if not sql:
             return jsonify({'error': 'SQL query is required'}), 400
         
-        results = execute_sql(sql)
+        result_format = requested_result_format(data)
+        format_error = result_format_error(result_format, sql)
+        if format_error:
+            return jsonify({'error': format_error}), 400
+        if result_format == 'arrow':
+            return arrow_response(sql, {'sql': sql})
+        
+        stream_format = requested_stream_format(data)
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return jsonify({'error': f'Unsupported stream format: {stream_format}'}), 400
+        if stream_format:
+            return stream_sql(sql, stream_format)
+        
+        results = execute_sql(sql, result_format, EXECUTION_BUDGETS['run_sql'])
         return jsonify(results)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -149,16 +857,82 @@ def train():
         else:
             return jsonify({'error': 'Training data is required'}), 400
         
+        training_data_changed()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/v0/train/bulk', methods=['POST'])
+def train_bulk():
+    """Entrena en segundo plano un lote de entradas (arreglo JSON o JSONL)
+
+    `batched` en la respuesta indica si el almacén inserta cada lote de una vez (VECTOR_STORE=local);
+    con el almacén remoto por defecto las entradas se entrenan una a una.
+    """
+    try:
+        if request.is_json:
+            items = parse_training_items(request.get_json())
+        else:
+            items = parse_training_items(request.get_data())
+        
+        if not items:
+            return jsonify({'error': 'Training items are required'}), 400
+        
+        job = training_jobs.submit(items)
+        response = job.to_dict()
+        response['status_url'] = f'/api/v0/train/jobs/{job.id}'
+        return jsonify(response), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v0/train/jobs', methods=['GET'])
+def list_training_jobs():
+    """Lista los trabajos de entrenamiento recientes"""
+    return jsonify({'jobs': training_jobs.list()})
+
+@app.route('/api/v0/train/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """Progreso y errores de un trabajo de entrenamiento"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/v0/get_training_data', methods=['GET'])
 def get_training_data():
-    """Obtiene los datos de entrenamiento actuales"""
+    """Obtiene los datos de entrenamiento actuales
+
+    Servidos desde la copia en memoria: ?limit=&cursor= (o offset), ?type=, ?q= busca en pregunta
+    y contenido, ?fields=question,content proyecta campos. Sin limit se devuelve todo.
+    """
     try:
-        training_data = vn.get_training_data()
-        return jsonify({'training_data': training_data})
+        limit, offset, after = parse_page(request.args, LISTING_MAX_PAGE_SIZE)
+        fields = parse_fields(request.args.get('fields'), TRAINING_FIELDS)
+        records, ids, tag = training_snapshot.get()
+        etag = page_etag(tag, request.args)
+        if request.if_none_match.contains_weak(etag):
+            return listing_response(None, etag)
+        
+        training_data, total, next_cursor = list_training_data(
+            records, ids,
+            data_type=request.args.get('type'),
+            search=request.args.get('q'),
+            fields=fields,
+            limit=limit,
+            after=after,
+            offset=offset
+        )
+        return listing_response({
+            'training_data': training_data,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }, etag)
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -173,56 +947,51 @@ def remove_training_data():
             return jsonify({'error': 'ID is required'}), 400
         
         result = vn.remove_training_data(id=id)
+        training_data_changed()
         return jsonify({'success': result})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v0/get_schema', methods=['GET'])
 def get_schema():
-    """Obtiene el esquema de la base de datos"""
+    """Obtiene el esquema de la base de datos
+
+    ?limit=&cursor= (o offset) paginan por nombre de tabla; ?type=table,view, ?schema=a,b, ?prefix=
+    y ?q= (tabla o columna) filtran; ?fields=columns,primary_key proyecta. Sin limit se devuelve todo.
+    """
     try:
-        # Obtener todas las tablas
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Obtener tablas
-        cursor.execute("""
-            SELECT table_name, table_type
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-            ORDER BY table_name;
-        """)
-        tables = cursor.fetchall()
-        
-        schema_info = {}
-        
-        # Para cada tabla, obtener columnas
-        for table_name, table_type in tables:
-            cursor.execute("""
-                SELECT column_name, data_type, is_nullable, column_default
-                FROM information_schema.columns
-                WHERE table_name = %s AND table_schema = 'public'
-                ORDER BY ordinal_position;
-            """, (table_name,))
-            columns = cursor.fetchall()
-            
-            schema_info[table_name] = {
-                'type': table_type,
-                'columns': [
-                    {
-                        'name': col[0],
-                        'type': col[1],
-                        'nullable': col[2] == 'YES',
-                        'default': col[3]
-                    }
-                    for col in columns
-                ]
-            }
+        limit, offset, after = parse_page(request.args, LISTING_MAX_PAGE_SIZE)
+        fields = parse_fields(request.args.get('fields'), SCHEMA_FIELDS)
+        types = parse_schema_types(request.args.get('type'))
         
-        cursor.close()
-        return_connection(conn)
+        # Foto del esquema en memoria (una sola consulta al catálogo cuando cambia el DDL)
+        refresh = request.args.get('refresh', 'false').lower() == 'true'
+        snapshot = get_schema_cache().get(get_connection, return_connection, force=refresh)
+        etag = page_etag(f'{current_database()}:{snapshot.content_hash}', request.args)
+        if request.if_none_match.contains_weak(etag):
+            return listing_response(None, etag)
         
-        return jsonify({'schema': schema_info})
+        tables, total, next_cursor = list_schema(
+            snapshot,
+            types=types,
+            prefix=request.args.get('prefix'),
+            search=request.args.get('q'),
+            fields=fields,
+            limit=limit,
+            after=after,
+            offset=offset,
+            schemas=parse_schema_list(request.args.get('schema')) or None
+        )
+        return listing_response({
+            'schema': tables,
+            'version': snapshot.version,
+            'fingerprint': snapshot.fingerprint,
+            'total': total,
+            'limit': limit,
+            'next_cursor': next_cursor
+        }, etag)
+    except (ValueError, InvalidCursor) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -230,61 +999,335 @@ def get_schema():
 def get_databases():
     """Obtiene todas las bases de datos disponibles"""
     try:
-        conn = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database='postgres',
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
-        databases = [db[0] for db in cursor.fetchall()]
-        cursor.close()
-        conn.close()
-        return jsonify({'databases': databases})
+        # pg_database es un catálogo compartido: basta una conexión del pool existente
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT datname FROM pg_database WHERE datistemplate = false;")
+            databases = [db[0] for db in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+        finally:
+            return_connection(conn)
+        allowed = db_registry.allowed_databases
+        return jsonify({
+            'databases': databases,
+            'default': db_registry.default_database,
+            'available': databases if allowed is None else [db for db in databases if db in allowed]
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/v0/health', methods=['GET'])
-def health_check():
-    """Endpoint de verificación de salud"""
+# Arranque: importar el módulo no construye Vanna, no abre conexiones ni arranca hilos. create_app() lanza el
+# calentamiento en segundo plano; /health responde desde el primer momento y /ready indica cuándo terminó
+PROCESS_STARTED = time.time()
+WARM_UP_RETRY_INTERVAL = float(os.getenv('WARM_UP_RETRY_INTERVAL', '5'))
+startup_state = {'status': 'pending', 'started_at': None, 'ready_at': None, 'steps': {}}
+_warm_up_lock = threading.Lock()
+
+def probe_database():
+    """Abre las conexiones mínimas del pool y comprueba la conexión inicial"""
+    db_registry.warm_up()
+    db_registry.start_maintenance()
+    conn = get_connection()
     try:
-        # Verificar conexión a la base de datos
-        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT version()')
-        db_version = cursor.fetchone()[0]
+        version = cursor.fetchone()[0]
         cursor.execute('SELECT current_database()')
         db_name = cursor.fetchone()[0]
-        cursor.execute('SELECT current_user')
-        db_user = cursor.fetchone()[0]
         cursor.close()
+        conn.commit()
+    finally:
         return_connection(conn)
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': {
+    return {'name': db_name, 'version': version.split(',')[0]}
+
+def start_background_tasks():
+    """Hilos de mantenimiento: instantáneas de estadísticas, refresco de respuestas y LISTEN/NOTIFY"""
+    query_stats.start()
+    answer_store.start()
+    # Invalidación de respuestas materializadas con LISTEN/NOTIFY (conexión propia, fuera del pool)
+    channel = os.getenv('ANSWER_NOTIFY_CHANNEL', '')
+    answer_store.listen(lambda: psycopg2.connect(**DB_CONFIG), channel, db_registry.default_database)
+    return {'notify_channel': channel or None}
+
+WARM_UP_STEPS = (
+    ('vanna', lambda: {'class': type(get_vanna()).__name__}),
+    ('database', probe_database),
+    ('background_tasks', start_background_tasks)
+)
+
+def run_warm_up():
+    """Ejecuta los pasos pendientes y reintenta los fallidos hasta que todos terminan bien"""
+    steps = startup_state['steps']
+    while True:
+        for name, step in WARM_UP_STEPS:
+            previous = steps.get(name, {})
+            if previous.get('ok'):
+                continue
+            started = time.perf_counter()
+            try:
+                detail = step()
+            except Exception as e:
+                steps[name] = {'ok': False, 'error': str(e), 'attempts': previous.get('attempts', 0) + 1,
+                               'ms': round((time.perf_counter() - started) * 1000, 1)}
+                app.logger.warning('Warm-up step %s failed: %s', name, e)
+                continue
+            steps[name] = {'ok': True, 'detail': detail, 'attempts': previous.get('attempts', 0) + 1,
+                           'ms': round((time.perf_counter() - started) * 1000, 1)}
+            app.logger.info('Warm-up step %s done in %.1f ms', name, steps[name]['ms'])
+        if all(steps.get(name, {}).get('ok') for name, _ in WARM_UP_STEPS):
+            startup_state['ready_at'] = time.time()
+            startup_state['status'] = 'ready'
+            return
+        startup_state['status'] = 'degraded'
+        time.sleep(WARM_UP_RETRY_INTERVAL)
+
+def start_warm_up():
+    """Lanza el calentamiento en segundo plano una sola vez por proceso"""
+    with _warm_up_lock:
+        if startup_state['status'] != 'pending':
+            return False
+        startup_state['status'] = 'starting'
+        startup_state['started_at'] = time.time()
+    threading.Thread(target=run_warm_up, name='warm-up', daemon=True).start()
+    return True
+
+def create_app(warm_up=True):
+    """Punto de entrada de la aplicación (p. ej. gunicorn 'vanna_server:create_app()')
+
+    Retorna la app Flask al instante; Vanna, el pool y la prueba de conexión se preparan en segundo plano.
+    """
+    check_cursor_secret(SERVER_WORKERS)
+    if warm_up:
+        start_warm_up()
+    return app
+
+@app.route('/health', methods=['GET'])
+def liveness():
+    """Liveness: el proceso atiende peticiones (sin E/S ni inicialización)"""
+    return jsonify({'status': 'alive', 'uptime_seconds': round(time.time() - PROCESS_STARTED, 3)})
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness: 200 cuando Vanna y la base de datos están listos; 503 mientras se calienta"""
+    start_warm_up()
+    state = dict(startup_state, steps=dict(startup_state['steps']))
+    if state['ready_at']:
+        state['startup_seconds'] = round(state['ready_at'] - PROCESS_STARTED, 3)
+    return jsonify(state), 200 if state['status'] == 'ready' else 503
+
+# Chequeo profundo: versión, base y usuario salen de una sola consulta y se reutilizan durante
+# HEALTH_CACHE_TTL segundos (también los fallos), así los sondeos frecuentes no cargan el pool
+HEALTH_CACHE_TTL = float(os.getenv('HEALTH_CACHE_TTL', '10'))
+_health_checks = {}
+_health_lock = threading.Lock()
+
+def database_health(database, refresh=False):
+    """Resultado de la última comprobación de `database`; solo una petición la repite al expirar"""
+    cached = _health_checks.get(database)
+    if cached and not refresh and time.monotonic() - cached['monotonic'] < HEALTH_CACHE_TTL:
+        return cached, True
+    with _health_lock:
+        cached = _health_checks.get(database)
+        if cached and not refresh and time.monotonic() - cached['monotonic'] < HEALTH_CACHE_TTL:
+            return cached, True
+        started = time.perf_counter()
+        try:
+            conn = get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT version(), current_database(), current_user')
+                db_version, db_name, db_user = cursor.fetchone()
+                cursor.close()
+                conn.commit()
+            finally:
+                return_connection(conn)
+            check = {'ok': True, 'database': {
                 'name': db_name,
                 'host': DB_CONFIG['host'],
                 'port': DB_CONFIG['port'],
                 'version': db_version,
                 'user': db_user
-            },
-            'vanna': {
-                'model': 'gemini/gemini-1.5-flash',
-                'api_key_configured': bool(GEMINI_API_KEY)
-            },
-            'endpoints': {
-                'generate_sql': '/api/v0/generate_sql?question=...',
-                'run_sql': '/api/v0/run_sql (POST)',
-                'chat': '/api/v0/chat (POST)',
-                'get_schema': '/api/v0/get_schema',
-                'get_databases': '/api/v0/get_databases'
-            }
+            }}
+        except Exception as e:
+            check = {'ok': False, 'error': str(e)}
+        # La caché de resultados puede vivir en Redis: su tamaño se consulta junto con la base
+        try:
+            check['result_cache'] = result_cache.stats()
+        except Exception as e:
+            check['result_cache'] = {'error': str(e)}
+        check['check_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        check['checked_at'] = time.time()
+        check['monotonic'] = time.monotonic()
+        _health_checks[database] = check
+        return check, False
+
+@app.route('/api/v0/health', methods=['GET'])
+def health_check():
+    """Endpoint de verificación de salud (cacheado; ?refresh=1 fuerza una comprobación nueva)"""
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    try:
+        database = current_database()
+        check, cached = database_health(database, refresh=refresh)
+    except Exception as e:
+        return jsonify({'status': 'unhealthy', 'error': str(e), 'pools': db_registry.stats()}), 500
+    circuit = llm_client.breaker.stats()
+    if not check['ok']:
+        status = 'unhealthy'
+    elif circuit['state'] != 'closed' or startup_state['status'] != 'ready':
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    body = {
+        'status': status,
+        'check': {
+            'cached': cached,
+            'age_seconds': round(time.monotonic() - check['monotonic'], 3),
+            'ttl': HEALTH_CACHE_TTL,
+            'checked_at': check['checked_at'],
+            'duration_ms': check['check_ms']
+        },
+        'startup': startup_state['status'],
+        'database': check.get('database'),
+        'pool': db_registry.pool(database).stats(),
+        'pools': db_registry.stats(),
+        'caches': {
+            'question_cache': question_cache.stats(),
+            'result_cache': check['result_cache'],
+            'answer_store': answer_store.stats()
+        },
+        'vanna': {
+            'model': LLM_MODEL,
+            'backend': LLM_BACKEND,
+            'api_key_configured': bool(GEMINI_API_KEY),
+            'circuit': circuit['state']
+        },
+        'llm_circuit': circuit,
+        'endpoints': {
+            'generate_sql': '/api/v0/generate_sql?question=...',
+            'run_sql': '/api/v0/run_sql (POST)',
+            'chat': '/api/v0/chat (POST)',
+            'get_schema': '/api/v0/get_schema',
+            'get_databases': '/api/v0/get_databases',
+            'chat_batch': '/api/v0/chat/batch (POST)',
+            'cache_stats': '/api/v0/cache/stats',
+            'query_stats': '/api/v0/stats/queries?limit=20&sort=total_time',
+            'answers': '/api/v0/answers',
+            'liveness': '/health',
+            'readiness': '/ready'
+        }
+    }
+    if not check['ok']:
+        body['error'] = check['error']
+        return jsonify(body), 500
+    return jsonify(body)
+
+@app.route('/api/v0/cache/stats', methods=['GET'])
+def cache_stats():
+    """Obtiene los contadores de las cachés del servidor"""
+    return jsonify({
+        'question_cache': question_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'schema_cache': get_schema_cache().stats(),
+        'query_guard': query_guard.stats(),
+        'batch_executor': batch_executor.stats(),
+        'llm': llm_client.stats(),
+        'answer_store': answer_store.stats(),
+        'training_snapshot': training_snapshot.stats(),
+        'prepared_statements': prepared_statements.stats(),
+        'compression': response_compressor.stats(),
+        # Sin forzar la construcción de Vanna: antes del calentamiento no hay almacén que describir
+        'vector_store': _vanna.vector_store_stats() if vanna_ready() and hasattr(_vanna, 'vector_store_stats') else None
+    })
+
+@app.route('/api/v0/stats/queries', methods=['GET'])
+def query_statistics():
+    """Top-N de consultas por huella: tiempo, llamadas, filas y bytes, con las preguntas de origen"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        sort = request.args.get('sort', 'total_time')
+        if limit < 0:
+            return jsonify({'error': 'limit must be non-negative'}), 400
+        if sort not in QUERY_STATS_SORTS:
+            return jsonify({'error': f'Unsupported sort: {sort}'}), 400
+        
+        return jsonify({
+            'queries': query_stats.top(limit, sort, request.args.get('database')),
+            'sort': sort,
+            **query_stats.stats()
         })
     except Exception as e:
-        return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v0/stats/queries', methods=['DELETE'])
+def reset_query_statistics():
+    """Reinicia las estadísticas por huella"""
+    query_stats.reset()
+    return jsonify({'success': True})
+
+@app.route('/api/v0/answers', methods=['GET'])
+def list_answers():
+    """Preguntas materializadas (fijadas y promovidas) con la antigüedad de su resultado"""
+    return jsonify({
+        'answers': answer_store.entries(request.args.get('database')),
+        'stats': answer_store.stats()
+    })
+
+@app.route('/api/v0/answers', methods=['POST'])
+def pin_answer():
+    """Fija una pregunta: se genera (o se usa) su SQL y el resultado se precalcula y refresca"""
+    try:
+        data = request.json
+        question = data.get('question')
+        if not question:
+            return jsonify({'error': 'Question is required'}), 400
+        refresh_interval = data.get('refresh_interval')
+        if refresh_interval is not None and (not isinstance(refresh_interval, (int, float)) or refresh_interval <= 0):
+            return jsonify({'error': 'refresh_interval must be a positive number of seconds'}), 400
+        
+        sql = data.get('sql')
+        generated = not sql
+        if generated:
+            sql = generate_sql_cached(question)
+        if not is_read_only(sql):
+            return jsonify({'error': 'Only read-only SQL can be materialized', 'sql': sql}), 400
+        entry = answer_store.pin(question, current_database(), sql, refresh_interval, generated)
+        if entry.error:
+            answer_store.unpin(question, current_database())
+            return jsonify({'error': entry.error, 'sql': sql}), 400
+        return jsonify(entry.to_dict())
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v0/answers', methods=['DELETE'])
+def unpin_answer():
+    """Retira una pregunta del almacén de respuestas materializadas"""
+    data = request.get_json(silent=True) or {}
+    question = data.get('question') or request.args.get('question')
+    if not question:
+        return jsonify({'error': 'Question is required'}), 400
+    if not answer_store.unpin(question, current_database()):
+        return jsonify({'error': 'Question is not materialized'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/v0/answers/refresh', methods=['POST'])
+def refresh_answers():
+    """Refresca ya una pregunta materializada (o todas las de la base de datos)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        question = data.get('question')
+        if question:
+            entry = answer_store.get(question, current_database())
+            if entry is None:
+                return jsonify({'error': 'Question is not materialized'}), 404
+            answer_store.refresh(entry)
+            return jsonify(entry.to_dict())
+        return jsonify({'refreshed': answer_store.refresh_all(current_database())})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/v0/chat', methods=['POST'])
 def chat():
@@ -292,52 +1335,213 @@ def chat():
     try:
         data = request.json
         question = data.get('question')
+        cursor_token = data.get('cursor')
         
-        if not question:
+        if not question and not cursor_token:
             return jsonify({'error': 'Question is required'}), 400
         
-        # Generar SQL
-        sql = vn.generate_sql(question=question)
+        result_format = requested_result_format(data)
+        format_error = result_format_error(result_format)
+        if format_error:
+            return jsonify({'error': format_error}), 400
         
-        # Ejecutar SQL
-        results = execute_sql(sql)
+        answer = None if cursor_token else materialized_answer(question, result_format, EXECUTION_BUDGETS['chat'])
+        if cursor_token:
+            # Página siguiente: se reutiliza el SQL del token sin volver a generarlo
+            sql, results, extra = run_generated_sql(None, result_format, EXECUTION_BUDGETS['chat'], cursor_token=cursor_token)
+            question = question or extra.pop('question', None)
+        elif answer:
+            # Pregunta materializada: resultado precalculado, sin LLM ni base de datos
+            sql, results, extra = answer
+        else:
+            # Generar SQL
+            sql = generate_sql_cached(question)
+            
+            if result_format == 'arrow':
+                format_error = result_format_error(result_format, sql)
+                if format_error:
+                    return jsonify({'error': format_error, 'question': question, 'sql': sql}), 400
+                return arrow_response(sql, {'question': question, 'sql': sql})
+            
+            # Ejecutar SQL
+            sql, results, extra = run_generated_sql(sql, result_format, EXECUTION_BUDGETS['chat'], question)
+            observe_answer(question, sql, extra)
         
         return jsonify({
             'question': question,
             'sql': sql,
-            'results': results
+            'results': results,
+            **extra
         })
+    except QueryRejected as e:
+        return jsonify({'error': str(e), 'question': question, 'sql': sql, 'plan': e.estimate}), 422
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e), 'question': question}), 503
     except Exception as e:
         return jsonify({
             'error': str(e),
             'question': question if 'question' in locals() else None
         }), 500
 
+def answer_question(question: str, result_format: str):
+    """Genera y ejecuta el SQL de una pregunta; retorna el mismo cuerpo que /api/v0/chat"""
+    sql = None
+    try:
+        answer = materialized_answer(question, result_format, EXECUTION_BUDGETS['chat'])
+        if answer:
+            sql, results, extra = answer
+            return {'question': question, 'sql': sql, 'results': results, **extra}
+        sql = generate_sql_cached(question)
+        sql, results, extra = run_generated_sql(sql, result_format, EXECUTION_BUDGETS['chat'], question)
+        observe_answer(question, sql, extra)
+        return {'question': question, 'sql': sql, 'results': results, **extra}
+    except QueryRejected as e:
+        return {'question': question, 'sql': sql, 'error': str(e), 'status': 422, 'plan': e.estimate}
+    except LLMUnavailable as e:
+        return {'question': question, 'sql': sql, 'error': str(e), 'status': 503}
+    except Exception as e:
+        return {'question': question, 'sql': sql, 'error': str(e), 'status': 500}
+
+@app.route('/api/v0/chat/batch', methods=['POST'])
+def chat_batch():
+    """Responde varias preguntas en paralelo: la latencia total es la de la más lenta"""
+    try:
+        data = request.json
+        questions = data.get('questions')
+        
+        if not isinstance(questions, list) or not questions:
+            return jsonify({'error': 'Questions array is required'}), 400
+        if len(questions) > BATCH_MAX_QUESTIONS:
+            return jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 400
+        if not all(isinstance(q, str) and q.strip() for q in questions):
+            return jsonify({'error': 'Each question must be a non-empty string'}), 400
+        
+        result_format = requested_result_format(data)
+        if result_format not in RESULT_FORMATS:
+            return jsonify({'error': f'Unsupported result format: {result_format}'}), 400
+        concurrency = batch_concurrency(data.get('concurrency'))
+        if concurrency is None:
+            return jsonify({'error': 'concurrency must be an integer'}), 400
+        
+        # Las preguntas repetidas se responden una sola vez
+        unique = list(dict.fromkeys(questions))
+        database = current_database()
+        collected = []
+        
+        def make_task(question):
+            @copy_current_request_context
+            def task():
+                # Cada hilo tiene su propio g: se restaura la base elegida y se recogen sus tiempos
+                g.database = database
+                try:
+                    return answer_question(question, result_format)
+                finally:
+                    collected.append((
+                        g.get('phase_timings', {}), g.get('request_sql', []), g.get('db_route'), g.get('query_stat_keys', [])
+                    ))
+            return task
+        
+        outcomes = batch_executor.map(
+            lambda task: task(), [make_task(q) for q in unique], concurrency=concurrency, timeout=BATCH_TIMEOUT
+        )
+        answers = {}
+        for question, (ok, value) in zip(unique, outcomes):
+            answers[question] = value if ok else answer_error(question, value)
+        
+        # Tiempos por fase: las tareas corren en paralelo, así que cuenta la más lenta
+        timings = g.setdefault('phase_timings', {})
+        for task_timings, task_sql, route, task_stats in list(collected):
+            for phase, elapsed in task_timings.items():
+                timings[phase] = max(timings.get(phase, 0.0), elapsed)
+            g.setdefault('request_sql', []).extend(task_sql)
+            g.setdefault('query_stat_keys', []).extend(task_stats)
+            g.db_route = g.get('db_route') or route
+        
+        results = [dict(answers[question], index=index) for index, question in enumerate(questions)]
+        failed = sum(1 for item in results if 'error' in item)
+        return jsonify({
+            'results': results,
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'format': result_format
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def answer_error(question: str, error: Exception):
+    """Entrada de error para una pregunta que no terminó dentro del lote"""
+    status = 504 if isinstance(error, FanOutTimeout) else 500
+    return {'question': question, 'sql': None, 'error': str(error), 'status': status}
+
 @app.route('/api/v0/ask', methods=['POST'])
 def ask():
     """Endpoint similar al de la API oficial de Vanna"""
     try:
         data = request.json
         question = data.get('question')
+        cursor_token = data.get('cursor')
         
-        if not question:
+        if not question and not cursor_token:
             return jsonify({'error': 'Question is required'}), 400
         
-        # Generar SQL
-        sql = vn.generate_sql(question=question)
+        result_format = requested_result_format(data)
+        format_error = result_format_error(result_format)
+        if format_error:
+            return jsonify({'error': format_error}), 400
         
-        # Ejecutar SQL
-        results = execute_sql(sql)
+        stream_format = requested_stream_format(data)
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return jsonify({'error': f'Unsupported stream format: {stream_format}'}), 400
+        
+        answer = None if cursor_token or stream_format else materialized_answer(question, result_format, EXECUTION_BUDGETS['ask'])
+        if cursor_token:
+            # Página siguiente: se reutiliza el SQL del token sin volver a generarlo
+            sql, results, extra = run_generated_sql(None, result_format, EXECUTION_BUDGETS['ask'], cursor_token=cursor_token)
+            question = question or extra.pop('question', None)
+        elif answer:
+            # Pregunta materializada: resultado precalculado, sin LLM ni base de datos
+            sql, results, extra = answer
+        else:
+            # Generar SQL
+            sql = generate_sql_cached(question)
+            
+            if result_format == 'arrow':
+                format_error = result_format_error(result_format, sql)
+                if format_error:
+                    return jsonify({'error': format_error, 'sql': sql}), 400
+                return arrow_response(sql, {'question': question, 'sql': sql})
+            
+            if stream_format:
+                return stream_sql(sql, stream_format, extra={
+                    'type': 'sql',
+                    'explanation': f"Generated SQL for: {question}",
+                    'sql': sql
+                })
+            
+            # Ejecutar SQL
+            sql, results, extra = run_generated_sql(sql, result_format, EXECUTION_BUDGETS['ask'], question)
+            observe_answer(question, sql, extra)
         
         # Formatear respuesta similar a Vanna
         return jsonify({
             'type': 'sql',
             'explanation': f"Generated SQL for: {question}",
             'sql': sql,
+            'format': result_format,
             'df': results['data'],
             'columns': results['columns'],
-            'row_count': results['row_count']
+            'row_count': results['row_count'],
+            'truncated': results['truncated'],
+            **extra
         })
+    except QueryRejected as e:
+        return jsonify({'error': str(e), 'sql': sql, 'plan': e.estimate}), 422
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except LLMUnavailable as e:
+        return jsonify({'error': str(e), 'question': question}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -345,44 +1549,55 @@ def ask():
 def update_schema():
     """Actualiza el esquema automáticamente"""
     try:
-        # Obtener todas las tablas y sus DDL
-        conn = get_connection()
-        cursor = conn.cursor()
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode') or request.args.get('mode', 'incremental')
+        dry_run = bool(data.get('dry_run')) or request.args.get('dry_run', 'false').lower() == 'true'
+        if mode not in UPDATE_MODES:
+            return jsonify({'error': f'Unsupported mode: {mode}'}), 400
         
-        cursor.execute("""
-            SELECT table_name 
-            FROM information_schema.tables 
-            WHERE table_schema = 'public'
-            ORDER BY table_name;
-        """)
-        tables = [row[0] for row in cursor.fetchall()]
-        
-        # Generar DDL para cada tabla
-        for table in tables:
-            cursor.execute(f"""
-                SELECT column_name, data_type, is_nullable
-                FROM information_schema.columns
-                WHERE table_name = '{table}' AND table_schema = 'public'
-                ORDER BY ordinal_position;
-            """)
-            columns = cursor.fetchall()
-            
-            # Crear DDL simple
-            ddl = f"CREATE TABLE {table} (\n"
-            ddl += ",\n".join([f"    {col[0]} {col[1]} {'NULL' if col[2] == 'YES' else 'NOT NULL'}" 
-                              for col in columns])
-            ddl += "\n);"
-            
-            # Entrenar con el DDL
-            vn.train(ddl=ddl)
+        # Obtener todas las tablas y sus DDL desde la foto del esquema
+        snapshot = get_schema_cache().get(get_connection, return_connection, force=True)
+        tables = list(snapshot.tables)
         
-        cursor.close()
-        return_connection(conn)
+        # Comparar los hashes de DDL con lo ya entrenado
+        schema_training_state = get_schema_training_state()
+        trained = schema_training_state.load()
+        existing = {}
+        if mode == 'incremental' and not trained:
+            try:
+                existing = existing_ddl_ids(vn.get_training_data())
+            except Exception:
+                existing = {}
+        plan, ddls = plan_schema_update(snapshot, trained, existing, mode)
+        
+        errors = []
+        if not dry_run:
+            # Entrenar solo las tablas nuevas o modificadas y eliminar las borradas
+            state, errors = apply_schema_update(vn, plan, ddls, trained, existing)
+            schema_training_state.save(state)
+            if plan['added'] or plan['changed'] or plan['removed']:
+                training_data_changed()
         
+        trained_tables = plan['added'] + plan['changed']
         return jsonify({
-            'success': True,
-            'message': f'Schema updated for {len(tables)} tables',
-            'tables': tables
+            'success': not errors,
+            'message': f"Schema {'diff' if dry_run else 'updated'}: {len(plan['added'])} added, "
+                       f"{len(plan['changed'])} changed, {len(plan['removed'])} removed, "
+                       f"{len(plan['unchanged']) + len(plan['adopted'])} unchanged",
+            'tables': tables,
+            'mode': mode,
+            'dry_run': dry_run,
+            'diff': {
+                'added': plan['added'],
+                'changed': plan['changed'],
+                'removed': plan['removed'],
+                'unchanged': len(plan['unchanged']),
+                'adopted': plan['adopted']
+            },
+            'trained': [] if dry_run else [t for t in trained_tables if t not in {e['table'] for e in errors}],
+            'errors': errors,
+            'schema_version': snapshot.version,
+            'fingerprint': snapshot.fingerprint
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -674,36 +1889,23 @@ if __name__ == '__main__':
     print(f"📊 BASE DE DATOS: {DB_CONFIG['database']}")
     print(f"🔗 HOST: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
     print(f"👤 USUARIO: {DB_CONFIG['user']}")
-    print(f"🤖 MODELO AI: Gemini 1.5 Flash")
+    print(f"🤖 MODELO AI: {LLM_MODEL} (backend: {LLM_BACKEND})")
     print(f"🔑 API KEY: {'✓ CONFIGURADA' if GEMINI_API_KEY else '✗ NO CONFIGURADA'}")
     print("=" * 70)
     
-    # Probar conexión inicial
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT version()')
-        version = cursor.fetchone()[0]
-        cursor.execute('SELECT current_database()')
-        db_name = cursor.fetchone()[0]
-        cursor.close()
-        return_connection(conn)
-        print(f"✅ POSTGRESQL CONECTADO: {db_name}")
-        print(f"📋 VERSIÓN: {version.split(',')[0]}")
-    except Exception as e:
-        print(f"❌ ERROR DE CONEXIÓN A POSTGRESQL: {e}")
-        print("   Verifica:")
-        print("   1. Que PostgreSQL esté corriendo")
-        print("   2. Que las credenciales en .env sean correctas")
-        print("   3. Que la base de datos exista")
+    # Vanna, el pool y la prueba de conexión se preparan en segundo plano (estado en GET /ready)
+    create_app()
+    print("⏳ CALENTAMIENTO EN SEGUNDO PLANO: consulta GET /ready")
     
     print(f"🌐 SERVIDOR: http://localhost:8080")
     print(f"📚 API DOCS: http://localhost:8080")
     print("=" * 70)
     print("📝 Endpoints principales:")
+    print("   GET  /health, /ready         - Liveness y readiness")
     print("   GET  /api/v0/health          - Verificar estado")
     print("   GET  /api/v0/generate_sql    - Generar SQL")
     print("   POST /api/v0/chat            - Chat completo")
+    print("   POST /api/v0/chat/batch      - Varias preguntas en paralelo")
     print("   GET  /api/v0/get_schema      - Obtener esquema")
     print("   POST /api/v0/update_schema   - Actualizar esquema")
     print("=" * 70)
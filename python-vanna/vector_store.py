@@ -0,0 +1,427 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+import numpy as np
+import pandas as pd
+
+KINDS = ('sql', 'ddl', 'documentation')
+ID_SUFFIXES = {'sql': '-sql', 'ddl': '-ddl', 'documentation': '-doc'}
+TRAINING_TYPES = {'question_sql': 'sql', 'ddl': 'ddl', 'documentation': 'documentation'}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def deterministic_id(kind, *parts):
+    """Id estable por contenido: volver a entrenar lo mismo no duplica entradas"""
+    digest = hashlib.sha256('\x00'.join(parts).encode('utf-8')).digest()
+    return f'{uuid.UUID(bytes=digest[:16])}{ID_SUFFIXES[kind]}'
+
+
+class HashingEmbedder:
+    """Embeddings sin red ni modelos: palabras y trigramas de caracteres proyectados por hashing"""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def __call__(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                features = [token]
+                padded = f'#{token}#'
+                features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+                for feature in features:
+                    h = zlib.crc32(feature.encode('utf-8'))
+                    matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Embeddings con un modelo local de sentence-transformers (dependencia opcional)"""
+
+    def __init__(self, model_name):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError('VECTOR_EMBEDDING_MODEL requires the sentence-transformers package')
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = f'st-{model_name}'
+
+    def __call__(self, texts):
+        return _normalize(np.asarray(self._model.encode(list(texts)), dtype=np.float32))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class _IVFIndex:
+    """Índice IVF: centroides k-means y listas invertidas (formato CSR) sobre las primeras n filas"""
+
+    def __init__(self, centroids, order, offsets, size):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.size = size
+
+    @classmethod
+    def build(cls, vectors, iterations=8, sample_size=50000, seed=0):
+        size = len(vectors)
+        if not size:
+            raise ValueError('Cannot build an IVF index without vectors')
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(size, min(size, sample_size), replace=False))])
+        # Cada centroide parte de un vector distinto de la muestra: nunca más listas que vectores
+        nlist = int(min(4096, max(16, np.sqrt(size)), len(sample)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for index in range(nlist):
+                members = sample[assignment == index]
+                if len(members):
+                    centroids[index] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assignment = np.empty(size, dtype=np.int32)
+        for start in range(0, size, 20000):
+            chunk = np.asarray(vectors[start:start + 20000])
+            assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable').astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+        return cls(centroids, order, offsets, size)
+
+    def assign(self, vectors):
+        """Lista invertida más cercana para cada vector"""
+        return np.argmax(np.asarray(vectors) @ self.centroids.T, axis=1).astype(np.int32)
+
+    def probe(self, query, nprobe):
+        """Listas a explorar y filas indexadas que contienen"""
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return probes, np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, centroids=self.centroids, order=self.order, offsets=self.offsets,
+                 size=np.array([self.size]))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['order'], data['offsets'], int(data['size'][0]))
+
+
+class _Collection:
+    """Vectores de un tipo de entrenamiento: archivo float32 mapeado en memoria más índice IVF"""
+
+    def __init__(self, directory, kind, dim, count, alive, ivf_min_size):
+        self.kind = kind
+        self.dim = dim
+        self.vector_path = os.path.join(directory, f'{kind}.f32')
+        self.index_path = os.path.join(directory, f'{kind}.ivf.npz')
+        self.count = count
+        self.alive = alive
+        self.ivf_min_size = ivf_min_size
+        self.vectors = None
+        self.building = False
+        self._lock = threading.Lock()
+        self._remap(count)
+        # (índice, lista asignada a cada fila posterior a las indexadas)
+        self.state = (None, np.zeros(0, dtype=np.int32))
+        if os.path.exists(self.index_path):
+            index = _IVFIndex.load(self.index_path)
+            if index.size <= count:
+                self.state = (index, index.assign(self.vectors[index.size:count]) if count > index.size
+                              else np.zeros(0, dtype=np.int32))
+
+    @property
+    def index(self):
+        return self.state[0]
+
+    def _remap(self, count):
+        self.vectors = (
+            np.memmap(self.vector_path, dtype=np.float32, mode='r', shape=(count, self.dim))
+            if count else np.zeros((0, self.dim), dtype=np.float32)
+        )
+
+    def append(self, matrix):
+        """Escribe los vectores a partir de la última fila confirmada; retorna la primera fila"""
+        first = self.count
+        mode = 'r+b' if os.path.exists(self.vector_path) else 'w+b'
+        with open(self.vector_path, mode) as f:
+            f.seek(first * self.dim * 4)
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+            f.truncate()
+        count = first + len(matrix)
+        # count se publica al final: una búsqueda concurrente nunca ve filas sin vector o sin máscara
+        if len(self.alive) < count:
+            grown = np.zeros(max(count, len(self.alive) * 2), dtype=bool)
+            grown[:len(self.alive)] = self.alive
+            self.alive = grown
+        self.alive[first:count] = True
+        self._remap(count)
+        with self._lock:
+            # Las filas nuevas se asignan a la lista más cercana sin reentrenar los centroides
+            index, tail = self.state
+            if index is not None:
+                self.state = (index, np.concatenate([tail, index.assign(matrix)]))
+        self.count = count
+        return first
+
+    def publish(self, index):
+        """Sustituye el índice por uno recién construido y asigna las filas añadidas mientras tanto"""
+        with self._lock:
+            count = self.count
+            tail = index.assign(self.vectors[index.size:count]) if count > index.size else np.zeros(0, dtype=np.int32)
+            self.state = (index, tail)
+
+    def needs_rebuild(self):
+        indexed = self.index.size if self.index else 0
+        return (not self.building and self.count > indexed and self.count >= self.ivf_min_size
+                and self.count - indexed >= max(indexed, self.ivf_min_size))
+
+    def search(self, query, k, nprobe):
+        """Filas más similares: IVF sobre la parte indexada y búsqueda exacta sobre las filas nuevas"""
+        count = self.count
+        vectors, alive, (index, tail) = self.vectors, self.alive, self.state
+        if not count:
+            return []
+        if index is None:
+            rows = np.arange(count, dtype=np.int64)
+        else:
+            probes, rows = index.probe(query, nprobe)
+            tail_rows = index.size + np.flatnonzero(np.isin(tail[:count - index.size], probes))
+            rows = np.concatenate([rows.astype(np.int64), tail_rows,
+                                   np.arange(index.size + len(tail), count, dtype=np.int64)])
+        rows = np.sort(rows[alive[rows]])
+        if not len(rows):
+            return []
+        scores = np.asarray(vectors[rows]) @ query
+        top = min(k, len(rows))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+
+class LocalVectorStore:
+    """Almacén vectorial local y persistente para Vanna (sustituye al almacén remoto)
+
+    Los metadatos viven en SQLite y los vectores en un archivo float32 por tipo que se lee con
+    np.memmap; la búsqueda usa un índice IVF que se reconstruye en segundo plano cada vez que
+    el número de entradas se duplica.
+    """
+
+    def __init__(self, path, embedder=None, n_results_sql=10, n_results_ddl=10,
+                 n_results_documentation=10, nprobe=8, ivf_min_size=5000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.n_results_sql = n_results_sql
+        self.n_results_ddl = n_results_ddl
+        self.n_results_documentation = n_results_documentation
+        self.nprobe = nprobe
+        self._write_lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'store.sqlite3'), check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries (id TEXT PRIMARY KEY, kind TEXT NOT NULL, '
+                '"row" INTEGER NOT NULL, question TEXT, content TEXT NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, '
+                'created_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE UNIQUE INDEX IF NOT EXISTS entries_kind_row ON entries (kind, "row")')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            stored = dict(self._db.execute('SELECT key, value FROM meta').fetchall())
+            if stored and stored.get('embedder') != self.embedder.name:
+                raise ValueError(
+                    f"Vector store at {path} was built with {stored.get('embedder')}, not {self.embedder.name}"
+                )
+            self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('embedder', self.embedder.name))
+            self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('dim', str(self.embedder.dim)))
+
+        self._collections = {}
+        for kind in KINDS:
+            with self._db_lock:
+                rows = self._db.execute(
+                    'SELECT "row", deleted FROM entries WHERE kind = ? ORDER BY "row"', (kind,)
+                ).fetchall()
+            count = rows[-1][0] + 1 if rows else 0
+            alive = np.zeros(max(count, 1024), dtype=bool)
+            for row, deleted in rows:
+                alive[row] = not deleted
+            self._collections[kind] = _Collection(path, kind, self.embedder.dim, count, alive, ivf_min_size)
+
+    # --- interfaz de almacén vectorial de Vanna ---
+
+    def generate_embedding(self, data: str, **kwargs):
+        return self.embedder([data])[0].tolist()
+
+    def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
+        return self._add([('sql', question, sql)])[0]
+
+    def add_ddl(self, ddl: str, **kwargs) -> str:
+        return self._add([('ddl', None, ddl)])[0]
+
+    def add_documentation(self, documentation: str, **kwargs) -> str:
+        return self._add([('documentation', None, documentation)])[0]
+
+    def add_training_batch(self, items):
+        """Inserta un lote [(tipo, contenido)] con un solo cálculo de embeddings y una transacción"""
+        entries = []
+        for kind, content in items:
+            if kind == 'question_sql':
+                entries.append(('sql', content['question'], content['sql']))
+            elif kind == 'ddl':
+                entries.append(('ddl', None, content['ddl']))
+            else:
+                entries.append(('documentation', None, content['documentation']))
+        return self._add(entries)
+
+    def get_similar_question_sql(self, question: str, **kwargs) -> list:
+        return [{'question': q, 'sql': content} for q, content in self._query('sql', question, self.n_results_sql)]
+
+    def get_related_ddl(self, question: str, **kwargs) -> list:
+        return [content for _, content in self._query('ddl', question, self.n_results_ddl)]
+
+    def get_related_documentation(self, question: str, **kwargs) -> list:
+        return [content for _, content in self._query('documentation', question, self.n_results_documentation)]
+
+    def get_training_data(self, limit=None, offset=0, training_data_type=None, **kwargs) -> pd.DataFrame:
+        """Entradas de entrenamiento paginadas (más recientes primero)"""
+        sql = 'SELECT id, kind, question, content FROM entries WHERE deleted = 0'
+        params = []
+        if training_data_type:
+            sql += ' AND kind = ?'
+            params.append(TRAINING_TYPES.get(training_data_type, training_data_type))
+        sql += ' ORDER BY created_at DESC, id LIMIT ? OFFSET ?'
+        params += [-1 if limit is None else int(limit), int(offset or 0)]
+        with self._db_lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return pd.DataFrame(
+            [{'id': id, 'question': question, 'content': content, 'training_data_type': kind}
+             for id, kind, question, content in rows],
+            columns=['id', 'question', 'content', 'training_data_type'],
+            dtype=object
+        )
+
+    def count_training_data(self, training_data_type=None) -> int:
+        sql = 'SELECT COUNT(*) FROM entries WHERE deleted = 0'
+        params = []
+        if training_data_type:
+            sql += ' AND kind = ?'
+            params.append(TRAINING_TYPES.get(training_data_type, training_data_type))
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchone()[0]
+
+    def remove_training_data(self, id: str, **kwargs) -> bool:
+        with self._write_lock:
+            with self._db_lock, self._db:
+                found = self._db.execute(
+                    'SELECT kind, "row" FROM entries WHERE id = ? AND deleted = 0', (id,)
+                ).fetchone()
+                if found is None:
+                    return False
+                self._db.execute('UPDATE entries SET deleted = 1 WHERE id = ?', (id,))
+            self._collections[found[0]].alive[found[1]] = False
+        return True
+
+    def vector_store_stats(self):
+        stats = {'path': self.path, 'embedder': self.embedder.name, 'nprobe': self.nprobe}
+        for kind, collection in self._collections.items():
+            stats[kind] = {
+                'rows': collection.count,
+                'alive': int(collection.alive[:collection.count].sum()),
+                'indexed': collection.index.size if collection.index else 0,
+                'lists': len(collection.index.centroids) if collection.index else 0
+            }
+        return stats
+
+    # --- internos ---
+
+    def _add(self, entries):
+        """Inserta entradas (tipo, pregunta, contenido) y retorna sus ids en el mismo orden"""
+        ids = [deterministic_id(kind, question or '', content) for kind, question, content in entries]
+        with self._write_lock:
+            with self._db_lock:
+                known = {
+                    row[0]: row[1] for row in self._db.execute(
+                        f'SELECT id, deleted FROM entries WHERE id IN ({",".join("?" * len(ids))})', ids
+                    ).fetchall()
+                }
+            fresh = {}
+            for id, entry in zip(ids, entries):
+                if known.get(id, 1) and id not in fresh:
+                    fresh[id] = entry
+            if not fresh:
+                return ids
+
+            vectors = self.embedder([
+                f'{question}\n{content}' if question else content for _, question, content in fresh.values()
+            ])
+            now = time.time()
+            pending = list(fresh.items())
+            records = []
+            for kind in KINDS:
+                positions = [i for i, (_, entry) in enumerate(pending) if entry[0] == kind]
+                if not positions:
+                    continue
+                # Primero los vectores: si el proceso muere antes del commit, las filas sobrantes se reescriben
+                first = self._collections[kind].append(vectors[positions])
+                for offset, position in enumerate(positions):
+                    id, (_, question, content) = pending[position]
+                    records.append((id, kind, first + offset, question, content, now))
+            with self._db_lock, self._db:
+                # Una entrada eliminada y vuelta a entrenar ocupa una fila nueva
+                self._db.executemany('DELETE FROM entries WHERE id = ? AND deleted = 1', [(r[0],) for r in records])
+                self._db.executemany(
+                    'INSERT INTO entries (id, kind, "row", question, content, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    records
+                )
+            for kind in {record[1] for record in records}:
+                if self._collections[kind].needs_rebuild():
+                    self._rebuild_async(kind)
+        return ids
+
+    def _query(self, kind, text, k):
+        collection = self._collections[kind]
+        if not k or not collection.count:
+            return []
+        hits = collection.search(self.embedder([text])[0], k, self.nprobe)
+        if not hits:
+            return []
+        with self._db_lock:
+            rows = dict(
+                (row, (question, content)) for row, question, content in self._db.execute(
+                    f'SELECT "row", question, content FROM entries WHERE kind = ? AND deleted = 0 '
+                    f'AND "row" IN ({",".join("?" * len(hits))})',
+                    [kind] + [row for row, _ in hits]
+                ).fetchall()
+            )
+        return [rows[row] for row, _ in hits if row in rows]
+
+    def _rebuild_async(self, kind):
+        collection = self._collections[kind]
+        collection.building = True
+
+        def run():
+            try:
+                vectors = collection.vectors
+                index = _IVFIndex.build(vectors)
+                index.save(collection.index_path)
+                collection.publish(index)
+            finally:
+                collection.building = False
+
+        threading.Thread(target=run, name=f'ivf-build-{kind}', daemon=True).start()